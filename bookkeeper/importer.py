@@ -0,0 +1,303 @@
+"""
+Потоковый импорт расходов из файлов CSV и выписок OFX
+
+Файл читается генераторами по одной записи, записи переводятся в объекты
+Expense и добавляются в репозиторий пачками (add_many), поэтому расход памяти
+не зависит от размера файла. Названия категорий проверяются по репозиторию
+категорий, найденные категории запоминаются.
+
+В записях, которые выдают читатели, расход - положительная сумма, а
+поступления - пустая сумма: в выписке OFX списания отрицательны, в CSV
+по умолчанию расходы положительны (с debits_negative - как в OFX).
+Записи с пустой или отрицательной суммой при импорте пропускаются.
+
+Запуск из командной строки:
+    python -m bookkeeper.importer выписка.csv --map amount=Сумма --map comment=Описание
+"""
+import argparse
+import csv
+import logging
+import re
+import sys
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Callable, Iterable, Iterator, Sequence
+
+from bookkeeper.models.category import Category
+from bookkeeper.models.expense import Expense
+from bookkeeper.repository.abstract_repository import (
+    DEFAULT_BATCH_SIZE, AbstractRepository
+)
+from bookkeeper.repository.sqlite_repository import DB_FILE, SQLiteRepository
+
+logger = logging.getLogger(__name__)
+
+# Поля Expense, которые заполняются из файла
+FIELDS = ('amount', 'category', 'expense_date', 'comment')
+
+Record = dict[str, str]
+
+
+@dataclass
+class ImportStats:
+    """
+    Счетчики импорта: прочитано записей (read), добавлено расходов
+    (imported), пропущено записей с ошибками или без суммы расхода (skipped)
+    """
+    read: int = 0
+    imported: int = 0
+    skipped: int = 0
+
+
+def _debit(amount: str) -> str:
+    """ Сумма расхода по сумме операции со знаком (списания отрицательны) """
+    amount = amount.strip()
+    return amount[1:] if amount.startswith('-') else ''
+
+
+def read_csv(file: Iterable[str],
+             mapping: dict[str, str] | None = None,
+             delimiter: str = ',',
+             debits_negative: bool = False) -> Iterator[Record]:
+    """
+    Записи файла CSV с заголовком. mapping - столбец файла для поля Expense
+    (по умолчанию столбцы называются как поля), столбцы без поля пропускаются.
+    debits_negative - расходы записаны отрицательными суммами, а
+    положительные суммы - поступления (как в OFX)
+    """
+    columns = {field: field for field in FIELDS}
+    columns.update(mapping or {})
+    for row in csv.DictReader(file, delimiter=delimiter):
+        record = {field: row[column] for field, column in columns.items()
+                  if row.get(column) is not None}
+        if debits_negative and 'amount' in record:
+            record['amount'] = _debit(record['amount'])
+        yield record
+
+
+_OFX_TAG = re.compile(r'<(/?)(\w+)>([^<]*)')
+
+
+def _ofx_date(value: str) -> str:
+    """ Дата OFX (ГГГГММДД[ЧЧММСС][.XXX][[пояс]]) в формате ISO """
+    digits = value.split('[')[0].split('.')[0]
+    return datetime.strptime(digits, '%Y%m%d%H%M%S'[:len(digits) - 2]).isoformat()
+
+
+def read_ofx(file: Iterable[str]) -> Iterator[Record]:
+    """
+    Расходы из выписки OFX (SGML или XML): списания (STMTTRN с
+    отрицательной суммой TRNAMT) с датой DTPOSTED и комментарием NAME / MEMO.
+    Поступления выдаются с пустой суммой и при импорте пропускаются
+    """
+    transaction: dict[str, str] = {}
+    inside = False
+    for line in file:
+        for match in _OFX_TAG.finditer(line):
+            closing, tag, value = match.group(1), match.group(2).upper(), match.group(3)
+            if tag == 'STMTTRN':
+                if closing and inside:
+                    yield _ofx_record(transaction)
+                inside = not closing
+                transaction = {}
+            elif inside and not closing:
+                transaction[tag] = value.strip()
+
+
+def _ofx_record(transaction: dict[str, str]) -> Record:
+    record = {'amount': _debit(transaction.get('TRNAMT', ''))}
+    if 'DTPOSTED' in transaction:
+        try:
+            record['expense_date'] = _ofx_date(transaction['DTPOSTED'])
+        except ValueError:
+            # неразбираемая дата - ошибка записи при импорте, а не чтения файла
+            record['expense_date'] = transaction['DTPOSTED']
+    comment = ' '.join(filter(None, (transaction.get('NAME'), transaction.get('MEMO'))))
+    if comment:
+        record['comment'] = comment
+    return record
+
+
+def parse_amount(value: str) -> float:
+    """
+    Сумма с пробелами, точками или запятыми между разрядами и запятой или
+    точкой перед копейками. Из двух разных разделителей копейки отделяет
+    последний. Единственный вид разделителя отделяет разряды, если он
+    встречается несколько раз или после него ровно три цифры
+    ('1,234' - 1234.0, копеек в суммах не больше двух), иначе - копейки
+    """
+    value = value.replace('\xa0', '').replace(' ', '')
+    last = max(value.rfind(','), value.rfind('.'))
+    if last < 0:
+        return float(value)
+    decimal = value[last]
+    thousands = '.' if decimal == ',' else ','
+    if thousands not in value and (value.count(decimal) > 1 or len(value) - last == 4):
+        return float(value.replace(decimal, ''))
+    return float(value.replace(thousands, '').replace(decimal, '.'))
+
+
+def parse_date(value: str, date_format: str | None = None) -> datetime:
+    """ Дата в формате date_format (по умолчанию - ISO 8601) """
+    if date_format is not None:
+        return datetime.strptime(value.strip(), date_format)
+    return datetime.fromisoformat(value.strip())
+
+
+class CategoryResolver:  # pylint: disable=too-few-public-methods
+    """
+    Поиск категорий по названию с запоминанием найденных id (pks).
+    create_missing - добавлять в репозиторий категории, которых в нем нет,
+    иначе запись с неизвестной категорией считается ошибочной
+    """
+
+    repo: AbstractRepository[Category]
+    create_missing: bool
+    pks: dict[str, int]
+
+    def __init__(self,
+                 repo: AbstractRepository[Category],
+                 create_missing: bool = False) -> None:
+        self.repo = repo
+        self.create_missing = create_missing
+        self.pks = {}
+
+    def resolve(self, name: str) -> str:
+        """ Проверить, что категория name есть, и вернуть ее название """
+        name = name.strip()
+        if name in self.pks:
+            return name
+        found = self.repo.get_all({'name': name}, fields=['pk'])
+        if found:
+            self.pks[name] = found[0].pk
+        elif self.create_missing:
+            self.pks[name] = self.repo.add(Category(name))
+        else:
+            raise ValueError(f'unknown category {name!r}')
+        return name
+
+
+def to_expense(record: Record,
+               categories: CategoryResolver,
+               default_category: str | None = None,
+               date_format: str | None = None) -> Expense:
+    """
+    Расход по записи файла. Записи без суммы, категории, с отрицательной
+    суммой (поступления) или с неразбираемыми значениями вызывают ValueError
+    """
+    if not record.get('amount'):
+        raise ValueError('no expense amount')
+    category = record.get('category') or default_category
+    if not category:
+        raise ValueError('no category')
+    amount = parse_amount(record['amount'])
+    if amount < 0:
+        raise ValueError(f'negative amount {record["amount"]!r}')
+    now = datetime.now()
+    expense_date = parse_date(record['expense_date'], date_format) \
+        if record.get('expense_date') else now
+    return Expense(amount, categories.resolve(category),
+                   expense_date, now, record.get('comment', ''))
+
+
+def import_expenses(records: Iterable[Record],
+                    expenses: AbstractRepository[Expense],
+                    categories: AbstractRepository[Category] | CategoryResolver,
+                    batch_size: int = DEFAULT_BATCH_SIZE,
+                    progress: Callable[[ImportStats], None] | None = None,
+                    default_category: str | None = None,
+                    date_format: str | None = None) -> ImportStats:
+    """
+    Добавить расходы по записям records в репозиторий expenses пачками
+    по batch_size. categories - репозиторий категорий или CategoryResolver.
+    Ошибочные записи пропускаются с предупреждением в журнале.
+    progress вызывается со счетчиками после записи каждой пачки
+    """
+    if not isinstance(categories, CategoryResolver):
+        categories = CategoryResolver(categories)
+    stats = ImportStats()
+    batch: list[Expense] = []
+
+    def flush() -> None:
+        expenses.add_many(batch)
+        stats.imported += len(batch)
+        batch.clear()
+        if progress is not None:
+            progress(stats)
+
+    for record in records:
+        stats.read += 1
+        try:
+            batch.append(to_expense(record, categories, default_category, date_format))
+        except ValueError as error:
+            stats.skipped += 1
+            logger.warning('record %d skipped: %s', stats.read, error)
+            continue
+        if len(batch) >= batch_size:
+            flush()
+    if batch:
+        flush()
+    return stats
+
+
+def _mapping(items: Sequence[str]) -> dict[str, str]:
+    mapping = {}
+    for item in items:
+        field, sep, column = item.partition('=')
+        if not sep or field not in FIELDS:
+            raise argparse.ArgumentTypeError(f'bad column mapping {item!r}')
+        mapping[field] = column
+    return mapping
+
+
+def main(argv: Sequence[str] | None = None) -> int:
+    """ Импорт из командной строки, возвращает код завершения """
+    parser = argparse.ArgumentParser(prog='python -m bookkeeper.importer',
+                                     description='Импорт расходов из CSV или OFX')
+    parser.add_argument('file', help='файл CSV или выписка OFX')
+    parser.add_argument('--format', choices=('csv', 'ofx'),
+                        help='формат файла (по умолчанию - по расширению)')
+    parser.add_argument('--db', default=DB_FILE, help='файл базы данных')
+    parser.add_argument('--map', action='append', default=[], metavar='FIELD=COLUMN',
+                        help='столбец CSV для поля расхода')
+    parser.add_argument('--delimiter', default=',', help='разделитель столбцов CSV')
+    parser.add_argument('--debits-negative', action='store_true',
+                        help='расходы в CSV - отрицательные суммы (как в OFX)')
+    parser.add_argument('--encoding', default='utf-8', help='кодировка файла')
+    parser.add_argument('--date-format', help='формат даты (strptime), по умолчанию ISO')
+    parser.add_argument('--category', help='категория для записей без категории')
+    parser.add_argument('--create-categories', action='store_true',
+                        help='добавлять неизвестные категории')
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+                        help='число расходов в одной записи в базу данных')
+    args = parser.parse_args(argv)
+    try:
+        mapping = _mapping(args.map)
+    except argparse.ArgumentTypeError as error:
+        parser.error(str(error))
+    file_format = args.format or ('ofx' if args.file.lower().endswith(('.ofx', '.qfx'))
+                                  else 'csv')
+    logging.basicConfig(format='%(levelname)s: %(message)s')
+
+    def report(stats: ImportStats) -> None:
+        print(f'\rread {stats.read}, imported {stats.imported}, '
+              f'skipped {stats.skipped}', end='', file=sys.stderr)
+
+    repositories = SQLiteRepository.repository_factory([Category, Expense], args.db)
+    try:
+        with open(args.file, encoding=args.encoding, newline='') as file:
+            records = read_ofx(file) if file_format == 'ofx' \
+                else read_csv(file, mapping, args.delimiter, args.debits_negative)
+            stats = import_expenses(
+                records, repositories[Expense],
+                CategoryResolver(repositories[Category], args.create_categories),
+                args.batch_size, report, args.category, args.date_format)
+    finally:
+        print(file=sys.stderr)
+        for repo in repositories.values():
+            repo.close()
+    return 0 if stats.skipped == 0 else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -100,6 +100,8 @@ class Category:
         со стороны СУБД, результат, возможно, будет корректным, если исходные
         данные корректны за исключением сортировки. Если нет, то нет.
         "Мусор на входе, мусор на выходе".
+        Категории сохраняются пачками (add_many): пачка записывается,
+        когда очередной категории нужен id еще не сохраненного родителя.
 
         Parameters
         ----------
@@ -111,8 +113,14 @@ class Category:
         Список созданных объектов Category
         """
         created: dict[str, Category] = {}
+        pending: list[Category] = []
         for child, parent in tree:
+            if pending and parent is not None and created[parent].pk == 0:
+                # родитель еще не сохранен - сохраняем накопленную пачку
+                repo.add_many(pending)
+                pending = []
             cat = cls(child, created[parent].pk if parent is not None else None)
-            repo.add(cat)
+            pending.append(cat)
             created[child] = cat
+        repo.add_many(pending)
         return list(created.values())
@@ -0,0 +1,28 @@
+"""
+Описан класс, представляющий сводку свернутых расходов за период
+"""
+
+from dataclasses import dataclass
+from datetime import datetime
+
+
+@dataclass
+class ExpenseSummary:
+    """
+    Сводка расходов одной категории за период (см. RollupRepository).
+    period - начало периода (дня или месяца)
+    category - категория расходов
+    amount - сумма расходов
+    count - число расходов с заполненной суммой
+    rows - число расходов
+    min_amount, max_amount - наименьший и наибольший расход
+    pk - id записи в базе данных
+    """
+    period: datetime
+    category: str
+    amount: float | None = None
+    count: int = 0
+    rows: int = 0
+    min_amount: float | None = None
+    max_amount: float | None = None
+    pk: int = 0
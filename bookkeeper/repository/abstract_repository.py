@@ -8,7 +8,15 @@
 """
 
 from abc import ABC, abstractmethod
-from typing import Generic, TypeVar, Protocol, Any
+from collections import namedtuple
+from contextlib import ExitStack, contextmanager, nullcontext
+from functools import lru_cache, partial
+from math import inf
+from operator import add
+from typing import (
+    Generic, TypeVar, Protocol, Any, Callable, ContextManager, Iterable, Iterator,
+    Sequence, overload, runtime_checkable
+)
 
 
 class Model(Protocol):  # pylint: disable=too-few-public-methods
@@ -19,6 +27,143 @@ class Model(Protocol):  # pylint: disable=too-few-public-methods
 
 
 T = TypeVar('T', bound=Model)
+T_contra = TypeVar('T_contra', bound=Model, contravariant=True)
+
+DEFAULT_BATCH_SIZE = 500
+DEFAULT_SEARCH_LIMIT = 50
+
+
+def order_key(obj: Any, order_by: str) -> tuple[tuple[bool, Any], int]:
+    """
+    Ключ сортировки объекта по полю order_by с pk для разрешения равенства.
+    Значения None идут первыми, как в sqlite
+    """
+    value = getattr(obj, order_by)
+    return (value is not None, value), obj.pk
+
+
+def keyset_bound(order_by: str,
+                 after: Any,
+                 after_pk: int | None,
+                 descending: bool = False) -> tuple[tuple[bool, Any], float] | None:
+    """
+    Граница keyset-пагинации в терминах order_key: записи, следующие
+    за записью со значением after поля order_by и id after_pk.
+    Если after_pk не задан, пропускаются все записи со значением after.
+    Возвращает None, если граница не задана
+    """
+    if order_by == 'pk':
+        after, after_pk = (after_pk if after_pk is not None else after), None
+        if after is None:
+            return None
+    elif after is None and after_pk is None:
+        return None
+    pk_bound: float = after_pk if after_pk is not None else (-inf if descending else inf)
+    return (after is not None, after), pk_bound
+
+
+def sort_after(objs: Iterable[T],
+               order_by: str,
+               after: Any = None,
+               after_pk: int | None = None,
+               descending: bool = False) -> Iterator[T]:
+    """
+    Упорядочить объекты по полю order_by (затем по pk) и перебрать те,
+    что следуют за записью (after, after_pk), см. AbstractRepository.iter_all
+    """
+    bound = keyset_bound(order_by, after, after_pk, descending)
+    for obj in sorted(objs, key=lambda obj: order_key(obj, order_by),
+                      reverse=descending):
+        key = order_key(obj, order_by)
+        if bound is None or (key < bound if descending else key > bound):
+            yield obj
+
+
+# Агрегатные функции: шаг накопления по очередному значению (не None)
+AGGREGATES: dict[str, Callable[[Any, Any], Any]] = {
+    'sum': add,
+    'avg': add,
+    'min': min,
+    'max': max,
+    'count': lambda acc, value: acc,
+}
+
+
+def _aggregate_result(func: str, acc: Any, count: int) -> Any:
+    if func == 'count':
+        return count
+    if func == 'avg' and acc is not None:
+        return acc / count
+    return acc
+
+
+def aggregate_objects(objs: Iterable[Any],
+                      func: str,
+                      field: str,
+                      group_by: str | None = None) -> Any:
+    """
+    Вычислить агрегат за один проход по объектам (см. AbstractRepository.aggregate)
+    """
+    if func not in AGGREGATES:
+        raise ValueError(f'unknown aggregate function {func!r}')
+    step = AGGREGATES[func]
+    states: dict[Any, list[Any]] = {}
+    for obj in objs:
+        state = states.setdefault(
+            getattr(obj, group_by) if group_by is not None else None, [None, 0])
+        value = getattr(obj, field)
+        if value is not None:
+            state[0] = value if state[1] == 0 else step(state[0], value)
+            state[1] += 1
+    results = {key: _aggregate_result(func, acc, count)
+               for key, (acc, count) in states.items()}
+    if group_by is None:
+        return results.get(None, _aggregate_result(func, None, 0))
+    return results
+
+
+def merge_partial(acc: list[Any], values: Sequence[Any]) -> None:
+    """
+    Добавить к накопленным частичным агрегатам [сумма, число, минимум, максимум]
+    частичные агрегаты values другой части данных (шарда, архива и т.п.).
+    None в values означает, что этот агрегат для части не вычислялся
+    """
+    total, count, low, high = values
+    if not count:
+        return
+    acc[1] += count
+    if total is not None:
+        acc[0] = total if acc[0] is None else acc[0] + total
+    if low is not None:
+        acc[2] = low if acc[2] is None else min(acc[2], low)
+    if high is not None:
+        acc[3] = high if acc[3] is None else max(acc[3], high)
+
+
+def partial_result(func: str, acc: Sequence[Any]) -> Any:
+    """ Значение агрегата func по накопленным частичным агрегатам """
+    total, count, low, high = acc
+    if func == 'count':
+        return count
+    if count == 0:
+        return None
+    return {'sum': total, 'avg': total / count, 'min': low, 'max': high}[func]
+
+
+@lru_cache(maxsize=256)
+def row_type(fields: tuple[str, ...]) -> Any:
+    """
+    Тип строки-проекции (namedtuple) с полями fields, один на набор полей
+    """
+    return namedtuple('Row', fields)
+
+
+def project(objs: Iterable[Any], fields: Sequence[str]) -> list[Any]:
+    """
+    Проекция объектов на поля fields: список строк row_type(fields)
+    """
+    row_cls = row_type(tuple(fields))
+    return [row_cls._make([getattr(obj, field) for field in fields]) for obj in objs]
 
 
 class AbstractRepository(ABC, Generic[T]):
@@ -30,6 +175,19 @@ class AbstractRepository(ABC, Generic[T]):
     get_all
     update
     delete
+    Пакетные методы (по умолчанию выражены через одиночные):
+    add_many
+    update_many
+    delete_many
+    Необязательные возможности реализуются отдельно и проверяются isinstance:
+    put_many (SupportsPutMany)
+    search (Searchable)
+    Потоковое чтение (по умолчанию выражено через get_all):
+    iter_all
+    Агрегация (по умолчанию вычисляется по результату get_all):
+    aggregate
+    Транзакции (по умолчанию не поддерживаются, блок выполняется как есть):
+    transaction
     """
 
     @abstractmethod
@@ -43,12 +201,23 @@ class AbstractRepository(ABC, Generic[T]):
     def get(self, pk: int) -> T | None:
         """ Получить объект по id """
 
+    @overload
+    def get_all(self, where: dict[str, Any] | None = None) -> list[T]: ...
+
+    @overload
+    def get_all(self, where: dict[str, Any] | None = None, *,
+                fields: Sequence[str] | None) -> list[Any]: ...
+
     @abstractmethod
-    def get_all(self, where: dict[str, Any] | None = None) -> list[T]:
+    def get_all(self,
+                where: dict[str, Any] | None = None,
+                fields: Sequence[str] | None = None) -> list[Any]:
         """
         Получить все записи по некоторому условию
         where - условие в виде словаря {'название_поля': значение}
         если условие не задано (по умолчанию), вернуть все записи
+        fields - вернуть вместо объектов строки (namedtuple, см. row_type)
+        только с перечисленными полями
         """
 
     @abstractmethod
@@ -58,3 +227,126 @@ class AbstractRepository(ABC, Generic[T]):
     @abstractmethod
     def delete(self, pk: int) -> None:
         """ Удалить запись """
+
+    def add_many(self, objs: Iterable[T]) -> list[int]:
+        """
+        Добавить несколько объектов, вернуть список их id,
+        также записать id в атрибут pk каждого объекта.
+        """
+        return [self.add(obj) for obj in objs]
+
+    def update_many(self, objs: Iterable[T]) -> None:
+        """ Обновить данные о нескольких объектах. """
+        for obj in objs:
+            self.update(obj)
+
+    def delete_many(self, pks: Iterable[int]) -> None:
+        """ Удалить несколько записей """
+        for pk in pks:
+            self.delete(pk)
+
+    def iter_all(self,
+                 where: dict[str, Any] | None = None,
+                 order_by: str = 'pk',
+                 batch_size: int = DEFAULT_BATCH_SIZE,
+                 after: Any = None,
+                 after_pk: int | None = None,
+                 descending: bool = False) -> Iterator[T]:
+        """
+        Перебрать записи по условию where в порядке поля order_by
+        (при равных значениях - в порядке pk).
+        batch_size - размер пачки, которой записи читаются из хранилища
+        after, after_pk - значение order_by и id последней полученной записи,
+        перебор продолжается со следующей за ней (keyset-пагинация);
+        при order_by='pk' достаточно after_pk
+        descending - перебирать в обратном порядке
+        Реализация по умолчанию сортирует результат get_all.
+        """
+        yield from sort_after(self.get_all(where), order_by, after, after_pk, descending)
+
+    def aggregate(self,
+                  func: str,
+                  field: str = 'pk',
+                  where: dict[str, Any] | None = None,
+                  group_by: str | None = None) -> Any:
+        """
+        Вычислить агрегат func ('sum', 'count', 'min', 'max', 'avg') значений
+        поля field записей, удовлетворяющих условию where. Значения None
+        пропускаются, агрегат пустого набора - None (для 'count' - 0).
+        group_by - поле группировки; если задано, возвращается словарь
+        {значение поля group_by: агрегат группы}
+        """
+        return aggregate_objects(self.get_all(where), func, field, group_by)
+
+    def transaction(self) -> ContextManager[Any]:
+        """
+        Контекст транзакции: изменения внутри блока with фиксируются
+        вместе при выходе из него. Реализация по умолчанию ничего не делает
+        """
+        return nullcontext()
+
+
+@runtime_checkable
+class SupportsPutMany(Protocol[T_contra]):  # pylint: disable=too-few-public-methods
+    """
+    Необязательная возможность репозитория - запись объектов с уже
+    назначенными id (нужна, например, BufferedRepository).
+    Проверяется isinstance(repo, SupportsPutMany)
+    """
+
+    def put_many(self, objs: Iterable[T_contra]) -> None:
+        """
+        Записать объекты с уже назначенными id: добавить отсутствующие
+        и заменить существующие. Следующие id, выдаваемые add,
+        должны быть больше записанных
+        """
+
+
+@runtime_checkable
+class Searchable(Protocol):  # pylint: disable=too-few-public-methods
+    """
+    Необязательная возможность репозитория - полнотекстовый поиск
+    (MemoryRepository и SQLiteRepository с text_fields: без них у
+    репозитория нет метода search).
+    Проверяется isinstance(repo, Searchable)
+    """
+
+    def search(self, query: str, limit: int = DEFAULT_SEARCH_LIMIT) -> list[int]:
+        """
+        Полнотекстовый поиск по текстовым полям записей: id не более limit
+        записей, содержащих все слова query, от наиболее к наименее
+        релевантным (см. text_search)
+        """
+
+
+# Необязательные возможности репозиториев по именам методов
+OPTIONAL_CAPABILITIES: dict[str, type] = {
+    'put_many': SupportsPutMany,
+    'search': Searchable,
+}
+
+
+def bind_optional(wrapper: Any, repo: Any) -> None:
+    """
+    Дать обертке wrapper те необязательные возможности repo, которых нет
+    в классе обертки. Метод name связывается с методом обертки _name
+    (repo передается первым аргументом), а если его нет - с методом repo
+    """
+    for name, capability in OPTIONAL_CAPABILITIES.items():
+        if hasattr(type(wrapper), name) or not isinstance(repo, capability):
+            continue
+        own = getattr(wrapper, f'_{name}', None)
+        setattr(wrapper, name, getattr(repo, name) if own is None else partial(own, repo))
+
+
+@contextmanager
+def unit_of_work(*repos: AbstractRepository[Any]) -> Iterator[None]:
+    """
+    Единица работы над несколькими репозиториями: открывает транзакцию
+    каждого из них, так что их изменения фиксируются вместе при выходе
+    из блока with (для репозиториев одного файла sqlite - одной фиксацией)
+    """
+    with ExitStack() as stack:
+        for repo in repos:
+            stack.enter_context(repo.transaction())
+        yield
@@ -0,0 +1,175 @@
+"""
+Модуль описывает журнал изменений в виде файла из кадров
+
+Кадр - заголовок (длина данных и их контрольная сумма crc32) и данные.
+Файлы читаются через mmap; чтение останавливается на первом неполном или
+поврежденном кадре, так что оборванная при сбое запись в конце журнала
+отбрасывается. В журнал (AppendLog) кадры дописываются с групповой
+фиксацией: потоки, ожидающие сохранности своих записей, разделяют
+одну запись на диск и один fsync.
+"""
+import mmap
+import os
+import struct
+import threading
+import zlib
+from typing import BinaryIO, Iterable
+
+HEADER = struct.Struct('<II')
+
+
+def frame(payload: bytes) -> bytes:
+    """ Кадр с данными payload """
+    return HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+
+
+def read_frames(path: str) -> tuple[list[bytes], int]:
+    """
+    Прочитать кадры файла. Возвращает данные целых кадров и длину
+    части файла, которую они занимают (конец последнего целого кадра)
+    """
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        return [], 0
+    payloads = []
+    offset = 0
+    with open(path, 'rb') as file, \
+            mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        size = len(data)
+        while offset + HEADER.size <= size:
+            length, crc = HEADER.unpack_from(data, offset)
+            start = offset + HEADER.size
+            if start + length > size:
+                break
+            payload = data[start:start + length]
+            if zlib.crc32(payload) != crc:
+                break
+            payloads.append(payload)
+            offset = start + length
+    return payloads, offset
+
+
+def write_atomic(path: str, payloads: Iterable[bytes]) -> None:
+    """
+    Записать кадры в файл атомарно: во временный файл с fsync,
+    затем переименованием поверх path
+    """
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'wb') as file:
+        for payload in payloads:
+            file.write(frame(payload))
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(tmp_path, path)
+    _fsync_dir(path)
+
+
+def _fsync_dir(path: str) -> None:
+    if not hasattr(os, 'O_DIRECTORY'):
+        return
+    fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class AppendLog:
+    """
+    Журнал, в который дописываются кадры.
+    append ставит кадр в буфер и возвращает его номер, sync(номер) ждет,
+    пока кадр не окажется на диске. Первый поток, которому нужно
+    записать буфер, пишет его целиком вместе с кадрами других потоков.
+    fsync - вызывать ли fsync после записи (иначе данные остаются
+    в кеше ОС и переживают падение программы, но не системы)
+    """
+
+    path: str
+
+    def __init__(self, path: str, fsync: bool = True) -> None:
+        self.path = path
+        self.fsync = fsync
+        payloads, end = read_frames(path)
+        self._replayed = payloads
+        self.records = len(payloads)
+        self._file: BinaryIO = open(path, 'ab')  # pylint: disable=consider-using-with
+        if self._file.tell() != end:
+            # отбросить оборванный кадр в конце журнала
+            self._file.truncate(end)
+        self._cond = threading.Condition()
+        self._buffer: list[bytes] = []
+        self._seq = 0
+        self._durable = 0
+        self._flushing = False
+
+    def replay(self) -> list[bytes]:
+        """
+        Данные кадров, записанных в журнал до его открытия
+        (возвращаются один раз)
+        """
+        payloads, self._replayed = self._replayed, []
+        return payloads
+
+    @property
+    def seq(self) -> int:
+        """ Номер последнего добавленного кадра """
+        return self._seq
+
+    def append(self, payload: bytes) -> int:
+        """ Добавить кадр в буфер журнала, вернуть его номер """
+        with self._cond:
+            self._buffer.append(frame(payload))
+            self._seq += 1
+            self.records += 1
+            return self._seq
+
+    def sync(self, seq: int | None = None) -> None:
+        """
+        Дождаться записи на диск кадров до номера seq (по умолчанию - всех)
+        """
+        with self._cond:
+            if seq is None:
+                seq = self._seq
+            while self._durable < seq:
+                if self._flushing:
+                    self._cond.wait()
+                    continue
+                self._flush_buffer()
+
+    def _flush_buffer(self) -> None:
+        # вызывается под self._cond, запись идет без блокировки
+        data, self._buffer = b''.join(self._buffer), []
+        target = self._seq
+        self._flushing = True
+        self._cond.release()
+        try:
+            self._file.write(data)
+            self._file.flush()
+            if self.fsync:
+                os.fsync(self._file.fileno())
+        except BaseException:
+            self._cond.acquire()
+            # кадры вернутся в буфер и будут записаны при следующей попытке
+            self._buffer.insert(0, data)
+            self._flushing = False
+            self._cond.notify_all()
+            raise
+        self._cond.acquire()
+        self._flushing = False
+        self._durable = target
+        self._cond.notify_all()
+
+    def truncate(self) -> None:
+        """
+        Очистить журнал (после сохранения снимка), предварительно записав буфер
+        """
+        with self._cond:
+            self.sync()
+            self._file.truncate(0)
+            if self.fsync:
+                os.fsync(self._file.fileno())
+            self.records = 0
+
+    def close(self) -> None:
+        """ Записать буфер и закрыть файл журнала """
+        self.sync()
+        self._file.close()
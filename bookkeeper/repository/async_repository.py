@@ -0,0 +1,234 @@
+"""
+Модуль описывает асинхронный интерфейс репозитория и его реализации
+
+Асинхронный репозиторий повторяет интерфейс AbstractRepository, но его
+методы - корутины, поэтому вызывающий код (например, сервер на asyncio)
+не блокирует цикл событий на дисковых операциях.
+"""
+import asyncio
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from itertools import islice
+from types import TracebackType
+from typing import (
+    Any, AsyncIterator, Callable, Generic, Iterable, Sequence, TypeVar
+)
+
+from bookkeeper.repository.abstract_repository import (
+    DEFAULT_BATCH_SIZE, T, sort_after
+)
+from bookkeeper.repository.memory_repository import MemoryRepository
+from bookkeeper.repository.sqlite_repository import SQLiteRepository
+
+R = TypeVar('R')
+
+
+class AsyncAbstractRepository(ABC, Generic[T]):
+    """
+    Абстрактный асинхронный репозиторий (см. AbstractRepository).
+    Абстрактные методы:
+    add
+    get
+    get_all
+    update
+    delete
+    Пакетные методы (по умолчанию выражены через одиночные):
+    add_many
+    update_many
+    delete_many
+    Потоковое чтение (асинхронный итератор, по умолчанию через get_all):
+    iter_all
+    """
+
+    @abstractmethod
+    async def add(self, obj: T) -> int:
+        """
+        Добавить объект в репозиторий, вернуть id объекта,
+        также записать id в атрибут pk.
+        """
+
+    @abstractmethod
+    async def get(self, pk: int) -> T | None:
+        """ Получить объект по id """
+
+    @abstractmethod
+    async def get_all(self,
+                      where: dict[str, Any] | None = None,
+                      fields: Sequence[str] | None = None) -> list[Any]:
+        """
+        Получить все записи по некоторому условию
+        where - условие в виде словаря {'название_поля': значение}
+        fields - вернуть строки только с этими полями (см. AbstractRepository)
+        """
+
+    @abstractmethod
+    async def update(self, obj: T) -> None:
+        """ Обновить данные об объекте. Объект должен содержать поле pk. """
+
+    @abstractmethod
+    async def delete(self, pk: int) -> None:
+        """ Удалить запись """
+
+    async def add_many(self, objs: Iterable[T]) -> list[int]:
+        """ Добавить несколько объектов, вернуть список их id """
+        return [await self.add(obj) for obj in objs]
+
+    async def update_many(self, objs: Iterable[T]) -> None:
+        """ Обновить данные о нескольких объектах """
+        for obj in objs:
+            await self.update(obj)
+
+    async def delete_many(self, pks: Iterable[int]) -> None:
+        """ Удалить несколько записей """
+        for pk in pks:
+            await self.delete(pk)
+
+    async def iter_all(self,
+                       where: dict[str, Any] | None = None,
+                       order_by: str = 'pk',
+                       batch_size: int = DEFAULT_BATCH_SIZE,
+                       after: Any = None,
+                       after_pk: int | None = None,
+                       descending: bool = False) -> AsyncIterator[T]:
+        """
+        Асинхронно перебрать записи (параметры - см. AbstractRepository.iter_all).
+        Реализация по умолчанию сортирует результат get_all
+        """
+        for obj in sort_after(await self.get_all(where),
+                              order_by, after, after_pk, descending):
+            yield obj
+
+
+class AsyncMemoryRepository(AsyncAbstractRepository[T]):
+    """
+    Асинхронный репозиторий в оперативной памяти. Операции над словарем
+    не блокируют, поэтому выполняются прямо в цикле событий
+    """
+
+    repo: MemoryRepository[T]
+
+    def __init__(self, repo: MemoryRepository[T] | None = None) -> None:
+        self.repo = repo if repo is not None else MemoryRepository()
+
+    async def add(self, obj: T) -> int:
+        return self.repo.add(obj)
+
+    async def get(self, pk: int) -> T | None:
+        return self.repo.get(pk)
+
+    async def get_all(self,
+                      where: dict[str, Any] | None = None,
+                      fields: Sequence[str] | None = None) -> list[Any]:
+        return self.repo.get_all(where, fields=fields)
+
+    async def update(self, obj: T) -> None:
+        self.repo.update(obj)
+
+    async def delete(self, pk: int) -> None:
+        self.repo.delete(pk)
+
+    async def add_many(self, objs: Iterable[T]) -> list[int]:
+        return self.repo.add_many(objs)
+
+    async def update_many(self, objs: Iterable[T]) -> None:
+        self.repo.update_many(objs)
+
+    async def delete_many(self, pks: Iterable[int]) -> None:
+        self.repo.delete_many(pks)
+
+
+class AsyncSQLiteRepository(AsyncAbstractRepository[T]):
+    """
+    Асинхронный репозиторий поверх SQLiteRepository.
+    Операции выполняются в пуле из max_workers потоков (у каждого потока
+    свое соединение из пула соединений файла), так что любое число
+    одновременных запросов разделяет ограниченное число потоков.
+    Если репозиторий открыт в режиме WAL, запись ожидается через Future
+    фонового потока записи и потоков пула не занимает.
+    Потоковое чтение выполняется пачками с keyset-пагинацией,
+    каждая пачка - отдельным запросом.
+    """
+
+    repo: SQLiteRepository[T]
+
+    def __init__(self, repo: SQLiteRepository[T], max_workers: int = 4) -> None:
+        self.repo = repo
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix=f'sqlite-{repo.table_name}')
+
+    async def __aenter__(self) -> 'AsyncSQLiteRepository[T]':
+        return self
+
+    async def __aexit__(self,
+                        exc_type: type[BaseException] | None,
+                        exc_val: BaseException | None,
+                        exc_tb: TracebackType | None) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """
+        Дождаться выполнения начатых операций и остановить пул потоков.
+        Исходный репозиторий не закрывается
+        """
+        self._executor.shutdown(wait=True)
+
+    async def _run(self, func: Callable[..., R], *args: Any) -> R:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, partial(func, *args))
+
+    async def add(self, obj: T) -> int:
+        if self.repo.wal:
+            return await asyncio.wrap_future(self.repo.add_nowait(obj))
+        return await self._run(self.repo.add, obj)
+
+    async def get(self, pk: int) -> T | None:
+        return await self._run(self.repo.get, pk)
+
+    async def get_all(self,
+                      where: dict[str, Any] | None = None,
+                      fields: Sequence[str] | None = None) -> list[Any]:
+        return await self._run(partial(self.repo.get_all, fields=fields), where)
+
+    async def update(self, obj: T) -> None:
+        if self.repo.wal:
+            return await asyncio.wrap_future(self.repo.update_nowait(obj))
+        return await self._run(self.repo.update, obj)
+
+    async def delete(self, pk: int) -> None:
+        if self.repo.wal:
+            return await asyncio.wrap_future(self.repo.delete_nowait(pk))
+        return await self._run(self.repo.delete, pk)
+
+    async def add_many(self, objs: Iterable[T]) -> list[int]:
+        if self.repo.wal:
+            return await asyncio.wrap_future(self.repo.add_many_nowait(objs))
+        return await self._run(self.repo.add_many, list(objs))
+
+    async def update_many(self, objs: Iterable[T]) -> None:
+        return await self._run(self.repo.update_many, list(objs))
+
+    async def delete_many(self, pks: Iterable[int]) -> None:
+        return await self._run(self.repo.delete_many, list(pks))
+
+    def _page(self, where: dict[str, Any] | None, order_by: str, batch_size: int,
+              after: Any, after_pk: int | None, descending: bool) -> list[T]:
+        return list(islice(
+            self.repo.iter_all(where, order_by, batch_size, after, after_pk, descending),
+            batch_size))
+
+    async def iter_all(self,
+                       where: dict[str, Any] | None = None,
+                       order_by: str = 'pk',
+                       batch_size: int = DEFAULT_BATCH_SIZE,
+                       after: Any = None,
+                       after_pk: int | None = None,
+                       descending: bool = False) -> AsyncIterator[T]:
+        while True:
+            page = await self._run(self._page, where, order_by, batch_size,
+                                   after, after_pk, descending)
+            for obj in page:
+                yield obj
+            if len(page) < batch_size:
+                return
+            after, after_pk = getattr(page[-1], order_by), page[-1].pk
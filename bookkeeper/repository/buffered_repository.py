@@ -0,0 +1,224 @@
+"""
+Модуль описывает буферизующую обертку над репозиторием (write-behind)
+
+Добавления и обновления накапливаются в памяти, а в исходный репозиторий
+записываются пачками одной транзакцией. Id новым объектам выдаются сразу,
+из диапазона после максимального id в хранилище.
+"""
+import atexit
+import threading
+import time
+from contextlib import contextmanager
+from types import TracebackType
+from typing import Any, Iterable, Iterator, Sequence
+
+from bookkeeper.repository.abstract_repository import (
+    DEFAULT_BATCH_SIZE, DEFAULT_SEARCH_LIMIT, AbstractRepository, Searchable,
+    SupportsPutMany, T, bind_optional
+)
+
+
+class BufferedRepository(AbstractRepository[T]):
+    """
+    Репозиторий с отложенной записью поверх репозитория, поддерживающего
+    put_many (SupportsPutMany: MemoryRepository, SQLiteRepository и др.).
+    max_pending - число отложенных изменений, при котором буфер сбрасывается
+    flush_interval - время в секундах, через которое сбрасывается буфер
+    после первого отложенного изменения (None - только по размеру)
+    Буфер также сбрасывается методом flush, при закрытии и при завершении
+    программы. Изменения, попавшие в хранилище, фиксируются пачкой целиком.
+    Пока обертка открыта, добавлять записи в хранилище в обход нее нельзя:
+    id новых объектов назначаются самой оберткой.
+    Чтение get видит отложенные изменения, остальные чтения и удаление
+    сначала сбрасывают буфер.
+    Внутри transaction буфер не сбрасывается по времени, а при откате
+    изменения, сделанные в блоке, отбрасываются (см. transaction).
+    """
+
+    repo: AbstractRepository[T]
+
+    def __init__(self,
+                 repo: AbstractRepository[T],
+                 max_pending: int = DEFAULT_BATCH_SIZE,
+                 flush_interval: float | None = 1.0) -> None:
+        if not isinstance(repo, SupportsPutMany):
+            raise TypeError(f'{type(repo).__name__} does not support put_many')
+        self.repo = repo
+        self._target: SupportsPutMany[T] = repo
+        bind_optional(self, repo)
+        self.max_pending = max_pending
+        self.flush_interval = flush_interval
+        self._lock = threading.Condition(threading.RLock())
+        self._added: dict[int, T] = {}
+        self._updated: dict[int, T] = {}
+        self._deadline: float | None = None
+        self._closed = False
+        last = next(repo.iter_all(order_by='pk', batch_size=1, descending=True), None)
+        self._next_pk = last.pk + 1 if last is not None else 1
+        self._flusher: threading.Thread | None = None
+        if flush_interval is not None:
+            self._flusher = threading.Thread(
+                target=self._flush_on_time, name='buffered-flush', daemon=True)
+            self._flusher.start()
+        atexit.register(self.close)
+
+    def __enter__(self) -> 'BufferedRepository[T]':
+        return self
+
+    def __exit__(self,
+                 exc_type: type[BaseException] | None,
+                 exc_val: BaseException | None,
+                 exc_tb: TracebackType | None) -> None:
+        self.close()
+
+    @property
+    def pending(self) -> int:
+        """ Число отложенных изменений """
+        return len(self._added) + len(self._updated)
+
+    def close(self) -> None:
+        """ Сбросить буфер и остановить поток сброса по времени """
+        atexit.unregister(self.close)
+        with self._lock:
+            self._closed = True
+            self._lock.notify()
+        if self._flusher is not None:
+            self._flusher.join()
+            self._flusher = None
+        self.flush()
+
+    def _flush_on_time(self) -> None:
+        with self._lock:
+            while not self._closed:
+                if self._deadline is None:
+                    self._lock.wait()
+                    continue
+                remaining = self._deadline - time.monotonic()
+                if remaining > 0:
+                    self._lock.wait(remaining)
+                    continue
+                try:
+                    self.flush()
+                except Exception:  # pylint: disable=broad-exception-caught
+                    # изменения остались в буфере, повторим через интервал
+                    self._deadline = time.monotonic() + (self.flush_interval or 0)
+
+    def flush(self) -> None:
+        """
+        Записать отложенные изменения в исходный репозиторий одной транзакцией.
+        При ошибке изменения остаются в буфере
+        """
+        with self._lock:
+            if not self._added and not self._updated:
+                return
+            with self.repo.transaction():
+                if self._added:
+                    self._target.put_many(self._added.values())
+                if self._updated:
+                    self.repo.update_many(self._updated.values())
+            self._added.clear()
+            self._updated.clear()
+            self._deadline = None
+
+    def _queued(self) -> None:
+        if self.pending >= self.max_pending:
+            self.flush()
+        elif self._deadline is None and self.flush_interval is not None:
+            self._deadline = time.monotonic() + self.flush_interval
+            self._lock.notify()
+
+    def add(self, obj: T) -> int:
+        if getattr(obj, 'pk', None) != 0:
+            raise ValueError(f'trying to add object {obj} with filled `pk` attribute')
+        with self._lock:
+            obj.pk = self._next_pk
+            self._next_pk += 1
+            self._added[obj.pk] = obj
+            self._queued()
+        return obj.pk
+
+    def add_many(self, objs: Iterable[T]) -> list[int]:
+        batch = list(objs)
+        for obj in batch:
+            if getattr(obj, 'pk', None) != 0:
+                raise ValueError(f'trying to add object {obj} with filled `pk` attribute')
+        return [self.add(obj) for obj in batch]
+
+    def update(self, obj: T) -> None:
+        if obj.pk == 0:
+            raise ValueError('attempt to update object with unknown primary key')
+        with self._lock:
+            if obj.pk in self._added:
+                self._added[obj.pk] = obj
+            else:
+                self._updated[obj.pk] = obj
+            self._queued()
+
+    def put_many(self, objs: Iterable[T]) -> None:
+        batch = list(objs)
+        if any(obj.pk == 0 for obj in batch):
+            raise ValueError('attempt to put object with unknown primary key')
+        with self._lock:
+            for obj in batch:
+                self._updated.pop(obj.pk, None)
+                self._added[obj.pk] = obj
+                self._next_pk = max(self._next_pk, obj.pk + 1)
+            self._queued()
+
+    def get(self, pk: int) -> T | None:
+        with self._lock:
+            obj = self._added.get(pk, self._updated.get(pk))
+        return obj if obj is not None else self.repo.get(pk)
+
+    def get_all(self,
+                where: dict[str, Any] | None = None,
+                fields: Sequence[str] | None = None,
+                **kwargs: Any) -> list[Any]:
+        self.flush()
+        return self.repo.get_all(where, fields=fields, **kwargs)
+
+    def _search(self,
+                repo: Searchable,
+                query: str,
+                limit: int = DEFAULT_SEARCH_LIMIT) -> list[int]:
+        self.flush()
+        return repo.search(query, limit)
+
+    def aggregate(self,
+                  func: str,
+                  field: str = 'pk',
+                  where: dict[str, Any] | None = None,
+                  group_by: str | None = None) -> Any:
+        self.flush()
+        return self.repo.aggregate(func, field, where, group_by)
+
+    def iter_all(self, *args: Any, **kwargs: Any) -> Iterator[T]:
+        self.flush()
+        return self.repo.iter_all(*args, **kwargs)
+
+    def delete(self, pk: int) -> None:
+        self.flush()
+        self.repo.delete(pk)
+
+    def delete_many(self, pks: Iterable[int]) -> None:
+        self.flush()
+        self.repo.delete_many(pks)
+
+    @contextmanager
+    def transaction(self) -> Iterator[Any]:
+        """
+        Транзакция исходного репозитория: при успешном выходе из блока
+        отложенные изменения записываются в ее составе, на соединении
+        вызывающего потока. На время блока буфер принадлежит этому потоку
+        (изменения других потоков и сброс по времени ждут его окончания),
+        при исключении буфер возвращается к состоянию до начала блока
+        """
+        with self._lock:
+            saved = dict(self._added), dict(self._updated), self._next_pk, self._deadline
+            try:
+                with self.repo.transaction() as context:
+                    yield context
+                    self.flush()
+            except BaseException:
+                self._added, self._updated, self._next_pk, self._deadline = saved
+                raise
@@ -0,0 +1,192 @@
+"""
+Модуль описывает кеширующую обертку над репозиторием
+
+Обертка хранит LRU-кеш объектов по id и LRU-кеш результатов get_all по
+условию, так что повторные чтения не обращаются к хранилищу. Изменения,
+сделанные через обертку, сбрасывают затронутые записи кеша.
+"""
+from collections import OrderedDict
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any, Hashable, Iterable, Iterator, Sequence
+
+from bookkeeper.repository.abstract_repository import (
+    AbstractRepository, SupportsPutMany, T, bind_optional, project
+)
+from bookkeeper.repository.conditions import matches
+
+
+@dataclass
+class CacheStats:
+    """
+    Счетчики обращений к кешу: попадания (hits) и промахи (misses)
+    """
+    hits: int = 0
+    misses: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        """ Доля попаданий среди всех обращений """
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+
+def _query_key(where: dict[str, Any] | None) -> Hashable | None:
+    if where is None:
+        return ()
+    try:
+        key = frozenset(where.items())
+        hash(key)
+    except TypeError:
+        return None
+    return key
+
+
+class CachedRepository(AbstractRepository[T]):
+    """
+    Кеширующий репозиторий поверх любого AbstractRepository.
+    max_objects - размер LRU-кеша объектов по id
+    max_queries - размер LRU-кеша результатов get_all
+    Кеш корректен, пока все изменения хранилища идут через обертку.
+    Проекции get_all (fields) строятся по закешированным объектам,
+    агрегаты не кешируются и вычисляются исходным репозиторием.
+    Дополнительные аргументы get_all (например, subquery у SQLiteRepository)
+    передаются исходному репозиторию без кеширования.
+    """
+
+    repo: AbstractRepository[T]
+    object_stats: CacheStats
+    query_stats: CacheStats
+
+    def __init__(self,
+                 repo: AbstractRepository[T],
+                 max_objects: int = 1024,
+                 max_queries: int = 128) -> None:
+        self.repo = repo
+        self.max_objects = max_objects
+        self.max_queries = max_queries
+        self.object_stats = CacheStats()
+        self.query_stats = CacheStats()
+        self._objects: OrderedDict[int, T | None] = OrderedDict()
+        self._queries: OrderedDict[Hashable, tuple[dict[str, Any], list[T]]] = \
+            OrderedDict()
+        bind_optional(self, repo)
+
+    def clear(self) -> None:
+        """ Очистить кеш """
+        self._objects.clear()
+        self._queries.clear()
+
+    def _remember(self, pk: int, obj: T | None) -> None:
+        self._objects[pk] = obj
+        self._objects.move_to_end(pk)
+        if len(self._objects) > self.max_objects:
+            self._objects.popitem(last=False)
+
+    def _invalidate(self, objs: Sequence[T] = (), pks: Sequence[int] = ()) -> None:
+        """
+        Сбросить результаты запросов, которые содержат изменившиеся записи
+        или которым удовлетворяют новые значения объектов
+        """
+        changed = [*(obj.pk for obj in objs), *pks]
+        for obj in objs:
+            self._remember(obj.pk, obj)
+        for pk in pks:
+            self._objects.pop(pk, None)
+        for key, (where, result) in list(self._queries.items()):
+            result_pks = {obj.pk for obj in result}
+            if any(pk in result_pks for pk in changed) or any(
+                    all(matches(getattr(obj, attr, None), value)
+                        for attr, value in where.items())
+                    for obj in objs):
+                del self._queries[key]
+
+    def add(self, obj: T) -> int:
+        pk = self.repo.add(obj)
+        self._invalidate(objs=[obj])
+        return pk
+
+    def get(self, pk: int) -> T | None:
+        if pk in self._objects:
+            self.object_stats.hits += 1
+            self._objects.move_to_end(pk)
+            return self._objects[pk]
+        self.object_stats.misses += 1
+        obj = self.repo.get(pk)
+        self._remember(pk, obj)
+        return obj
+
+    def get_all(self,
+                where: dict[str, Any] | None = None,
+                fields: Sequence[str] | None = None,
+                **kwargs: Any) -> list[Any]:
+        key = _query_key(where) if not kwargs else None
+        if key is None:
+            return self.repo.get_all(where, fields=fields, **kwargs)
+        if fields is not None:
+            return project(self.get_all(where), fields)
+        if key in self._queries:
+            self.query_stats.hits += 1
+            self._queries.move_to_end(key)
+            return list(self._queries[key][1])
+        self.query_stats.misses += 1
+        result = self.repo.get_all(where)
+        self._queries[key] = (dict(where or {}), result)
+        if len(self._queries) > self.max_queries:
+            self._queries.popitem(last=False)
+        for obj in result:
+            self._remember(obj.pk, obj)
+        return list(result)
+
+    def update(self, obj: T) -> None:
+        self.repo.update(obj)
+        self._invalidate(objs=[obj])
+
+    def delete(self, pk: int) -> None:
+        self.repo.delete(pk)
+        self._invalidate(pks=[pk])
+
+    def add_many(self, objs: Iterable[T]) -> list[int]:
+        batch = list(objs)
+        pks = self.repo.add_many(batch)
+        self._invalidate(objs=batch)
+        return pks
+
+    def update_many(self, objs: Iterable[T]) -> None:
+        batch = list(objs)
+        self.repo.update_many(batch)
+        self._invalidate(objs=batch)
+
+    def delete_many(self, pks: Iterable[int]) -> None:
+        batch = list(pks)
+        self.repo.delete_many(batch)
+        self._invalidate(pks=batch)
+
+    def _put_many(self, repo: SupportsPutMany[T], objs: Iterable[T]) -> None:
+        batch = list(objs)
+        repo.put_many(batch)
+        self._invalidate(objs=batch)
+
+    def aggregate(self,
+                  func: str,
+                  field: str = 'pk',
+                  where: dict[str, Any] | None = None,
+                  group_by: str | None = None) -> Any:
+        return self.repo.aggregate(func, field, where, group_by)
+
+    def iter_all(self, *args: Any, **kwargs: Any) -> Iterator[T]:
+        """ Потоковое чтение не кешируется и идет напрямую в репозиторий """
+        return self.repo.iter_all(*args, **kwargs)
+
+    @contextmanager
+    def transaction(self) -> Iterator[Any]:
+        """
+        Транзакция исходного репозитория. При откате кеш очищается,
+        так как в нем могли остаться неподтвержденные изменения
+        """
+        try:
+            with self.repo.transaction() as context:
+                yield context
+        except BaseException:
+            self.clear()
+            raise
@@ -0,0 +1,445 @@
+"""
+Модуль описывает колоночный репозиторий расходов в оперативной памяти
+
+Вместо объектов Expense репозиторий хранит по плотному массиву (array) на
+каждое поле: id - целыми числами, суммы и даты - числами с плавающей точкой
+(даты - секундами от EPOCH, пустые значения - NaN), категории и комментарии -
+номерами значений в пулах, где каждое различное значение хранится один раз.
+Условие where переводится в байтовую маску строк проходами встроенных
+функций (map, bytes.translate, itertools.compress) по массивам, агрегаты
+считаются по отобранным значениям без создания объектов. Для числовых
+столбцов ведутся минимум и максимум каждого блока строк (zone map), так что
+условия на диапазон проверяются поэлементно только в блоках на его границе.
+"""
+from array import array
+from datetime import timedelta, timezone
+from itertools import compress, repeat
+from math import inf, isnan, nan
+from operator import ge, gt, le, lt
+from typing import Any, Callable, Iterable, Iterator, Sequence
+
+from bookkeeper.models.expense import Expense
+from bookkeeper.repository.abstract_repository import (
+    AGGREGATES, AbstractRepository, row_type
+)
+from bookkeeper.repository.conditions import Between, Condition, Ge, Gt, Le, Lt
+from bookkeeper.repository.sqlite_schema import EPOCH
+
+_SECOND = timedelta(seconds=1)
+
+NUMBER_FIELDS = ('amount', 'expense_date', 'added_date')
+DATE_FIELDS = ('expense_date', 'added_date')
+POOLED_FIELDS = ('category', 'comment')
+
+# Число строк в блоке zone map
+BLOCK_SIZE = 4096
+_ONES = b'\x01' * BLOCK_SIZE
+_ZEROS = bytes(BLOCK_SIZE)
+
+# Наибольший номер значения пула для типа столбца номеров
+_MAX_CODE = {'B': 0xFF, 'H': 0xFFFF, 'I': 0xFFFFFFFF}
+
+
+def encode_number(field: str, value: Any) -> float:
+    """ Значение поля field в виде числа для столбца (даты - в секундах) """
+    if value is None:
+        return nan
+    if field not in DATE_FIELDS:
+        return float(value)
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return float((value - EPOCH) / _SECOND)
+
+
+def decode_number(field: str, value: float) -> Any:
+    """ Значение поля field по числу из столбца """
+    if isnan(value):
+        return None
+    if field in DATE_FIELDS:
+        return EPOCH + timedelta(seconds=value)
+    return value
+
+
+def interval(expected: Any) -> tuple[Callable[[Any, Any], bool], Any,
+                                     Callable[[Any, Any], bool], Any]:
+    """
+    Условие where на поле в виде интервала: (сравнение с нижней границей,
+    нижняя граница, сравнение с верхней границей, верхняя граница);
+    отсутствующая граница - None
+    """
+    if not isinstance(expected, Condition):
+        return ge, expected, le, expected
+    if isinstance(expected, Between):
+        return ge, expected.low, le, expected.high
+    if isinstance(expected, (Gt, Ge)):
+        return (gt if isinstance(expected, Gt) else ge), expected.bound, le, None
+    if isinstance(expected, (Lt, Le)):
+        return ge, None, (lt if isinstance(expected, Lt) else le), expected.bound
+    raise TypeError(f'unsupported condition {expected!r}')
+
+
+def mask_and(first: bytes | None, second: bytes) -> bytes:
+    """ Пересечение байтовых масок (None - все строки) """
+    if first is None:
+        return second
+    return (int.from_bytes(first, 'little') & int.from_bytes(second, 'little')) \
+        .to_bytes(len(second), 'little')
+
+
+class ValuePool:
+    """
+    Пул значений поля (словарное кодирование): каждое различное значение
+    хранится один раз, а столбец - номера значений в пуле.
+    Значения из пула не удаляются
+    """
+
+    def __init__(self) -> None:
+        self.values: list[Any] = []
+        self._ids: dict[Any, int] = {}
+
+    def intern(self, value: Any) -> int:
+        """ Номер значения в пуле (значение добавляется, если его нет) """
+        pid = self._ids.get(value)
+        if pid is None:
+            pid = self._ids[value] = len(self.values)
+            self.values.append(value)
+        return pid
+
+    def matching(self, expected: Any) -> set[int]:
+        """ Номера значений, удовлетворяющих условию where на поле """
+        if not isinstance(expected, Condition):
+            pid = self._ids.get(expected)
+            return set() if pid is None else {pid}
+        return {pid for pid, value in enumerate(self.values) if expected.match(value)}
+
+
+class ZoneMap:
+    """
+    Минимум и максимум значений столбца в каждом блоке из BLOCK_SIZE строк.
+    Границы блока только расширяются (после удаления или изменения
+    строк они могут быть шире фактических); блок, где встретилось
+    значение NaN, помечается границами NaN и всегда проверяется поэлементно
+    """
+
+    def __init__(self) -> None:
+        self.mins = array('d')
+        self.maxs = array('d')
+
+    def widen(self, row: int, value: float) -> None:
+        """ Учесть значение value в строке row """
+        block = row // BLOCK_SIZE
+        if block == len(self.mins):
+            self.mins.append(value)
+            self.maxs.append(value)
+        elif isnan(value):
+            self.mins[block] = self.maxs[block] = nan
+        elif not isnan(self.mins[block]):
+            self.mins[block] = min(self.mins[block], value)
+            self.maxs[block] = max(self.maxs[block], value)
+
+    def cover(self, column: 'array[Any]', start: int) -> None:
+        """ Учесть значения строк столбца column, начиная со строки start """
+        for block in range(start // BLOCK_SIZE, -(-len(column) // BLOCK_SIZE)):
+            chunk = column[max(start, block * BLOCK_SIZE):(block + 1) * BLOCK_SIZE]
+            if any(map(isnan, chunk)):
+                self.widen(block * BLOCK_SIZE, nan)
+            else:
+                self.widen(block * BLOCK_SIZE, min(chunk))
+                self.widen(block * BLOCK_SIZE, max(chunk))
+
+    def truncate(self, rows: int) -> None:
+        """ Убрать блоки за последней из rows строк """
+        blocks = -(-rows // BLOCK_SIZE)
+        del self.mins[blocks:]
+        del self.maxs[blocks:]
+
+    def blocks(self) -> Iterator[tuple[int, float, float]]:
+        """ Начало, минимум и максимум каждого блока """
+        return zip(range(0, len(self.mins) * BLOCK_SIZE, BLOCK_SIZE),
+                   self.mins, self.maxs)
+
+
+def _reduce(func: str, values: Iterable[Any], count: int) -> Any:
+    if func == 'count':
+        return count
+    if count == 0:
+        return None
+    if func == 'min':
+        return min(values)
+    if func == 'max':
+        return max(values)
+    total = sum(values)
+    return total / count if func == 'avg' else total
+
+
+def _group_key(key: Any) -> Any:
+    """ Ключ группы: пустые значения (разные объекты NaN) сводятся к одному """
+    return nan if isinstance(key, float) and isnan(key) else key
+
+
+class ColumnarExpenseRepository(AbstractRepository[Expense]):
+    """
+    Колоночный репозиторий расходов в оперативной памяти.
+    Занимает около 40 байт на запись (плюс различные категории
+    и комментарии) против нескольких сотен у объектов Expense.
+    Условия where, aggregate и get_all с fields выполняются по столбцам;
+    get и get_all без fields создают новые объекты Expense, поэтому
+    изменения объекта сохраняются только методом update.
+    Порядок записей в get_all не определен (удаление переносит последнюю
+    запись на место удаленной)
+    """
+
+    def __init__(self) -> None:
+        self._pks = array('q')
+        self._numbers = {field: array('d') for field in NUMBER_FIELDS}
+        self._zones = {field: ZoneMap() for field in ('pk', *NUMBER_FIELDS)}
+        self._codes = {field: array('B') for field in POOLED_FIELDS}
+        self._pools = {field: ValuePool() for field in POOLED_FIELDS}
+        self._rows: dict[int, int] = {}
+        self._last_pk = 0
+
+    def __len__(self) -> int:
+        return len(self._pks)
+
+    def _column(self, field: str) -> 'array[Any]':
+        if field == 'pk':
+            return self._pks
+        column = self._numbers.get(field, self._codes.get(field))
+        if column is None:
+            raise ValueError(f'unknown field {field!r}')
+        return column
+
+    def _intern(self, field: str, value: Any) -> int:
+        pid = self._pools[field].intern(value)
+        self._fit_codes(field, pid)
+        return pid
+
+    def _fit_codes(self, field: str, pid: int) -> None:
+        codes = self._codes[field]
+        while pid > _MAX_CODE[codes.typecode]:
+            codes = self._codes[field] = array('H' if codes.typecode == 'B' else 'I',
+                                               codes)
+
+    def _append(self, batch: list[Expense], pks: list[int]) -> None:
+        """ Добавить строки новых объектов с id pks пачкой, по столбцу за проход """
+        start = len(self._pks)
+        self._rows.update((pk, row) for row, pk in enumerate(pks, start))
+        self._pks.extend(pks)
+        for field, column in self._numbers.items():
+            column.extend(encode_number(field, getattr(obj, field)) for obj in batch)
+        for field, pool in self._pools.items():
+            pids = [pool.intern(getattr(obj, field)) for obj in batch]
+            self._fit_codes(field, len(pool.values) - 1)
+            self._codes[field].extend(pids)
+        for field, zones in self._zones.items():
+            zones.cover(self._column(field), start)
+
+    def _store(self, obj: Expense) -> None:
+        row = self._rows.get(obj.pk)
+        if row is None:
+            row = self._rows[obj.pk] = len(self._pks)
+            self._pks.append(obj.pk)
+            self._zones['pk'].widen(row, obj.pk)
+            for field, column in self._numbers.items():
+                column.append(nan)
+            for codes in self._codes.values():
+                codes.append(0)
+        for field, column in self._numbers.items():
+            column[row] = value = encode_number(field, getattr(obj, field))
+            self._zones[field].widen(row, value)
+        for field in POOLED_FIELDS:
+            pid = self._intern(field, getattr(obj, field))
+            self._codes[field][row] = pid
+
+    def _remove(self, pk: int) -> None:
+        row = self._rows.pop(pk)
+        last = len(self._pks) - 1
+        columns: dict[str, 'array[Any]'] = {'pk': self._pks, **self._numbers,
+                                            **self._codes}
+        for field, column in columns.items():
+            if row != last:
+                column[row] = column[last]
+                if field in self._zones:
+                    self._zones[field].widen(row, column[row])
+            column.pop()
+        for zones in self._zones.values():
+            zones.truncate(last)
+        if row != last:
+            self._rows[self._pks[row]] = row
+
+    def _object(self, row: int) -> Expense:
+        values = {field: decode_number(field, column[row])
+                  for field, column in self._numbers.items()}
+        values.update((field, self._pools[field].values[codes[row]])
+                      for field, codes in self._codes.items())
+        return Expense(pk=self._pks[row], **values)
+
+    def _decoder(self, field: str) -> Callable[[Any], Any]:
+        if field in self._pools:
+            return self._pools[field].values.__getitem__
+        if field in self._numbers:
+            return lambda value: decode_number(field, value)
+        return int
+
+    def _pooled_mask(self, field: str, expected: Any) -> bytes:
+        codes = self._codes[field]
+        pids = self._pools[field].matching(expected)
+        if codes.typecode == 'B':
+            table = bytes(pid in pids for pid in range(256))
+            return codes.tobytes().translate(table)
+        return bytes(map(pids.__contains__, codes))
+
+    def _range_mask(self, field: str, expected: Any) -> bytes:
+        column = self._column(field)
+        low_op, low, high_op, high = interval(expected)
+        low = -inf if low is None else self._encode(field, low)
+        high = inf if high is None else self._encode(field, high)
+        parts = []
+        for start, block_min, block_max in self._zones[field].blocks():
+            size = min(BLOCK_SIZE, len(column) - start)
+            known = not isnan(block_min)
+            if known and low_op(block_min, low) and high_op(block_max, high):
+                parts.append(_ONES[:size])
+            elif known and not (low_op(block_max, low) and high_op(block_min, high)):
+                parts.append(_ZEROS[:size])
+            else:
+                chunk = column[start:start + size]
+                parts.append(mask_and(bytes(map(low_op, chunk, repeat(low))),
+                                      bytes(map(high_op, chunk, repeat(high)))))
+        return b''.join(parts)
+
+    @staticmethod
+    def _encode(field: str, value: Any) -> Any:
+        return value if field == 'pk' else encode_number(field, value)
+
+    def mask(self, where: dict[str, Any] | None) -> bytes | None:
+        """
+        Байтовая маска строк (1 - строка удовлетворяет условию where)
+        или None, если условие не задано
+        """
+        mask = None
+        for field, expected in (where or {}).items():
+            if field in self._pools:
+                mask = mask_and(mask, self._pooled_mask(field, expected))
+            elif expected is None:
+                # NaN - единственное значение, не равное самому себе
+                mask = mask_and(mask, bytes(map(isnan, self._column(field))))
+            else:
+                mask = mask_and(mask, self._range_mask(field, expected))
+        return mask
+
+    def _selected(self, field: str, mask: bytes | None) -> Iterable[Any]:
+        column = self._column(field)
+        return column if mask is None else compress(column, mask)
+
+    def add(self, obj: Expense) -> int:
+        if getattr(obj, 'pk', None) != 0:
+            raise ValueError(f'trying to add object {obj} with filled `pk` attribute')
+        self._last_pk += 1
+        obj.pk = self._last_pk
+        self._store(obj)
+        return obj.pk
+
+    def add_many(self, objs: Iterable[Expense]) -> list[int]:
+        batch = list(objs)
+        for obj in batch:
+            if getattr(obj, 'pk', None) != 0:
+                raise ValueError(f'trying to add object {obj} with filled `pk` attribute')
+        pks = list(range(self._last_pk + 1, self._last_pk + len(batch) + 1))
+        self._append(batch, pks)
+        for obj, pk in zip(batch, pks):
+            obj.pk = pk
+        self._last_pk += len(batch)
+        return pks
+
+    def get(self, pk: int) -> Expense | None:
+        row = self._rows.get(pk)
+        return None if row is None else self._object(row)
+
+    def get_all(self,
+                where: dict[str, Any] | None = None,
+                fields: Sequence[str] | None = None) -> list[Any]:
+        mask = self.mask(where)
+        if fields is not None:
+            columns = [map(self._decoder(field), self._selected(field, mask))
+                       for field in fields]
+            return list(map(row_type(tuple(fields))._make, zip(*columns)))
+        rows: Iterable[int] = range(len(self._pks))
+        if mask is not None:
+            rows = compress(rows, mask)
+        return [self._object(row) for row in rows]
+
+    def update(self, obj: Expense) -> None:
+        if obj.pk == 0:
+            raise ValueError('attempt to update object with unknown primary key')
+        self._store(obj)
+
+    def update_many(self, objs: Iterable[Expense]) -> None:
+        batch = list(objs)
+        if any(obj.pk == 0 for obj in batch):
+            raise ValueError('attempt to update object with unknown primary key')
+        for obj in batch:
+            self._store(obj)
+
+    def delete(self, pk: int) -> None:
+        self._remove(pk)
+
+    def delete_many(self, pks: Iterable[int]) -> None:
+        batch = list(dict.fromkeys(pks))
+        for pk in batch:
+            if pk not in self._rows:
+                raise KeyError(pk)
+        for pk in batch:
+            self._remove(pk)
+
+    def put_many(self, objs: Iterable[Expense]) -> None:
+        """
+        Записать расходы с уже назначенными id (см. SupportsPutMany)
+        """
+        batch = list(objs)
+        if any(obj.pk == 0 for obj in batch):
+            raise ValueError('attempt to put object with unknown primary key')
+        for obj in batch:
+            self._store(obj)
+        self._last_pk = max([self._last_pk, *(obj.pk for obj in batch)])
+
+    def aggregate(self,
+                  func: str,
+                  field: str = 'pk',
+                  where: dict[str, Any] | None = None,
+                  group_by: str | None = None) -> Any:
+        """
+        Вычислить агрегат (см. AbstractRepository.aggregate) по столбцам.
+        Агрегаты полей category и comment вычисляются по объектам
+        """
+        if func not in AGGREGATES:
+            raise ValueError(f'unknown aggregate function {func!r}')
+        if field in self._pools:
+            return super().aggregate(func, field, where, group_by)
+        rows = mask = self.mask(where)
+        if field != 'pk':
+            # пустые значения (NaN) в агрегат не входят
+            mask = mask_and(mask, self._range_mask(field, Between(None, None)))
+        if mask is not None and 0 not in mask:
+            mask = None
+        decode = self._decoder(field) if func in ('min', 'max') else None
+        if group_by is None:
+            count = len(self._pks) if mask is None else mask.count(1)
+            return self._result(func, self._selected(field, mask), count, decode)
+        # группы, где все значения field пусты, тоже входят в результат
+        groups: dict[Any, list[Any]] = {
+            _group_key(key): [] for key in self._selected(group_by, rows)}
+        for key, value in zip(self._selected(group_by, mask),
+                              self._selected(field, mask)):
+            groups[_group_key(key)].append(value)
+        decode_key = self._decoder(group_by)
+        return {decode_key(key): self._result(func, values, len(values), decode)
+                for key, values in groups.items()}
+
+    @staticmethod
+    def _result(func: str,
+                values: Iterable[Any],
+                count: int,
+                decode: Callable[[Any], Any] | None) -> Any:
+        result = _reduce(func, values, count)
+        return result if decode is None or result is None else decode(result)
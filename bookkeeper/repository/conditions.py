@@ -0,0 +1,103 @@
+"""
+Модуль описывает условия сравнения для запросов к репозиториям
+
+Кроме точного значения, в условии where можно указать для поля объект
+условия, например {'expense_date': Between(start, end)}. Репозиторий sqlite
+переводит условие в SQL (с использованием индекса по полю), репозиторий в
+памяти проверяет его методом match.
+"""
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import Any, ClassVar
+
+
+class Condition(ABC):
+    """
+    Условие на значение поля.
+    op - имя оператора для построителя SQL-запросов
+    """
+    op: ClassVar[str]
+
+    @abstractmethod
+    def params(self) -> list[Any]:
+        """ Параметры условия для SQL-запроса """
+
+    @abstractmethod
+    def match(self, value: Any) -> bool:
+        """ Удовлетворяет ли значение поля условию """
+
+
+@dataclass(frozen=True)
+class Between(Condition):
+    """ Значение в отрезке [low, high] """
+    op = 'between'
+    low: Any
+    high: Any
+
+    def params(self) -> list[Any]:
+        return [self.low, self.high]
+
+    def match(self, value: Any) -> bool:
+        return value is not None and bool(self.low <= value <= self.high)
+
+
+@dataclass(frozen=True)
+class Lt(Condition):
+    """ Значение меньше bound """
+    op = 'lt'
+    bound: Any
+
+    def params(self) -> list[Any]:
+        return [self.bound]
+
+    def match(self, value: Any) -> bool:
+        return value is not None and bool(value < self.bound)
+
+
+@dataclass(frozen=True)
+class Le(Condition):
+    """ Значение не больше bound """
+    op = 'le'
+    bound: Any
+
+    def params(self) -> list[Any]:
+        return [self.bound]
+
+    def match(self, value: Any) -> bool:
+        return value is not None and bool(value <= self.bound)
+
+
+@dataclass(frozen=True)
+class Gt(Condition):
+    """ Значение больше bound """
+    op = 'gt'
+    bound: Any
+
+    def params(self) -> list[Any]:
+        return [self.bound]
+
+    def match(self, value: Any) -> bool:
+        return value is not None and bool(value > self.bound)
+
+
+@dataclass(frozen=True)
+class Ge(Condition):
+    """ Значение не меньше bound """
+    op = 'ge'
+    bound: Any
+
+    def params(self) -> list[Any]:
+        return [self.bound]
+
+    def match(self, value: Any) -> bool:
+        return value is not None and bool(value >= self.bound)
+
+
+def matches(value: Any, expected: Any) -> bool:
+    """
+    Удовлетворяет ли значение поля условию where для этого поля:
+    объекту Condition или точному значению
+    """
+    if isinstance(expected, Condition):
+        return expected.match(value)
+    return bool(value == expected)
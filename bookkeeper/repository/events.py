@@ -0,0 +1,256 @@
+"""
+Модуль описывает поток событий об изменениях в репозиториях
+
+ObservableRepository - обертка над любым репозиторием, которая после
+каждого изменения публикует в EventHub типизированные события ChangeEvent:
+вставка, обновление или удаление записи с ее id и измененными полями.
+События одной транзакции (transaction, unit_of_work) доставляются
+подписчикам одним списком после ее фиксации и отбрасываются при откате,
+так что подписчики (представления, кеши, учет бюджетов) могут применять
+небольшие изменения вместо повторного чтения таблиц.
+"""
+import logging
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass
+from enum import Enum
+from typing import Any, Callable, Iterable, Iterator, Sequence
+
+from bookkeeper.repository.abstract_repository import (
+    AbstractRepository, SupportsPutMany, T, bind_optional
+)
+
+logger = logging.getLogger(__name__)
+
+
+class ChangeKind(Enum):
+    """ Вид изменения записи """
+    INSERTED = 'inserted'
+    UPDATED = 'updated'
+    DELETED = 'deleted'
+
+
+@dataclass(frozen=True)
+class ChangeEvent:
+    """
+    Изменение записи.
+    model - имя модели (как в MeteredRepository)
+    kind - вид изменения
+    pk - id записи
+    fields - измененные поля (при вставке - все поля, при удалении - пусто)
+    obj - объект после изменения (None при удалении)
+    """
+    model: str
+    kind: ChangeKind
+    pk: int
+    fields: tuple[str, ...] = ()
+    obj: Any = None
+
+
+Subscriber = Callable[[list[ChangeEvent]], None]
+
+
+class EventHub:
+    """
+    Рассылка событий подписчикам. Подписчик - функция, получающая
+    список событий. События, опубликованные внутри блока batch, доставляются
+    одним списком при выходе из внешнего блока batch потока, а если блок
+    завершился исключением - отбрасываются. Исключения подписчиков пишутся
+    в журнал (logging) и не мешают доставке остальным
+    """
+
+    def __init__(self) -> None:
+        self._subscribers: list[tuple[Subscriber, frozenset[str] | None]] = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def subscribe(self,
+                  subscriber: Subscriber,
+                  models: Iterable[str] | None = None) -> Callable[[], None]:
+        """
+        Подписать subscriber на события моделей models (по умолчанию - всех).
+        Возвращает функцию отмены подписки
+        """
+        entry = (subscriber, None if models is None else frozenset(models))
+        with self._lock:
+            self._subscribers.append(entry)
+
+        def unsubscribe() -> None:
+            with self._lock:
+                if entry in self._subscribers:
+                    self._subscribers.remove(entry)
+
+        return unsubscribe
+
+    @contextmanager
+    def batch(self) -> Iterator[None]:
+        """
+        Собрать события блока with и доставить их вместе при выходе
+        """
+        depth = getattr(self._local, 'depth', 0)
+        if depth == 0:
+            self._local.pending = []
+        self._local.depth = depth + 1
+        try:
+            yield
+        except BaseException:
+            if depth == 0:
+                self._local.pending = []
+            raise
+        finally:
+            self._local.depth = depth
+        if depth == 0:
+            pending, self._local.pending = self._local.pending, []
+            self._deliver(pending)
+
+    def publish(self, events: list[ChangeEvent]) -> None:
+        """
+        Опубликовать события: сразу или при выходе из текущего блока batch
+        """
+        if getattr(self._local, 'depth', 0) > 0:
+            self._local.pending.extend(events)
+        else:
+            self._deliver(events)
+
+    def _deliver(self, events: list[ChangeEvent]) -> None:
+        if not events:
+            return
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscriber, models in subscribers:
+            selected = events if models is None \
+                else [event for event in events if event.model in models]
+            if not selected:
+                continue
+            try:
+                subscriber(selected)
+            except Exception:  # pylint: disable=broad-except
+                logger.exception('change event subscriber %r failed', subscriber)
+
+
+def _fields(obj: Any) -> tuple[str, ...]:
+    return tuple(name for name in vars(obj) if name != 'pk')
+
+
+def _changed(old: Any, new: Any) -> tuple[str, ...]:
+    """
+    Поля, значения которых различаются у old и new. Если старое состояние
+    неизвестно (нет записи или объект изменен на месте), - все поля
+    """
+    if old is None or old is new:
+        return _fields(new)
+    return tuple(name for name in _fields(new)
+                 if getattr(old, name, None) != getattr(new, name))
+
+
+class ObservableRepository(AbstractRepository[T]):
+    """
+    Обертка над репозиторием, публикующая события об изменениях в hub.
+    model - имя модели в событиях (по умолчанию имя таблицы репозитория
+    sqlite или имя класса репозитория)
+    Для обновлений измененные поля находятся сравнением с записью,
+    прочитанной перед изменением; обновление без изменений не публикуется.
+    Методы чтения передаются исходному репозиторию без изменений
+    """
+
+    repo: AbstractRepository[T]
+    hub: EventHub
+    model: str
+
+    def __init__(self,
+                 repo: AbstractRepository[T],
+                 hub: EventHub,
+                 model: str | None = None) -> None:
+        self.repo = repo
+        self.hub = hub
+        if model is None:
+            model = str(getattr(repo, 'table_name', type(repo).__name__))
+        self.model = model
+        bind_optional(self, repo)
+
+    def _inserted(self, objs: Iterable[T]) -> list[ChangeEvent]:
+        return [ChangeEvent(self.model, ChangeKind.INSERTED, obj.pk, _fields(obj), obj)
+                for obj in objs]
+
+    def _updated(self, objs: Iterable[T], old: dict[int, T | None]) -> list[ChangeEvent]:
+        events = []
+        for obj in objs:
+            if old[obj.pk] is None:
+                events += self._inserted([obj])
+                continue
+            fields = _changed(old[obj.pk], obj)
+            if fields:
+                events.append(ChangeEvent(self.model, ChangeKind.UPDATED, obj.pk,
+                                          fields, obj))
+        return events
+
+    def _deleted(self, pks: Iterable[int]) -> list[ChangeEvent]:
+        return [ChangeEvent(self.model, ChangeKind.DELETED, pk) for pk in pks]
+
+    def _before(self, objs: Sequence[T]) -> dict[int, T | None]:
+        return {obj.pk: self.repo.get(obj.pk) for obj in objs}
+
+    def add(self, obj: T) -> int:
+        pk = self.repo.add(obj)
+        self.hub.publish(self._inserted([obj]))
+        return pk
+
+    def get(self, pk: int) -> T | None:
+        return self.repo.get(pk)
+
+    def get_all(self,
+                where: dict[str, Any] | None = None,
+                fields: Sequence[str] | None = None,
+                **kwargs: Any) -> list[Any]:
+        return self.repo.get_all(where, fields=fields, **kwargs)
+
+    def update(self, obj: T) -> None:
+        old = self._before([obj])
+        self.repo.update(obj)
+        self.hub.publish(self._updated([obj], old))
+
+    def delete(self, pk: int) -> None:
+        self.repo.delete(pk)
+        self.hub.publish(self._deleted([pk]))
+
+    def add_many(self, objs: Iterable[T]) -> list[int]:
+        batch = list(objs)
+        pks = self.repo.add_many(batch)
+        self.hub.publish(self._inserted(batch))
+        return pks
+
+    def update_many(self, objs: Iterable[T]) -> None:
+        batch = list(objs)
+        old = self._before(batch)
+        self.repo.update_many(batch)
+        self.hub.publish(self._updated(batch, old))
+
+    def delete_many(self, pks: Iterable[int]) -> None:
+        batch = list(dict.fromkeys(pks))
+        self.repo.delete_many(batch)
+        self.hub.publish(self._deleted(batch))
+
+    def _put_many(self, repo: SupportsPutMany[T], objs: Iterable[T]) -> None:
+        batch = list(objs)
+        old = self._before(batch)
+        repo.put_many(batch)
+        self.hub.publish(self._updated(batch, old))
+
+    def aggregate(self,
+                  func: str,
+                  field: str = 'pk',
+                  where: dict[str, Any] | None = None,
+                  group_by: str | None = None) -> Any:
+        return self.repo.aggregate(func, field, where, group_by)
+
+    def iter_all(self, *args: Any, **kwargs: Any) -> Iterator[T]:
+        return self.repo.iter_all(*args, **kwargs)
+
+    @contextmanager
+    def transaction(self) -> Iterator[None]:
+        """
+        Транзакция исходного репозитория; ее события доставляются
+        подписчикам одним списком после фиксации
+        """
+        with self.hub.batch(), self.repo.transaction():
+            yield
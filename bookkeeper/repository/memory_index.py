@@ -0,0 +1,145 @@
+"""
+Модуль описывает вторичные индексы для MemoryRepository
+
+Индекс хранит для каждого объекта значение индексируемого поля на момент
+записи в репозиторий, поэтому при обновлении или удалении объект убирается
+из индекса по старому значению, даже если сам объект был изменен на месте.
+"""
+from bisect import bisect_left, bisect_right, insort
+from math import inf
+from typing import Any, Iterator
+
+from bookkeeper.repository.conditions import Between, Condition, Ge, Gt, Le, Lt
+
+
+class HashIndex:
+    """
+    Хеш-индекс по полю field: множество id объектов для каждого значения.
+    Поиск по равенству выполняется за O(1)
+    """
+
+    field: str
+
+    def __init__(self, field: str) -> None:
+        self.field = field
+        self._buckets: dict[Any, set[int]] = {}
+        self._keys: dict[int, Any] = {}
+
+    def insert(self, pk: int, obj: Any) -> None:
+        """ Добавить объект с id pk в индекс """
+        key = getattr(obj, self.field, None)
+        self._keys[pk] = key
+        self._buckets.setdefault(key, set()).add(pk)
+
+    def remove(self, pk: int) -> None:
+        """ Убрать объект с id pk из индекса """
+        key = self._keys.pop(pk)
+        bucket = self._buckets[key]
+        bucket.discard(pk)
+        if not bucket:
+            del self._buckets[key]
+
+    def lookup(self, value: Any) -> set[int]:
+        """ Id объектов, у которых поле равно value """
+        return self._buckets.get(value, set())
+
+
+class SortedIndex:
+    """
+    Упорядоченный индекс по полю field: отсортированный список пар
+    (значение, id) и отдельно id объектов со значением None, которые,
+    как в sqlite, упорядочены перед всеми значениями.
+    Поиск по равенству и по условиям Between, Lt, Le, Gt, Ge выполняется
+    двоичным поиском за O(log n + k), где k - число найденных объектов
+    """
+
+    field: str
+
+    def __init__(self, field: str) -> None:
+        self.field = field
+        self._entries: list[tuple[Any, int]] = []
+        self._nulls: list[int] = []
+        self._keys: dict[int, Any] = {}
+
+    def insert(self, pk: int, obj: Any) -> None:
+        """ Добавить объект с id pk в индекс """
+        key = getattr(obj, self.field, None)
+        self._keys[pk] = key
+        if key is None:
+            insort(self._nulls, pk)
+        else:
+            insort(self._entries, (key, pk))
+
+    def remove(self, pk: int) -> None:
+        """ Убрать объект с id pk из индекса """
+        key = self._keys.pop(pk)
+        if key is None:
+            del self._nulls[bisect_left(self._nulls, pk)]
+        else:
+            del self._entries[bisect_left(self._entries, (key, pk))]
+
+    def _bounds(self, condition: Condition) -> tuple[int, int]:
+        """ Отрезок списка значений, удовлетворяющих условию """
+        lo, hi = 0, len(self._entries)
+        if isinstance(condition, Between):
+            lo = bisect_left(self._entries, (condition.low,))
+            hi = bisect_right(self._entries, (condition.high, inf))
+        elif isinstance(condition, Gt):
+            lo = bisect_right(self._entries, (condition.bound, inf))
+        elif isinstance(condition, Ge):
+            lo = bisect_left(self._entries, (condition.bound,))
+        elif isinstance(condition, Lt):
+            hi = bisect_left(self._entries, (condition.bound,))
+        elif isinstance(condition, Le):
+            hi = bisect_right(self._entries, (condition.bound, inf))
+        else:
+            raise TypeError(f'unsupported condition {condition!r}')
+        return lo, max(lo, hi)
+
+    def lookup(self, value: Any) -> list[int]:
+        """ Id объектов, у которых поле равно value """
+        if value is None:
+            return list(self._nulls)
+        return self.search(Between(value, value))
+
+    def search(self, condition: Condition) -> list[int]:
+        """ Id объектов, поле которых удовлетворяет условию, в порядке поля """
+        lo, hi = self._bounds(condition)
+        return [pk for _, pk in self._entries[lo:hi]]
+
+    def ordered(self,
+                bound: tuple[tuple[bool, Any], float] | None = None,
+                descending: bool = False) -> Iterator[int]:
+        """
+        Id объектов в порядке (поле, id), следующих за границей bound
+        (в терминах abstract_repository.keyset_bound)
+        """
+        if descending:
+            return self._descending(bound)
+        if bound is None:
+            return self._walk(0, 0)
+        (has_value, value), pk = bound
+        if not has_value:
+            return self._walk(bisect_right(self._nulls, pk), 0)
+        return self._walk(len(self._nulls), bisect_right(self._entries, (value, pk)))
+
+    def _walk(self, null_start: int, start: int) -> Iterator[int]:
+        for i in range(null_start, len(self._nulls)):
+            yield self._nulls[i]
+        for i in range(start, len(self._entries)):
+            yield self._entries[i][1]
+
+    def _descending(self, bound: tuple[tuple[bool, Any], float] | None) -> Iterator[int]:
+        if bound is None:
+            null_end, end = len(self._nulls), len(self._entries)
+        else:
+            (has_value, value), pk = bound
+            if has_value:
+                null_end = len(self._nulls)
+                end = bisect_left(self._entries, (value, pk))
+            else:
+                null_end, end = bisect_left(self._nulls, pk), 0
+        for i in range(end - 1, -1, -1):
+            yield self._entries[i][1]
+        for i in range(null_end - 1, -1, -1):
+            yield self._nulls[i]
@@ -3,41 +3,194 @@
 """
 
 from itertools import count
-from typing import Any
+from typing import Any, Collection, Iterable, Iterator, Sequence
 
-from bookkeeper.repository.abstract_repository import AbstractRepository, T
+from bookkeeper.repository.abstract_repository import (
+    DEFAULT_BATCH_SIZE, DEFAULT_SEARCH_LIMIT, AbstractRepository, T, aggregate_objects,
+    keyset_bound, project
+)
+from bookkeeper.repository.conditions import Condition, matches
+from bookkeeper.repository.memory_index import HashIndex, SortedIndex
+from bookkeeper.repository.text_search import TextIndex
 
 
 class MemoryRepository(AbstractRepository[T]):
     """
     Репозиторий, работающий в оперативной памяти. Хранит данные в словаре.
+    indexes - поля, по которым строятся хеш-индексы: условия where на
+    равенство этим полям проверяются поиском в индексе, а не перебором
+    range_indexes - поля, по которым строятся упорядоченные индексы:
+    они ускоряют и равенство, и условия Between, Lt, Le, Gt, Ge, а iter_all
+    с order_by по такому полю идет по индексу без сортировки
+    text_fields - текстовые поля, по которым строится инвертированный
+    индекс для полнотекстового поиска search
     """
 
-    def __init__(self) -> None:
+    def __init__(self,
+                 indexes: Iterable[str] = (),
+                 range_indexes: Iterable[str] = (),
+                 text_fields: Iterable[str] = ()) -> None:
         self._container: dict[int, T] = {}
         self._counter = count(1)
+        self._last_pk = 0
+        self._indexes: dict[str, HashIndex | SortedIndex] = {
+            field: HashIndex(field) for field in indexes}
+        self._indexes.update((field, SortedIndex(field)) for field in range_indexes)
+        text_fields = tuple(text_fields)
+        self._text_index = TextIndex(text_fields) if text_fields else None
+        if self._text_index is not None:
+            self.search = self._search
+
+    def _store(self, pk: int, obj: T) -> None:
+        if pk in self._container:
+            self._unindex(pk)
+        self._container[pk] = obj
+        for index in self._indexes.values():
+            index.insert(pk, obj)
+        if self._text_index is not None:
+            self._text_index.insert(pk, obj)
+
+    def _unindex(self, pk: int) -> None:
+        for index in self._indexes.values():
+            index.remove(pk)
+        if self._text_index is not None:
+            self._text_index.remove(pk)
+
+    def _pop(self, pk: int) -> T:
+        obj = self._container.pop(pk)
+        self._unindex(pk)
+        return obj
 
     def add(self, obj: T) -> int:
         if getattr(obj, 'pk', None) != 0:
             raise ValueError(f'trying to add object {obj} with filled `pk` attribute')
         pk = next(self._counter)
-        self._container[pk] = obj
+        self._last_pk = pk
+        self._store(pk, obj)
         obj.pk = pk
         return pk
 
     def get(self, pk: int) -> T | None:
         return self._container.get(pk)
 
-    def get_all(self, where: dict[str, Any] | None = None) -> list[T]:
+    def get_all(self,
+                where: dict[str, Any] | None = None,
+                fields: Sequence[str] | None = None) -> list[Any]:
+        objs = self._matching(where)
+        return list(objs) if fields is None else project(objs, fields)
+
+    def _candidates(self, where: dict[str, Any]) -> Iterable[T]:
+        """
+        Объекты, среди которых нужно искать подходящие под условие: по
+        наиболее избирательному индексу из условий на равенство или все
+        """
+        best: Collection[int] | None = None
+        for attr, value in where.items():
+            index = self._indexes.get(attr)
+            if index is None:
+                continue
+            try:
+                if not isinstance(value, Condition):
+                    pks: Collection[int] = index.lookup(value)
+                elif isinstance(index, SortedIndex):
+                    pks = index.search(value)
+                else:
+                    continue
+            except TypeError:
+                continue
+            if best is None or len(pks) < len(best):
+                best = pks
+        if best is None:
+            return self._container.values()
+        return [self._container[pk] for pk in sorted(best)]
+
+    def _matching(self, where: dict[str, Any] | None) -> Iterator[T]:
         if where is None:
-            return list(self._container.values())
-        return [obj for obj in self._container.values()
-                if all(getattr(obj, attr) == value for attr, value in where.items())]
+            return iter(self._container.values())
+        return (obj for obj in self._candidates(where)
+                if all(matches(getattr(obj, attr), value)
+                       for attr, value in where.items()))
+
+    def iter_all(self,
+                 where: dict[str, Any] | None = None,
+                 order_by: str = 'pk',
+                 batch_size: int = DEFAULT_BATCH_SIZE,
+                 after: Any = None,
+                 after_pk: int | None = None,
+                 descending: bool = False) -> Iterator[T]:
+        """
+        Перебрать записи (см. AbstractRepository.iter_all). Если по полю
+        order_by есть упорядоченный индекс, записи идут в его порядке,
+        а продолжение после (after, after_pk) находится двоичным поиском
+        """
+        index = self._indexes.get(order_by)
+        if not isinstance(index, SortedIndex):
+            yield from super().iter_all(where, order_by, batch_size,
+                                        after, after_pk, descending)
+            return
+        bound = keyset_bound(order_by, after, after_pk, descending)
+        for pk in index.ordered(bound, descending):
+            obj = self._container[pk]
+            if where is None or all(matches(getattr(obj, attr), value)
+                                    for attr, value in where.items()):
+                yield obj
+
+    def aggregate(self,
+                  func: str,
+                  field: str = 'pk',
+                  where: dict[str, Any] | None = None,
+                  group_by: str | None = None) -> Any:
+        """
+        Вычислить агрегат (см. AbstractRepository.aggregate) за один проход
+        по подходящим объектам, не собирая их в список
+        """
+        return aggregate_objects(self._matching(where), func, field, group_by)
+
+    def _search(self, query: str, limit: int = DEFAULT_SEARCH_LIMIT) -> list[int]:
+        """
+        Полнотекстовый поиск (см. Searchable) по инвертированному
+        индексу полей text_fields; метод search есть, только если они заданы
+        """
+        assert self._text_index is not None
+        return self._text_index.search(query, limit)
 
     def update(self, obj: T) -> None:
         if obj.pk == 0:
             raise ValueError('attempt to update object with unknown primary key')
-        self._container[obj.pk] = obj
+        self._store(obj.pk, obj)
 
     def delete(self, pk: int) -> None:
-        self._container.pop(pk)
+        self._pop(pk)
+
+    def add_many(self, objs: Iterable[T]) -> list[int]:
+        batch = list(objs)
+        for obj in batch:
+            if getattr(obj, 'pk', None) != 0:
+                raise ValueError(f'trying to add object {obj} with filled `pk` attribute')
+        return [self.add(obj) for obj in batch]
+
+    def update_many(self, objs: Iterable[T]) -> None:
+        batch = list(objs)
+        if any(obj.pk == 0 for obj in batch):
+            raise ValueError('attempt to update object with unknown primary key')
+        for obj in batch:
+            self._store(obj.pk, obj)
+
+    def delete_many(self, pks: Iterable[int]) -> None:
+        batch = list(dict.fromkeys(pks))
+        for pk in batch:
+            if pk not in self._container:
+                raise KeyError(pk)
+        for pk in batch:
+            self._pop(pk)
+
+    def put_many(self, objs: Iterable[T]) -> None:
+        batch = list(objs)
+        if any(obj.pk == 0 for obj in batch):
+            raise ValueError('attempt to put object with unknown primary key')
+        for obj in batch:
+            self._store(obj.pk, obj)
+        last_pk = max((obj.pk for obj in batch), default=0)
+        if last_pk > self._last_pk:
+            self._last_pk = last_pk
+            self._counter = count(last_pk + 1)
@@ -0,0 +1,323 @@
+"""
+Модуль описывает метрики обращений к репозиториям
+
+MetricsRegistry накапливает по каждой модели и методу репозитория число
+вызовов и ошибок, гистограмму времени выполнения, число строк и примерный
+объем прочитанных данных. MeteredRepository - обертка над любым
+репозиторием, которая передает эти данные в реестр. Реестр выгружается
+в JSON или в текстовом формате Prometheus.
+"""
+import json
+import threading
+from bisect import bisect_left
+from dataclasses import dataclass, field
+from datetime import datetime
+from time import perf_counter
+from typing import (
+    Any, Callable, ContextManager, Iterable, Iterator, Sequence, TypeVar
+)
+
+from bookkeeper.repository.abstract_repository import (
+    DEFAULT_SEARCH_LIMIT, AbstractRepository, Searchable, SupportsPutMany, T,
+    bind_optional
+)
+
+R = TypeVar('R')
+
+# Границы корзин гистограммы времени выполнения, секунды
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+METRIC_PREFIX = 'bookkeeper_repository'
+
+
+def estimate_size(value: Any) -> int:
+    """
+    Примерный объем значения в байтах: длина строк и байтовых строк,
+    8 байт на число или дату, сумма по полям объекта или кортежа
+    """
+    if value is None:
+        return 0
+    if isinstance(value, (str, bytes)):
+        return len(value)
+    if isinstance(value, (int, float, datetime)):
+        return 8
+    if isinstance(value, tuple):
+        return sum(estimate_size(item) for item in value)
+    if hasattr(value, '__dict__'):
+        return sum(estimate_size(item) for item in vars(value).values())
+    return 8
+
+
+@dataclass
+class Histogram:
+    """
+    Гистограмма: число наблюдений в каждой корзине (counts, последняя -
+    значения больше всех границ), их сумма (sum) и количество (count)
+    """
+    buckets: Sequence[float] = LATENCY_BUCKETS
+    counts: list[int] = field(default_factory=list)
+    sum: float = 0.0
+    count: int = 0
+
+    def __post_init__(self) -> None:
+        if not self.counts:
+            self.counts = [0] * (len(self.buckets) + 1)
+
+    def observe(self, value: float) -> None:
+        """ Учесть наблюдение """
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self) -> list[tuple[str, int]]:
+        """ Накопленные счетчики по верхним границам (le), как в Prometheus """
+        bounds = [repr(bound) for bound in self.buckets] + ['+Inf']
+        total = 0
+        result = []
+        for bound, count in zip(bounds, self.counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+
+@dataclass
+class MethodMetrics:
+    """
+    Метрики одного метода репозитория одной модели
+    """
+    calls: int = 0
+    errors: int = 0
+    rows: int = 0
+    bytes: int = 0
+    latency: Histogram = field(default_factory=Histogram)
+
+
+class MetricsRegistry:
+    """
+    Реестр метрик репозиториев.
+    enabled - собирать ли метрики; выключенный реестр не замеряет вызовы
+    """
+
+    def __init__(self, enabled: bool = True) -> None:
+        self.enabled = enabled
+        self._metrics: dict[tuple[str, str], MethodMetrics] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, model: str, method: str, duration: float,
+                rows: int = 0, nbytes: int = 0, error: bool = False) -> None:
+        """
+        Учесть вызов метода method репозитория модели model
+        """
+        with self._lock:
+            metrics = self._metrics.setdefault((model, method), MethodMetrics())
+            metrics.calls += 1
+            metrics.errors += error
+            metrics.rows += rows
+            metrics.bytes += nbytes
+            metrics.latency.observe(duration)
+
+    def get(self, model: str, method: str) -> MethodMetrics:
+        """ Метрики метода модели (пустые, если вызовов не было) """
+        with self._lock:
+            return self._metrics.get((model, method), MethodMetrics())
+
+    def reset(self) -> None:
+        """ Сбросить накопленные метрики """
+        with self._lock:
+            self._metrics.clear()
+
+    def to_dict(self) -> dict[str, dict[str, dict[str, Any]]]:
+        """
+        Метрики в виде {модель: {метод: {calls, errors, rows, bytes,
+        latency: {sum, count, buckets: {le: накопленный счетчик}}}}}
+        """
+        result: dict[str, dict[str, dict[str, Any]]] = {}
+        with self._lock:
+            for (model, method), metrics in sorted(self._metrics.items()):
+                result.setdefault(model, {})[method] = {
+                    'calls': metrics.calls,
+                    'errors': metrics.errors,
+                    'rows': metrics.rows,
+                    'bytes': metrics.bytes,
+                    'latency': {
+                        'sum': metrics.latency.sum,
+                        'count': metrics.latency.count,
+                        'buckets': dict(metrics.latency.cumulative()),
+                    },
+                }
+        return result
+
+    def to_json(self, indent: int | None = None) -> str:
+        """ Метрики в формате JSON (см. to_dict) """
+        return json.dumps(self.to_dict(), indent=indent)
+
+    def to_prometheus(self) -> str:
+        """ Метрики в текстовом формате Prometheus """
+        counters = [('calls', 'calls_total', 'Repository method calls'),
+                    ('errors', 'errors_total', 'Repository method calls that raised'),
+                    ('rows', 'rows_total', 'Rows read or written'),
+                    ('bytes', 'read_bytes_total', 'Approximate bytes read')]
+        with self._lock:
+            items = sorted(self._metrics.items())
+            lines = []
+            for attr, name, help_text in counters:
+                lines += [f'# HELP {METRIC_PREFIX}_{name} {help_text}',
+                          f'# TYPE {METRIC_PREFIX}_{name} counter']
+                lines += [f'{METRIC_PREFIX}_{name}{_labels(model, method)} '
+                          f'{getattr(metrics, attr)}'
+                          for (model, method), metrics in items]
+            name = f'{METRIC_PREFIX}_latency_seconds'
+            lines += [f'# HELP {name} Repository method latency',
+                      f'# TYPE {name} histogram']
+            for (model, method), metrics in items:
+                labels = f'model="{model}",method="{method}"'
+                lines += [f'{name}_bucket{{{labels},le="{bound}"}} {count}'
+                          for bound, count in metrics.latency.cumulative()]
+                lines += [f'{name}_sum{{{labels}}} {metrics.latency.sum!r}',
+                          f'{name}_count{{{labels}}} {metrics.latency.count}']
+        return '\n'.join(lines) + '\n'
+
+
+def _labels(model: str, method: str) -> str:
+    return f'{{model="{model}",method="{method}"}}'
+
+
+def _count_rows(result: Any) -> int:
+    if result is None:
+        return 0
+    if isinstance(result, list):
+        return len(result)
+    return 1
+
+
+class MeteredRepository(AbstractRepository[T]):
+    """
+    Обертка над репозиторием, передающая метрики его методов в registry.
+    model - имя модели в метриках (по умолчанию имя таблицы репозитория
+    sqlite или имя класса репозитория)
+    Для методов чтения учитываются прочитанные строки и их примерный объем,
+    для методов записи - число записанных объектов
+    """
+
+    repo: AbstractRepository[T]
+    registry: MetricsRegistry
+    model: str
+
+    def __init__(self,
+                 repo: AbstractRepository[T],
+                 registry: MetricsRegistry,
+                 model: str | None = None) -> None:
+        self.repo = repo
+        self.registry = registry
+        if model is None:
+            model = str(getattr(repo, 'table_name', type(repo).__name__))
+        self.model = model
+        bind_optional(self, repo)
+
+    def _measure(self, method: str, func: Callable[[], R],
+                 rows: Callable[[R], int], read: bool = False) -> R:
+        if not self.registry.enabled:
+            return func()
+        start = perf_counter()
+        try:
+            result = func()
+        except Exception:
+            self.registry.observe(self.model, method, perf_counter() - start,
+                                  error=True)
+            raise
+        duration = perf_counter() - start
+        nbytes = 0
+        if read and result is not None:
+            nbytes = sum(map(estimate_size, result)) if isinstance(result, list) \
+                else estimate_size(result)
+        self.registry.observe(self.model, method, duration, rows(result), nbytes)
+        return result
+
+    def add(self, obj: T) -> int:
+        return self._measure('add', lambda: self.repo.add(obj), lambda _: 1)
+
+    def get(self, pk: int) -> T | None:
+        obj: T | None = self._measure('get', lambda: self.repo.get(pk), _count_rows,
+                                      read=True)
+        return obj
+
+    def get_all(self,
+                where: dict[str, Any] | None = None,
+                fields: Sequence[str] | None = None,
+                **kwargs: Any) -> list[Any]:
+        return self._measure(
+            'get_all', lambda: self.repo.get_all(where, fields=fields, **kwargs),
+            _count_rows, read=True)
+
+    def update(self, obj: T) -> None:
+        self._measure('update', lambda: self.repo.update(obj), lambda _: 1)
+
+    def delete(self, pk: int) -> None:
+        self._measure('delete', lambda: self.repo.delete(pk), lambda _: 1)
+
+    def add_many(self, objs: Iterable[T]) -> list[int]:
+        batch = list(objs)
+        return self._measure('add_many', lambda: self.repo.add_many(batch),
+                             lambda _: len(batch))
+
+    def update_many(self, objs: Iterable[T]) -> None:
+        batch = list(objs)
+        self._measure('update_many', lambda: self.repo.update_many(batch),
+                      lambda _: len(batch))
+
+    def delete_many(self, pks: Iterable[int]) -> None:
+        batch = list(pks)
+        self._measure('delete_many', lambda: self.repo.delete_many(batch),
+                      lambda _: len(batch))
+
+    def _put_many(self, repo: SupportsPutMany[T], objs: Iterable[T]) -> None:
+        batch = list(objs)
+        self._measure('put_many', lambda: repo.put_many(batch),
+                      lambda _: len(batch))
+
+    def _search(self,
+                repo: Searchable,
+                query: str,
+                limit: int = DEFAULT_SEARCH_LIMIT) -> list[int]:
+        return self._measure('search', lambda: repo.search(query, limit), len)
+
+    def aggregate(self,
+                  func: str,
+                  field: str = 'pk',
+                  where: dict[str, Any] | None = None,
+                  group_by: str | None = None) -> Any:
+        return self._measure(
+            'aggregate', lambda: self.repo.aggregate(func, field, where, group_by),
+            lambda result: len(result) if isinstance(result, dict) else 1)
+
+    def iter_all(self, *args: Any, **kwargs: Any) -> Iterator[T]:
+        """
+        Потоковое чтение: учитывается суммарное время получения всех строк
+        """
+        if not self.registry.enabled:
+            yield from self.repo.iter_all(*args, **kwargs)
+            return
+        rows = nbytes = 0
+        elapsed = 0.0
+        iterator = self.repo.iter_all(*args, **kwargs)
+        while True:
+            start = perf_counter()
+            try:
+                obj = next(iterator)
+            except StopIteration:
+                elapsed += perf_counter() - start
+                break
+            except Exception:
+                self.registry.observe(self.model, 'iter_all',
+                                      elapsed + perf_counter() - start, rows, nbytes,
+                                      error=True)
+                raise
+            elapsed += perf_counter() - start
+            rows += 1
+            nbytes += estimate_size(obj)
+            yield obj
+        self.registry.observe(self.model, 'iter_all', elapsed, rows, nbytes)
+
+    def transaction(self) -> ContextManager[Any]:
+        return self.repo.transaction()
@@ -0,0 +1,205 @@
+"""
+Модуль описывает репозиторий в оперативной памяти с сохранением на диск
+
+Каждое изменение дописывается в журнал (append_log), а состояние
+периодически сохраняется компактным снимком, после чего журнал очищается.
+При открытии загружается снимок и поверх него повторяются записи журнала.
+"""
+import os
+import pickle
+import threading
+from contextlib import contextmanager
+from inspect import get_annotations
+from itertools import count
+from types import TracebackType
+from typing import Any, Callable, Iterable, Iterator, TypeVar
+
+from bookkeeper.repository.append_log import AppendLog, read_frames, write_atomic
+from bookkeeper.repository.memory_repository import MemoryRepository
+from bookkeeper.repository.abstract_repository import T
+
+R = TypeVar('R')
+
+# Записи журнала: (PUT, pk, значения полей) и (DELETE, pk, None);
+# записи снимка: (OBJECTS, [(pk, значения полей), ...]);
+# первая запись журнала и снимка - (FIELDS, последний id, имена полей)
+FIELDS, PUT, DELETE, OBJECTS = 0, 1, 2, 3
+
+# Число объектов в одном кадре снимка
+SNAPSHOT_CHUNK = 10_000
+
+
+def _dumps(record: Any) -> bytes:
+    return pickle.dumps(record, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+class PersistentMemoryRepository(MemoryRepository[T]):
+    """
+    Репозиторий в оперативной памяти, сохраняющий изменения на диск.
+    cls - класс модели (поля берутся из аннотаций, как в SQLiteRepository)
+    path - путь к данным: журнал path.log и снимок path.snapshot
+    fsync - вызывать fsync при фиксации изменений
+    snapshot_every - после стольких записей журнала сохраняется снимок
+    (None - только вызовом snapshot)
+    indexes, range_indexes, text_fields - см. MemoryRepository
+    Метод изменения возвращает управление, когда изменение записано на диск.
+    Одновременные изменения из разных потоков фиксируются одной записью
+    (групповая фиксация), а изменения внутри блока transaction и пакетных
+    методов - одной записью при выходе из них. Откат изменений в памяти
+    при исключении не выполняется.
+    """
+
+    cls: type
+    fields: tuple[str, ...]
+    path: str
+
+    def __init__(self,
+                 cls: type,
+                 path: str,
+                 fsync: bool = True,
+                 snapshot_every: int | None = 100_000,
+                 indexes: Iterable[str] = (),
+                 range_indexes: Iterable[str] = (),
+                 text_fields: Iterable[str] = ()) -> None:
+        super().__init__(indexes, range_indexes, text_fields)
+        self.cls = cls
+        self.fields = tuple(name for name in get_annotations(cls, eval_str=True)
+                            if name != 'pk')
+        self.path = path
+        self.snapshot_every = snapshot_every
+        self._mutex = threading.RLock()
+        self._local = threading.local()
+        self._load(read_frames(self.snapshot_path)[0])
+        self._log = AppendLog(self.log_path, fsync)
+        self._load(self._log.replay())
+        self._counter = count(self._last_pk + 1)
+        if self._log.records == 0:
+            self._log.append(_dumps((FIELDS, self._last_pk, self.fields)))
+
+    @property
+    def log_path(self) -> str:
+        """ Путь к файлу журнала """
+        return f'{self.path}.log'
+
+    @property
+    def snapshot_path(self) -> str:
+        """ Путь к файлу снимка """
+        return f'{self.path}.snapshot'
+
+    def __enter__(self) -> 'PersistentMemoryRepository[T]':
+        return self
+
+    def __exit__(self,
+                 exc_type: type[BaseException] | None,
+                 exc_val: BaseException | None,
+                 exc_tb: TracebackType | None) -> None:
+        self.close()
+
+    def _load(self, payloads: list[bytes]) -> None:
+        fields = self.fields
+        for payload in payloads:
+            record = pickle.loads(payload)
+            if record[0] == FIELDS:
+                _, last_pk, fields = record
+                self._last_pk = max(self._last_pk, last_pk)
+            elif record[0] == PUT:
+                self._load_objects([record[1:]], fields)
+            elif record[0] == DELETE:
+                if record[1] in self._container:
+                    super()._pop(record[1])
+            elif record[0] == OBJECTS:
+                self._load_objects(record[1], fields)
+
+    def _load_objects(self, items: Iterable[tuple[int, tuple[Any, ...]]],
+                      fields: tuple[str, ...]) -> None:
+        current = set(self.fields)
+        for pk, values in items:
+            kwargs = {name: value for name, value in zip(fields, values)
+                      if name in current}
+            super()._store(pk, self.cls(**kwargs, pk=pk))
+            self._last_pk = max(self._last_pk, pk)
+
+    def _store(self, pk: int, obj: T) -> None:
+        super()._store(pk, obj)
+        values = tuple(getattr(obj, name) for name in self.fields)
+        self._log.append(_dumps((PUT, pk, values)))
+
+    def _pop(self, pk: int) -> T:
+        obj = super()._pop(pk)
+        self._log.append(_dumps((DELETE, pk, None)))
+        return obj
+
+    @contextmanager
+    def transaction(self) -> Iterator[None]:
+        """
+        Изменения внутри блока with записываются на диск
+        одной фиксацией при выходе из него
+        """
+        depth = getattr(self._local, 'depth', 0)
+        self._local.depth = depth + 1
+        try:
+            yield
+        finally:
+            self._local.depth = depth
+            if depth == 0:
+                self._commit()
+
+    def _commit(self) -> None:
+        self._log.sync(getattr(self._local, 'seq', 0))
+        if self.snapshot_every is not None \
+                and self._log.records >= self.snapshot_every:
+            self.snapshot()
+
+    def _mutate(self, operation: Callable[..., R], *args: Any) -> R:
+        with self.transaction(), self._mutex:
+            result = operation(self, *args)
+            self._local.seq = self._log.seq
+            return result
+
+    def add(self, obj: T) -> int:
+        return self._mutate(MemoryRepository.add, obj)
+
+    def update(self, obj: T) -> None:
+        self._mutate(MemoryRepository.update, obj)
+
+    def delete(self, pk: int) -> None:
+        self._mutate(MemoryRepository.delete, pk)
+
+    def add_many(self, objs: Iterable[T]) -> list[int]:
+        return self._mutate(MemoryRepository.add_many, objs)
+
+    def update_many(self, objs: Iterable[T]) -> None:
+        self._mutate(MemoryRepository.update_many, objs)
+
+    def delete_many(self, pks: Iterable[int]) -> None:
+        self._mutate(MemoryRepository.delete_many, pks)
+
+    def put_many(self, objs: Iterable[T]) -> None:
+        self._mutate(MemoryRepository.put_many, objs)
+
+    def snapshot(self) -> None:
+        """
+        Сохранить снимок всех объектов и очистить журнал
+        """
+        with self._mutex:
+            items = [(pk, tuple(getattr(obj, name) for name in self.fields))
+                     for pk, obj in self._container.items()]
+            chunks = (_dumps((OBJECTS, items[i:i + SNAPSHOT_CHUNK]))
+                      for i in range(0, len(items), SNAPSHOT_CHUNK))
+            header = _dumps((FIELDS, self._last_pk, self.fields))
+            self._log.sync()
+            write_atomic(self.snapshot_path, [header, *chunks])
+            self._log.truncate()
+            self._log.append(header)
+
+    def close(self) -> None:
+        """ Записать журнал на диск и закрыть его файл """
+        with self._mutex:
+            self._log.close()
+
+    def destroy(self) -> None:
+        """ Закрыть репозиторий и удалить его файлы """
+        self.close()
+        for path in (self.log_path, self.snapshot_path):
+            if os.path.exists(path):
+                os.remove(path)
@@ -0,0 +1,258 @@
+"""
+Модуль описывает свертку старых расходов в сводки по периодам
+
+RollupRepository - обертка над SQLiteRepository расходов. Метод compact
+переносит расходы старше заданной даты в файл архива, а вместо них
+записывает в таблицу сводок суммы по категориям за каждый день или месяц.
+Таблица расходов остается небольшой, поэтому чтение и поиск по диапазонам
+не перебирают старые строки, а агрегаты (в том числе запросы бюджетов)
+объединяют текущие строки со сводками. Агрегаты, которые по сводкам
+посчитать нельзя (по другим полям или условиям), считаются по архиву.
+
+Свертка из командной строки:
+    python -m bookkeeper.repository.rollup_repository --cutoff 2023-01-01
+"""
+import argparse
+import sqlite3
+import sys
+from datetime import datetime
+from functools import partial
+from types import TracebackType
+from typing import Any, ContextManager, Iterable, Iterator, Sequence
+
+from bookkeeper.models.expense import Expense
+from bookkeeper.models.expense_summary import ExpenseSummary
+from bookkeeper.repository.abstract_repository import (
+    AGGREGATES, AbstractRepository, bind_optional, merge_partial, partial_result
+)
+from bookkeeper.repository.sqlite_decoder import value_decoder
+from bookkeeper.repository.sqlite_repository import DB_FILE, SQLiteRepository
+
+ARCHIVE_FILE = 'bookkeeper/databases/archive.sqlite.db'
+
+# Модификаторы даты sqlite, дающие начало периода сводки
+PERIODS = {
+    'day': 'start of day',
+    'month': 'start of month',
+}
+
+# Условия и группировки, которые вычисляются по сводкам
+SUMMARY_FIELDS = {'expense_date': 'period', 'category': 'category'}
+
+
+def period_start(date: datetime, granularity: str) -> datetime:
+    """ Начало дня или месяца, к которому относится date """
+    if granularity not in PERIODS:
+        raise ValueError(f'unknown period {granularity!r}')
+    date = date.replace(hour=0, minute=0, second=0, microsecond=0)
+    return date.replace(day=1) if granularity == 'month' else date
+
+
+class RollupRepository(AbstractRepository[Expense]):
+    """
+    Репозиторий расходов со сверткой старых записей.
+    repo - репозиторий текущих расходов, в его файле создается таблица
+    сводок (summaries); archive_file - файл архива свернутых расходов
+    (archive), id расходов при переносе сохраняются.
+    Чтение (get_all, iter_all, search) и изменения выполняются над текущими
+    расходами, get находит и расход из архива. Свернутые расходы в агрегатах
+    считаются датированными началом своего периода
+    """
+
+    repo: SQLiteRepository[Expense]
+    archive: SQLiteRepository[Expense]
+    summaries: SQLiteRepository[ExpenseSummary]
+    archive_file: str
+
+    def __init__(self, repo: SQLiteRepository[Expense], archive_file: str) -> None:
+        self.repo = repo
+        self.archive_file = archive_file
+        self.archive = SQLiteRepository(Expense, archive_file, indexes=repo.indexes)
+        self.summaries = SQLiteRepository(
+            ExpenseSummary, repo.db_file, indexes=[('period',), ('category',)])
+        # put_many и search (если он есть) выполняются над текущими расходами
+        bind_optional(self, repo)
+
+    def __enter__(self) -> 'RollupRepository':
+        return self
+
+    def __exit__(self,
+                 exc_type: type[BaseException] | None,
+                 exc_val: BaseException | None,
+                 exc_tb: TracebackType | None) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """
+        Закрывает репозитории архива и сводок (repo закрывает владелец)
+        """
+        self.archive.close()
+        self.summaries.close()
+
+    def compact(self, before: datetime, granularity: str = 'day') -> int:
+        """
+        Свернуть расходы за периоды (granularity - 'day' или 'month'),
+        закончившиеся до before: перенести их в архив и записать сводки.
+        Перенос выполняется одной транзакцией с архивом, подключенным
+        к соединению (ATTACH), поэтому его нельзя вызывать внутри транзакции.
+        Расход с наибольшим id не переносится, чтобы sqlite не выдал
+        его id новому расходу. Возвращает число перенесенных расходов
+        """
+        cutoff = period_start(before, granularity)
+        return self.repo.pool.submit(
+            partial(self._compact, cutoff, PERIODS[granularity])).result()
+
+    def _compact(self, cutoff: datetime, modifier: str, con: sqlite3.Connection) -> int:
+        pool = self.repo.pool
+        table = self.repo.table_name
+        columns = ', '.join(('pk', *self.repo.fields))
+        condition = f'expense_date < ? AND pk < (SELECT MAX(pk) FROM main.{table})'
+        pool.execute(con, 'ATTACH DATABASE ? AS archive', (self.archive_file,))
+        try:
+            with pool.transaction():
+                pool.execute(con,
+                             f'INSERT INTO archive.{table} ({columns}) '
+                             f'SELECT {columns} FROM main.{table} WHERE {condition}',
+                             (cutoff,))
+                pool.execute(
+                    con,
+                    f'INSERT INTO main.{self.summaries.table_name} '
+                    '(period, category, amount, count, rows, min_amount, max_amount) '
+                    "SELECT CAST(strftime('%s', expense_date, 'unixepoch', ?) "
+                    'AS INTEGER) AS period, category, SUM(amount), COUNT(amount), '
+                    f'COUNT(*), MIN(amount), MAX(amount) FROM main.{table} '
+                    f'WHERE {condition} '
+                    'GROUP BY period, category',
+                    (modifier, cutoff))
+                moved = pool.execute(con, f'DELETE FROM main.{table} WHERE {condition}',
+                                     (cutoff,)).rowcount
+        finally:
+            pool.execute(con, 'DETACH DATABASE archive')
+        return moved
+
+    def add(self, obj: Expense) -> int:
+        return self.repo.add(obj)
+
+    def get(self, pk: int) -> Expense | None:
+        obj = self.repo.get(pk)
+        return obj if obj is not None else self.archive.get(pk)
+
+    def get_all(self,
+                where: dict[str, Any] | None = None,
+                fields: Sequence[str] | None = None,
+                **kwargs: Any) -> list[Any]:
+        return self.repo.get_all(where, fields=fields, **kwargs)
+
+    def update(self, obj: Expense) -> None:
+        self.repo.update(obj)
+
+    def delete(self, pk: int) -> None:
+        self.repo.delete(pk)
+
+    def add_many(self, objs: Iterable[Expense]) -> list[int]:
+        return self.repo.add_many(objs)
+
+    def update_many(self, objs: Iterable[Expense]) -> None:
+        self.repo.update_many(objs)
+
+    def delete_many(self, pks: Iterable[int]) -> None:
+        self.repo.delete_many(pks)
+
+    def iter_all(self, *args: Any, **kwargs: Any) -> Iterator[Expense]:
+        return self.repo.iter_all(*args, **kwargs)
+
+    def transaction(self) -> ContextManager[Any]:
+        return self.repo.transaction()
+
+    @staticmethod
+    def _partials(repo: SQLiteRepository[Any], selected: str, fields: Sequence[str],
+                  where: dict[str, Any] | None, group_by: str | None) -> list[Any]:
+        """
+        Строки (значение group_by, сумма, число, минимум, максимум) с
+        частичными агрегатами selected по строкам repo, подходящим под where
+        """
+        query, params = repo.queries.select(where, fields)
+        key = 'NULL' if group_by is None else group_by
+        query = f'SELECT {key}, {selected} FROM ({query})'
+        if group_by is not None:
+            query += f' GROUP BY {group_by}'
+        return repo.pool.fetchall(repo.pool.connection(), query, params)
+
+    def _summary_partials(self,
+                          func: str,
+                          field: str,
+                          where: dict[str, Any] | None,
+                          group_by: str | None) -> list[Any] | None:
+        """
+        Частичные агрегаты по сводкам (см. _partials) или None, если
+        по сводкам агрегат не вычисляется
+        """
+        if not set(where or ()) <= set(SUMMARY_FIELDS) \
+                or group_by not in (None, 'category') \
+                or not (field == 'amount' or (field == 'pk' and func == 'count')):
+            return None
+        summary_where = {SUMMARY_FIELDS[name]: value
+                         for name, value in (where or {}).items()}
+        if field == 'amount':
+            columns = ['amount', 'count', 'min_amount', 'max_amount']
+            selected = 'SUM(amount), SUM(count), MIN(min_amount), MAX(max_amount)'
+        else:
+            columns = ['rows']
+            selected = 'NULL, SUM(rows), NULL, NULL'
+        if group_by is not None:
+            columns.append(group_by)
+        return self._partials(self.summaries, selected, columns, summary_where, group_by)
+
+    def aggregate(self,
+                  func: str,
+                  field: str = 'pk',
+                  where: dict[str, Any] | None = None,
+                  group_by: str | None = None) -> Any:
+        """
+        Вычислить агрегат (см. AbstractRepository.aggregate) по текущим
+        расходам и сводкам. Сводки используются для агрегатов суммы расходов
+        и числа расходов с условиями на дату и категорию и группировкой
+        по категории, остальные агрегаты досчитываются по архиву
+        """
+        if func not in AGGREGATES:
+            raise ValueError(f'unknown aggregate function {func!r}')
+        fields = [field] if group_by in (None, field) else [field, group_by]
+        selected = f'SUM({field}), COUNT({field}), MIN({field}), MAX({field})'
+        rows = self._partials(self.repo, selected, fields, where, group_by)
+        summary_rows = self._summary_partials(func, field, where, group_by)
+        if summary_rows is None:
+            summary_rows = self._partials(self.archive, selected, fields, where, group_by)
+        rows += summary_rows
+        partials: dict[Any, list[Any]] = {}
+        for row_key, *values in rows:
+            merge_partial(partials.setdefault(row_key, [None, 0, None, None]), values)
+        decode = value_decoder(self.repo.fields.get(field, int)) \
+            if func in ('min', 'max') else (lambda value: value)
+        if group_by is None:
+            return decode(partial_result(func, partials.get(None, [None, 0, None, None])))
+        decode_key = value_decoder(self.repo.fields.get(group_by, int))
+        return {decode_key(row_key): decode(partial_result(func, values))
+                for row_key, values in partials.items()}
+
+
+def main(argv: Sequence[str] | None = None) -> int:
+    """ Свертка из командной строки, возвращает код завершения """
+    parser = argparse.ArgumentParser(
+        prog='python -m bookkeeper.repository.rollup_repository',
+        description='Свертка старых расходов в сводки')
+    parser.add_argument('--cutoff', required=True, type=datetime.fromisoformat,
+                        help='свернуть расходы за периоды до этой даты (ISO 8601)')
+    parser.add_argument('--granularity', choices=tuple(PERIODS), default='day',
+                        help='период сводок')
+    parser.add_argument('--db', default=DB_FILE, help='файл базы данных')
+    parser.add_argument('--archive', default=ARCHIVE_FILE, help='файл архива')
+    args = parser.parse_args(argv)
+    repo: SQLiteRepository[Expense] = SQLiteRepository(Expense, args.db)
+    with repo, RollupRepository(repo, args.archive) as rollup:
+        moved = rollup.compact(args.cutoff, args.granularity)
+    print(f'moved {moved} expenses to {args.archive}', file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
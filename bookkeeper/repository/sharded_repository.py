@@ -0,0 +1,491 @@
+"""
+Модуль описывает репозиторий sqlite, разделенный на файлы по годам
+
+Записи хранятся в отдельном файле (шарде) на каждый год значения поля-даты,
+а небольшой файл каталога хранит список шардов и таблицу маршрутов
+pk -> год, по которой находятся записи по id и выдаются новые id.
+Запросы с условием на поле-дату подключают к соединению каталога (ATTACH)
+только шарды пересекающихся лет и выполняются одним запросом UNION ALL
+по ним. Шарды прошлых лет можно закрыть для записи (freeze): такие файлы
+подключаются только для чтения и неизменяемыми (immutable), без блокировок,
+а для резервного копирования и кеша ОС они остаются неизменными.
+"""
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from inspect import get_annotations
+from types import TracebackType
+from typing import Any, Callable, Iterable, Iterator, Sequence, TypeVar
+from urllib.request import pathname2url
+
+from bookkeeper.repository.abstract_repository import (
+    AGGREGATES, DEFAULT_BATCH_SIZE, AbstractRepository, T, merge_partial,
+    partial_result, row_type
+)
+from bookkeeper.repository.conditions import Between, Condition, Ge, Gt, Le, Lt
+from bookkeeper.repository.sqlite_connection import SQLiteConnectionPool
+from bookkeeper.repository.sqlite_decoder import (
+    compile_projection_decoder, compile_row_decoder, value_decoder
+)
+from bookkeeper.repository.sqlite_query import QueryBuilder
+from bookkeeper.repository.sqlite_repository import SQLiteRepository
+
+CATALOG_FILE = 'catalog.sqlite.db'
+
+X = TypeVar('X')
+
+# Наибольшее число одновременно подключенных шардов (SQLITE_MAX_ATTACHED
+# по умолчанию - 10)
+MAX_ATTACHED = 10
+
+CATALOG_SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS shard ('
+    'year INTEGER PRIMARY KEY, file TEXT NOT NULL, '
+    'read_only INTEGER NOT NULL DEFAULT 0)',
+    'CREATE TABLE IF NOT EXISTS route (pk INTEGER PRIMARY KEY, year INTEGER NOT NULL)',
+)
+
+
+def year_range(expected: Any) -> tuple[int | None, int | None]:
+    """
+    Годы, в которые может попасть значение даты, удовлетворяющее условию
+    where на нее: (первый, последний), None - без ограничения
+    """
+    if isinstance(expected, Between):
+        return expected.low.year, expected.high.year
+    if isinstance(expected, (Gt, Ge)):
+        return expected.bound.year, None
+    if isinstance(expected, (Lt, Le)):
+        return None, expected.bound.year
+    if isinstance(expected, Condition):
+        return None, None
+    return expected.year, expected.year
+
+
+def _chunks(items: Sequence[Any], size: int) -> Iterable[Sequence[Any]]:
+    return (items[i:i + size] for i in range(0, len(items), size))
+
+
+def _chunks_by_years(items: Iterable[X],
+                     years_of: Callable[[X], set[int]]) -> list[tuple[list[X], set[int]]]:
+    """
+    Разбить items на части, каждая из которых затрагивает не больше
+    MAX_ATTACHED лет (years_of - годы шардов, которые меняет элемент);
+    вернуть пары (элементы части, ее годы)
+    """
+    parts: list[tuple[list[X], set[int]]] = []
+    for item in sorted(items, key=lambda item: min(years_of(item))):
+        years = years_of(item)
+        if not parts or len(parts[-1][1] | years) > MAX_ATTACHED:
+            parts.append(([], set()))
+        parts[-1][0].append(item)
+        parts[-1][1].update(years)
+    return parts
+
+
+class ShardedRepository(AbstractRepository[T]):
+    """
+    Репозиторий, хранящий записи модели cls в файлах sqlite по годам
+    поля-даты shard_field.
+    directory - каталог с файлом каталога (CATALOG_FILE) и шардами
+    <таблица>_<год>.sqlite.db
+    indexes - индексы таблиц шардов (см. SQLiteRepository)
+    Изменения выполняются на соединении каталога с подключенными шардами
+    одной транзакцией вместе с изменением маршрутов, которую sqlite
+    фиксирует атомарно во всех файлах: при ошибке не остается ни строк без
+    маршрутов, ни маршрутов без строк. Пачка, затрагивающая больше
+    MAX_ATTACHED шардов, записывается несколькими такими транзакциями.
+    Чтение идет через то же соединение, подключения переиспользуются
+    запросами потока (не больше MAX_ATTACHED)
+    """
+
+    cls: type
+    directory: str
+    shard_field: str
+    table_name: str
+    fields: dict[str, type]
+
+    def __init__(self,
+                 cls: type,
+                 directory: str,
+                 shard_field: str = 'expense_date',
+                 indexes: list[tuple[str, ...]] | None = None) -> None:
+        self.cls = cls
+        self.directory = directory
+        self.shard_field = shard_field
+        self.table_name = cls.__name__.lower()
+        self.fields = get_annotations(cls, eval_str=True)
+        self.fields.pop('pk')
+        self.queries = QueryBuilder(self.table_name, self.fields)
+        self.decode_row = compile_row_decoder(cls, self.fields)
+        self._projections: dict[tuple[str, ...], Callable[..., Any]] = {}
+        self._indexes = indexes
+        self._shards: dict[int, SQLiteRepository[T]] = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        os.makedirs(directory, exist_ok=True)
+        self._catalog: SQLiteConnectionPool | None = \
+            SQLiteConnectionPool.acquire(os.path.join(directory, CATALOG_FILE))
+        con = self.catalog.connection()
+        for sql in CATALOG_SCHEMA:
+            con.execute(sql)
+        con.commit()
+        self._years: dict[int, bool] = {
+            year: bool(read_only)
+            for year, read_only in con.execute('SELECT year, read_only FROM shard')}
+
+    def __enter__(self) -> 'ShardedRepository[T]':
+        return self
+
+    def __exit__(self,
+                 exc_type: type[BaseException] | None,
+                 exc_val: BaseException | None,
+                 exc_tb: TracebackType | None) -> None:
+        self.close()
+
+    @property
+    def catalog(self) -> SQLiteConnectionPool:
+        """ Пул соединений с файлом каталога """
+        if self._catalog is None:
+            raise RuntimeError(f'repository for {self.table_name} is closed')
+        return self._catalog
+
+    def close(self) -> None:
+        """ Закрыть репозитории шардов и освободить соединения каталога """
+        with self._lock:
+            shards, self._shards = list(self._shards.values()), {}
+        for shard in shards:
+            shard.close()
+        if self._catalog is not None:
+            self._catalog.release()
+            self._catalog = None
+
+    @property
+    def years(self) -> list[int]:
+        """ Годы существующих шардов """
+        return sorted(self._years)
+
+    def shard_path(self, year: int) -> str:
+        """ Путь к файлу шарда года year """
+        return os.path.join(self.directory, f'{self.table_name}_{year}.sqlite.db')
+
+    def _shard(self, year: int) -> SQLiteRepository[T]:
+        """ Репозиторий шарда для записи (шард создается при первой записи) """
+        if self._years.get(year):
+            raise ValueError(f'shard {year} is read-only')
+        with self._lock:
+            shard = self._shards.get(year)
+            if shard is None:
+                shard = SQLiteRepository(self.cls, self.shard_path(year), self._indexes)
+                self._shards[year] = shard
+        if year not in self._years:
+            with self.catalog.transaction() as con:
+                con.execute('INSERT OR IGNORE INTO shard (year, file) VALUES (?, ?)',
+                            (year, os.path.basename(self.shard_path(year))))
+            self._years[year] = False
+        return shard
+
+    def freeze(self, year: int) -> None:
+        """
+        Закрыть шард года year для записи: дальше он подключается
+        только для чтения как неизменяемый файл
+        """
+        if year not in self._years:
+            raise KeyError(year)
+        with self.catalog.transaction() as con:
+            con.execute('UPDATE shard SET read_only = 1 WHERE year = ?', (year,))
+        self._years[year] = True
+        with self._lock:
+            shard = self._shards.pop(year, None)
+        if shard is not None:
+            shard.close()
+        self._detach(self.catalog.connection(), [year])
+
+    def _year(self, obj: T) -> int:
+        year: int = getattr(obj, self.shard_field).year
+        return year
+
+    def _routes(self, pks: Sequence[int]) -> dict[int, int]:
+        """ Годы шардов записей с id pks (отсутствующие id пропускаются) """
+        con = self.catalog.connection()
+        routes: dict[int, int] = {}
+        for chunk in _chunks(pks, DEFAULT_BATCH_SIZE):
+            routes.update(self.catalog.fetchall(
+                con, f'SELECT pk, year FROM route WHERE pk IN '
+                     f'({", ".join("?" * len(chunk))})', chunk))
+        return routes
+
+    def _by_year(self, objs: Iterable[T]) -> dict[int, list[T]]:
+        groups: dict[int, list[T]] = {}
+        for obj in objs:
+            groups.setdefault(self._year(obj), []).append(obj)
+        return groups
+
+    # чтение через подключенные шарды
+
+    def _attached(self) -> dict[int, str]:
+        attached: dict[int, str] | None = getattr(self._local, 'attached', None)
+        if attached is None:
+            attached = self._local.attached = {}
+        return attached
+
+    def _attach(self, con: sqlite3.Connection, years: Sequence[int]) -> list[str]:
+        """
+        Подключить шарды лет years (не больше MAX_ATTACHED) к соединению
+        каталога, отключив давно не использованные; вернуть их схемы
+        """
+        attached = self._attached()
+        for year in years:
+            if year in attached:
+                attached[year] = attached.pop(year)
+        missing = [year for year in years if year not in attached]
+        stale = [year for year in attached if year not in years]
+        self._detach(con, stale[:max(0, len(attached) + len(missing) - MAX_ATTACHED)])
+        for year in missing:
+            uri = 'file:' + pathname2url(os.path.abspath(self.shard_path(year)))
+            uri += '?mode=ro&immutable=1' if self._years[year] else '?mode=rw'
+            con.execute(f'ATTACH DATABASE ? AS shard_{year}', (uri,))
+            attached[year] = f'shard_{year}'
+        return [attached[year] for year in years]
+
+    def _detach(self, con: sqlite3.Connection, years: Iterable[int]) -> None:
+        attached = self._attached()
+        for year in years:
+            if attached.pop(year, None) is not None:
+                con.execute(f'DETACH DATABASE shard_{year}')
+
+    def _overlapping(self, where: dict[str, Any] | None) -> list[int]:
+        """ Годы шардов, в которых могут быть записи, подходящие под where """
+        if where is None or self.shard_field not in where:
+            return self.years
+        expected = where[self.shard_field]
+        if expected is None:
+            return []
+        first, last = year_range(expected)
+        return [year for year in self.years
+                if (first is None or year >= first) and (last is None or year <= last)]
+
+    def _union(self,
+               schemas: Sequence[str],
+               where: dict[str, Any] | None,
+               fields: Sequence[str] | None) -> tuple[str, list[Any]]:
+        """ Запрос UNION ALL одного и того же SELECT к таблицам схем schemas """
+        queries = []
+        params: list[Any] = []
+        for schema in schemas:
+            query, query_params = QueryBuilder(
+                f'{schema}.{self.table_name}', self.fields).select(where, fields)
+            queries.append(query)
+            params += query_params
+        return ' UNION ALL '.join(queries), params
+
+    def _select(self,
+                where: dict[str, Any] | None,
+                fields: Sequence[str] | None,
+                row_factory: Callable[[sqlite3.Cursor, tuple[Any, ...]], Any],
+                years: Sequence[int]) -> list[Any]:
+        con = self.catalog.connection()
+        result: list[Any] = []
+        for chunk in _chunks(years, MAX_ATTACHED):
+            query, params = self._union(self._attach(con, chunk), where, fields)
+            cur = con.cursor()
+            cur.row_factory = row_factory
+            result += self.catalog.fetchall(cur, query, params)
+        return result
+
+    def get(self, pk: int) -> T | None:
+        year = self._routes([pk]).get(pk)
+        if year is None:
+            return None
+        rows = self._select({'pk': pk}, None, self.decode_row, [year])
+        return rows[0] if rows else None
+
+    def get_all(self,
+                where: dict[str, Any] | None = None,
+                fields: Sequence[str] | None = None) -> list[Any]:
+        """
+        Получить записи по условию (см. AbstractRepository.get_all)
+        из шардов, годы которых пересекаются с условием на поле-дату
+        """
+        row_factory = self.decode_row if fields is None else self._projection(fields)
+        return self._select(where, fields, row_factory, self._overlapping(where))
+
+    def _projection(self, fields: Sequence[str]) -> Callable[..., Any]:
+        """ Декодер строк из столбцов fields (см. SQLiteRepository._projection) """
+        columns = self.queries.columns(fields)
+        decode = self._projections.get(columns)
+        if decode is None:
+            annotations = {column: self.fields.get(column, int) for column in columns}
+            decode = compile_projection_decoder(row_type(columns), annotations)
+            self._projections[columns] = decode
+        return decode
+
+    def aggregate(self,
+                  func: str,
+                  field: str = 'pk',
+                  where: dict[str, Any] | None = None,
+                  group_by: str | None = None) -> Any:
+        """
+        Вычислить агрегат (см. AbstractRepository.aggregate): по каждой
+        группе подключенных шардов считаются сумма, число, минимум и максимум
+        одним запросом, затем они объединяются
+        """
+        if func not in AGGREGATES:
+            raise ValueError(f'unknown aggregate function {func!r}')
+        fields = [field] if group_by in (None, field) else [field, group_by]
+        key = 'NULL' if group_by is None else group_by
+        con = self.catalog.connection()
+        partials: dict[Any, list[Any]] = {}
+        for chunk in _chunks(self._overlapping(where), MAX_ATTACHED):
+            query, params = self._union(self._attach(con, chunk), where, fields)
+            query = (f'SELECT {key}, SUM({field}), COUNT({field}), MIN({field}), '
+                     f'MAX({field}) FROM ({query})')
+            if group_by is not None:
+                query += f' GROUP BY {group_by}'
+            for row_key, *values in self.catalog.fetchall(con, query, params):
+                merge_partial(partials.setdefault(row_key, [None, 0, None, None]), values)
+        decode = value_decoder(self.fields.get(field, int)) \
+            if func in ('min', 'max') else (lambda value: value)
+        if group_by is None:
+            return decode(partial_result(func, partials.get(None, [None, 0, None, None])))
+        decode_key = value_decoder(self.fields.get(group_by, int))
+        return {decode_key(row_key): decode(partial_result(func, values))
+                for row_key, values in partials.items()}
+
+    # запись через подключенные шарды
+
+    @contextmanager
+    def _writing(self, years: Iterable[int]) -> Iterator[
+            tuple[sqlite3.Connection, dict[int, QueryBuilder]]]:
+        """
+        Транзакция каталога, в которой к его соединению подключены шарды
+        лет years (не больше MAX_ATTACHED, шарды создаются при необходимости).
+        Возвращает соединение и построители запросов к таблицам шардов
+        """
+        years = sorted(years)
+        for year in years:
+            self._shard(year)
+        con = self.catalog.connection()
+        schemas = self._attach(con, years)
+        with self.catalog.transaction():
+            yield con, {year: QueryBuilder(f'{schema}.{self.table_name}', self.fields)
+                        for year, schema in zip(years, schemas)}
+
+    def _put(self, con: sqlite3.Connection, table: QueryBuilder, objs: list[T]) -> None:
+        self.catalog.executemany(
+            con, table.upsert(),
+            ([obj.pk, *(getattr(obj, field) for field in self.fields)] for obj in objs))
+
+    def _delete(self,
+                con: sqlite3.Connection,
+                table: QueryBuilder,
+                pks: list[int]) -> None:
+        self.catalog.executemany(con, table.delete(), ((pk,) for pk in pks))
+
+    def _insert(self, part: list[T], years: set[int], numbered: list[T]) -> None:
+        """
+        Добавить часть part пачки одной транзакцией; объектам numbered
+        (всей пачке при записи первой части) сначала выдаются id
+        """
+        with self._writing(years) as (con, tables):
+            if numbered:
+                first_pk = con.execute(
+                    'SELECT COALESCE(MAX(pk), 0) FROM route').fetchone()[0] + 1
+                for pk, obj in enumerate(numbered, first_pk):
+                    obj.pk = pk
+            # id, уже занятый другой записью, нарушит PRIMARY KEY маршрутов
+            con.executemany('INSERT INTO route (pk, year) VALUES (?, ?)',
+                            ((obj.pk, self._year(obj)) for obj in part))
+            for year, group in self._by_year(part).items():
+                self._put(con, tables[year], group)
+
+    def add(self, obj: T) -> int:
+        return self.add_many([obj])[0]
+
+    def add_many(self, objs: Iterable[T]) -> list[int]:
+        """
+        Добавить объекты: id выдаются каталогом подряд после наибольшего,
+        объекты записываются в шарды своих лет. Если запись не удалась,
+        id остаются только у объектов уже зафиксированных частей пачки
+        """
+        batch = list(objs)
+        for obj in batch:
+            if getattr(obj, 'pk', None) != 0:
+                raise ValueError(f'trying to add object {obj} with filled `pk` attribute')
+        written: set[int] = set()
+        try:
+            for part, years in _chunks_by_years(batch, lambda obj: {self._year(obj)}):
+                self._insert(part, years, [] if written else batch)
+                written.update(map(id, part))
+        except BaseException:
+            for obj in batch:
+                if id(obj) not in written:
+                    obj.pk = 0
+            raise
+        return [obj.pk for obj in batch]
+
+    def update(self, obj: T) -> None:
+        self.update_many([obj])
+
+    def update_many(self, objs: Iterable[T]) -> None:
+        """
+        Обновить объекты; объект, дата которого перешла в другой год,
+        переносится в шард этого года
+        """
+        batch = list(objs)
+        if any(obj.pk == 0 for obj in batch):
+            raise ValueError('attempt to update object with unknown primary key')
+        routes = self._routes([obj.pk for obj in batch])
+        for obj in batch:
+            if obj.pk not in routes:
+                raise KeyError(obj.pk)
+        self._write(batch, routes)
+
+    def put_many(self, objs: Iterable[T]) -> None:
+        """
+        Записать объекты с назначенными id (см. SupportsPutMany)
+        """
+        batch = list(objs)
+        if any(obj.pk == 0 for obj in batch):
+            raise ValueError('attempt to put object with unknown primary key')
+        self._write(batch, self._routes([obj.pk for obj in batch]))
+
+    def _write(self, batch: list[T], routes: dict[int, int]) -> None:
+        """
+        Записать объекты в шарды их лет; объект, год которого изменился,
+        удаляется из прежнего шарда в той же транзакции
+        """
+        def years_of(obj: T) -> set[int]:
+            return {self._year(obj), routes.get(obj.pk, self._year(obj))}
+
+        for part, years in _chunks_by_years(batch, years_of):
+            with self._writing(years) as (con, tables):
+                con.executemany('INSERT OR REPLACE INTO route (pk, year) VALUES (?, ?)',
+                                ((obj.pk, self._year(obj)) for obj in part))
+                moved: dict[int, list[int]] = {}
+                for year, group in self._by_year(part).items():
+                    self._put(con, tables[year], group)
+                    for obj in group:
+                        if routes.get(obj.pk, year) != year:
+                            moved.setdefault(routes[obj.pk], []).append(obj.pk)
+                for year, pks in moved.items():
+                    self._delete(con, tables[year], pks)
+
+    def delete(self, pk: int) -> None:
+        self.delete_many([pk])
+
+    def delete_many(self, pks: Iterable[int]) -> None:
+        batch = list(dict.fromkeys(pks))
+        routes = self._routes(batch)
+        for pk in batch:
+            if pk not in routes:
+                raise KeyError(pk)
+        for part, years in _chunks_by_years(batch, lambda pk: {routes[pk]}):
+            with self._writing(years) as (con, tables):
+                con.executemany('DELETE FROM route WHERE pk = ?', ((pk,) for pk in part))
+                groups: dict[int, list[int]] = {}
+                for pk in part:
+                    groups.setdefault(routes[pk], []).append(pk)
+                for year, group in groups.items():
+                    self._delete(con, tables[year], group)
@@ -0,0 +1,312 @@
+"""
+Модуль описывает пул соединений с файлом базы данных sqlite
+
+Соединение с СУБД открывается один раз для каждого потока и переиспользуется
+всеми репозиториями, работающими с одним и тем же файлом, вместо того чтобы
+открываться и закрываться на каждую операцию.
+В режиме WAL пул дополнительно держит фоновый поток записи (SQLiteWriter):
+все изменения выполняются им по очереди, а читатели не блокируются.
+"""
+import os
+import queue
+import sqlite3
+import threading
+from concurrent.futures import Future
+from contextlib import AbstractContextManager, contextmanager, nullcontext
+from time import perf_counter
+from typing import Any, Callable, ClassVar, Iterable, Iterator, TypeVar
+
+from bookkeeper.repository.sqlite_profiler import QueryProfiler
+
+
+MEMORY_DB = ':memory:'
+WAL_SYNCHRONOUS = 'NORMAL'
+
+R = TypeVar('R')
+
+
+class SQLiteWriter:
+    """
+    Фоновый поток записи. Операции (функции от соединения) ставятся
+    в очередь методом submit и выполняются по одной на собственном
+    соединении потока, результат возвращается через Future
+    """
+
+    def __init__(self, pool: 'SQLiteConnectionPool') -> None:
+        self._pool = pool
+        self._queue: queue.Queue[tuple[Callable[[sqlite3.Connection], Any],
+                                       Future[Any]] | None] = queue.Queue()
+        self._thread = threading.Thread(
+            target=self._run, name=f'sqlite-writer:{pool.db_file}', daemon=True)
+        self._thread.start()
+
+    @property
+    def thread(self) -> threading.Thread:
+        """ Поток, выполняющий запись """
+        return self._thread
+
+    def submit(self, operation: Callable[[sqlite3.Connection], R]) -> Future[R]:
+        """
+        Поставить операцию записи в очередь
+        """
+        future: Future[R] = Future()
+        self._queue.put((operation, future))
+        return future
+
+    def _run(self) -> None:
+        while (task := self._queue.get()) is not None:
+            operation, future = task
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(operation(self._pool.connection()))
+            except Exception as ex:  # pylint: disable=broad-except
+                future.set_exception(ex)
+
+    def stop(self) -> None:
+        """
+        Выполнить уже поставленные в очередь операции и остановить поток
+        """
+        self._queue.put(None)
+        self._thread.join()
+
+
+def _connection_of(target: sqlite3.Connection | sqlite3.Cursor) -> sqlite3.Connection:
+    if isinstance(target, sqlite3.Cursor):
+        return target.connection
+    return target
+
+
+class SQLiteConnectionPool:
+    """
+    Пул долгоживущих соединений с файлом базы данных (по одному на поток).
+    Пулы регистрируются по пути к файлу, поэтому все репозитории одного
+    файла разделяют общие соединения. Владельцы получают пул методом acquire
+    и отдают методом release, пул закрывается после ухода последнего владельца.
+    wal - включен ли режим журнала WAL; в этом режиме у пула есть
+    фоновый поток записи writer
+    Изменения выполняются внутри transaction: вложенные транзакции одного
+    потока объединяются с внешней и фиксируются один раз при выходе из нее.
+    Запросы репозиториев выполняются методами execute, executemany и fetchall;
+    если к пулу подключен профилировщик (profiler), они учитываются им.
+    База данных в памяти (':memory:') существует, пока открыто ее соединение,
+    поэтому все потоки пула работают с ней через одно соединение, а запросы
+    и транзакции потоков выполняются по очереди под общей блокировкой.
+    """
+
+    _pools: ClassVar[dict[str, 'SQLiteConnectionPool']] = {}
+    _registry_lock: ClassVar[threading.Lock] = threading.Lock()
+
+    db_file: str
+    wal: bool
+    writer: SQLiteWriter | None
+    profiler: QueryProfiler | None
+
+    def __init__(self, db_file: str) -> None:
+        self.db_file = db_file
+        # очередь потоков к общему соединению базы в памяти
+        self._serial: AbstractContextManager[Any] = \
+            threading.RLock() if db_file == MEMORY_DB else nullcontext()
+        self.wal = False
+        self.writer = None
+        self.profiler = None
+        self._local = threading.local()
+        self._connections: list[sqlite3.Connection] = []
+        self._lock = threading.Lock()
+        self._refs = 0
+
+    @staticmethod
+    def _key(db_file: str) -> str:
+        if db_file == MEMORY_DB:
+            return db_file
+        return os.path.abspath(db_file)
+
+    @classmethod
+    def acquire(cls, db_file: str, wal: bool = False) -> 'SQLiteConnectionPool':
+        """
+        Получить пул для файла базы данных (создается при первом обращении)
+        и увеличить число его владельцев.
+        wal - включить для файла режим WAL с фоновым потоком записи
+        """
+        key = cls._key(db_file)
+        with cls._registry_lock:
+            pool = cls._pools.get(key)
+            if pool is None:
+                pool = cls(db_file)
+                cls._pools[key] = pool
+            pool._refs += 1
+            if wal and not pool.wal:
+                pool.enable_wal()
+        return pool
+
+    def enable_wal(self) -> None:
+        """
+        Перевести файл в режим журнала WAL с synchronous=NORMAL
+        и запустить фоновый поток записи
+        """
+        self.connection().execute('PRAGMA journal_mode = WAL')
+        with self._lock:
+            self.wal = True
+            for con in self._connections:
+                con.execute(f'PRAGMA synchronous = {WAL_SYNCHRONOUS}')
+        self.writer = SQLiteWriter(self)
+
+    def release(self) -> None:
+        """
+        Освободить пул. Когда владельцев не остается, все соединения закрываются
+        """
+        key = self._key(self.db_file)
+        with self._registry_lock:
+            self._refs -= 1
+            if self._refs > 0:
+                return
+            if self._pools.get(key) is self:
+                del self._pools[key]
+        self.close()
+
+    def connection(self) -> sqlite3.Connection:
+        """
+        Вернуть соединение текущего потока, открыв его при необходимости
+        """
+        con: sqlite3.Connection | None = getattr(self._local, 'con', None)
+        if con is None:
+            with self._lock:
+                if self.db_file == MEMORY_DB and self._connections:
+                    con = self._connections[0]
+                else:
+                    con = self._connect()
+                    self._connections.append(con)
+            self._local.con = con
+        return con
+
+    def _connect(self) -> sqlite3.Connection:
+        # соединения закрываются из того потока, который освобождает пул
+        # uri=True позволяет подключать файлы по URI (ATTACH 'file:...?mode=ro');
+        # обычные пути к файлам при этом понимаются как прежде
+        con = sqlite3.connect(self.db_file, check_same_thread=False,
+                              detect_types=sqlite3.PARSE_DECLTYPES, uri=True)
+        con.execute('PRAGMA foreign_keys = ON')
+        if self.wal:
+            con.execute(f'PRAGMA synchronous = {WAL_SYNCHRONOUS}')
+        return con
+
+    def in_transaction(self) -> bool:
+        """
+        Открыта ли транзакция transaction в текущем потоке
+        """
+        return getattr(self._local, 'depth', 0) > 0
+
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        """
+        Транзакция на соединении текущего потока. Внешняя транзакция сразу
+        берет блокировку на запись и фиксируется (или откатывается при
+        исключении) при выходе, вложенные становятся ее частью
+        """
+        con = self.connection()
+        depth = getattr(self._local, 'depth', 0)
+        with self._serial:
+            if depth == 0 and not con.in_transaction:
+                con.execute('BEGIN IMMEDIATE')
+            self._local.depth = depth + 1
+            try:
+                yield con
+            except BaseException:
+                if depth == 0:
+                    con.rollback()
+                raise
+            else:
+                if depth == 0:
+                    con.commit()
+            finally:
+                self._local.depth = depth
+
+    def execute(self,
+                target: sqlite3.Connection | sqlite3.Cursor,
+                sql: str,
+                params: Any = ()) -> sqlite3.Cursor:
+        """
+        Выполнить запрос на соединении или курсоре target
+        """
+        profiler = self.profiler
+        with self._serial:
+            if profiler is None:
+                return target.execute(sql, params)
+            profiler.capture_plan(_connection_of(target), sql, params)
+            start = perf_counter()
+            try:
+                return target.execute(sql, params)
+            finally:
+                profiler.record(sql, perf_counter() - start)
+
+    def executemany(self,
+                    target: sqlite3.Connection | sqlite3.Cursor,
+                    sql: str,
+                    seq_of_params: Iterable[Any]) -> sqlite3.Cursor:
+        """
+        Выполнить запрос для каждого набора параметров (см. execute)
+        """
+        profiler = self.profiler
+        with self._serial:
+            if profiler is None:
+                return target.executemany(sql, seq_of_params)
+            batch = list(seq_of_params)
+            if batch:
+                profiler.capture_plan(_connection_of(target), sql, batch[0])
+            start = perf_counter()
+            try:
+                return target.executemany(sql, batch)
+            finally:
+                profiler.record(sql, perf_counter() - start)
+
+    def fetchall(self,
+                 target: sqlite3.Connection | sqlite3.Cursor,
+                 sql: str,
+                 params: Any = ()) -> list[Any]:
+        """
+        Выполнить запрос и прочитать все строки результата; профилировщик
+        учитывает время выполнения вместе с чтением
+        """
+        profiler = self.profiler
+        with self._serial:
+            if profiler is None:
+                return target.execute(sql, params).fetchall()
+            profiler.capture_plan(_connection_of(target), sql, params)
+            start = perf_counter()
+            try:
+                return target.execute(sql, params).fetchall()
+            finally:
+                profiler.record(sql, perf_counter() - start)
+
+    def submit(self, operation: Callable[[sqlite3.Connection], R]) -> Future[R]:
+        """
+        Выполнить операцию записи: в режиме WAL - в фоновом потоке записи,
+        иначе - сразу на соединении текущего потока.
+        Внутри transaction операция всегда выполняется в текущем потоке,
+        чтобы стать частью открытой транзакции.
+        Результат (или исключение) возвращается через Future
+        """
+        writer = self.writer
+        if writer is not None and threading.current_thread() is not writer.thread \
+                and not self.in_transaction():
+            return writer.submit(operation)
+        future: Future[R] = Future()
+        try:
+            future.set_result(operation(self.connection()))
+        except Exception as ex:  # pylint: disable=broad-except
+            future.set_exception(ex)
+        return future
+
+    def close(self) -> None:
+        """
+        Закрыть все открытые пулом соединения, дождавшись завершения
+        поставленных в очередь операций записи
+        """
+        if self.writer is not None:
+            self.writer.stop()
+            self.writer = None
+        with self._lock:
+            connections, self._connections = self._connections, []
+            self._local = threading.local()
+        for con in connections:
+            con.close()
@@ -0,0 +1,99 @@
+"""
+Модуль описывает декодер строк sqlite в объекты модели
+
+Декодер генерируется один раз для модели: строка распаковывается в локальные
+переменные, значения приводятся к типам из аннотаций модели и сразу
+передаются в конструктор, без промежуточных словарей для каждой строки.
+"""
+import sqlite3
+from datetime import datetime, timedelta
+from typing import Any, Callable, Iterable
+
+from bookkeeper.repository.sqlite_schema import EPOCH, field_type
+
+
+def decode_datetime(value: Any) -> datetime:
+    """
+    Привести значение столбца с датой к datetime
+    """
+    if isinstance(value, datetime):
+        return value
+    if isinstance(value, int):
+        return EPOCH + timedelta(seconds=value)
+    return datetime.fromisoformat(value)
+
+
+# Приведение значений столбцов к типам полей модели
+DECODERS: dict[Any, Callable[[Any], Any]] = {
+    float: float,
+    datetime: decode_datetime,
+}
+
+
+def value_decoder(annotation: Any) -> Callable[[Any], Any]:
+    """
+    Приведение отдельного значения столбца (вне строки модели,
+    например результата агрегата) к типу из аннотации
+    """
+    decoder = DECODERS.get(field_type(annotation))
+    if decoder is None:
+        return lambda value: value
+    return lambda value: None if value is None else decoder(value)
+
+
+def _decoded(namespace: dict[str, Any],
+             annotations: Iterable[Any],
+             variables: list[str]) -> list[str]:
+    """
+    Выражения, приводящие переменные строки к типам из аннотаций
+    """
+    exprs = []
+    for var, annotation in zip(variables, annotations):
+        decoder = DECODERS.get(field_type(annotation))
+        if decoder is None:
+            exprs.append(var)
+        else:
+            namespace[f'decode_{var}'] = decoder
+            exprs.append(f'None if {var} is None else decode_{var}({var})')
+    return exprs
+
+
+def _compile(
+        source: str,
+        namespace: dict[str, Any]) -> Callable[[sqlite3.Cursor, tuple[Any, ...]], Any]:
+    exec(source, namespace)  # pylint: disable=exec-used
+    decode: Callable[[sqlite3.Cursor, tuple[Any, ...]], Any] = namespace['decode']
+    return decode
+
+
+def compile_row_decoder(
+        cls: type,
+        fields: dict[str, Any]) -> Callable[[sqlite3.Cursor, tuple[Any, ...]], Any]:
+    """
+    Сгенерировать функцию-декодер строки (pk, *fields) в объект cls.
+    Функция имеет сигнатуру row_factory курсора sqlite3
+    """
+    namespace: dict[str, Any] = {'cls': cls}
+    names = [f'v{i}' for i in range(len(fields) + 1)]
+    exprs = _decoded(namespace, fields.values(), names[1:])
+    args = [f'{name}={expr}' for name, expr in zip(fields, exprs)]
+    source = (f'def decode(cursor, row):\n'
+              f'    {", ".join(names)}, = row\n'
+              f'    return cls({", ".join(args)}, pk=v0)\n')
+    return _compile(source, namespace)
+
+
+def compile_projection_decoder(
+        row_cls: type,
+        fields: dict[str, Any]) -> Callable[[sqlite3.Cursor, tuple[Any, ...]], Any]:
+    """
+    Сгенерировать функцию-декодер строки из столбцов fields
+    в кортеж row_cls (см. abstract_repository.row_type)
+    """
+    namespace: dict[str, Any] = {'row_cls': row_cls}
+    names = [f'v{i}' for i in range(len(fields))]
+    exprs = _decoded(namespace, fields.values(), names)
+    source = (f'def decode(cursor, row):\n'
+              f'    {", ".join(names)}, = row\n'
+              f'    return row_cls({", ".join(exprs)})\n')
+    return _compile(source, namespace)
@@ -0,0 +1,142 @@
+"""
+Модуль описывает профилировщик запросов к sqlite
+
+Профилировщик подключается к пулу соединений (SQLiteConnectionPool.profiler)
+и получает время выполнения каждого запроса, который репозитории выполняют
+через пул. Медленные запросы пишутся в журнал (logging), для каждого нового
+текста запроса один раз снимается план EXPLAIN QUERY PLAN, а по каждому
+тексту запроса накапливается статистика времени выполнения.
+"""
+import logging
+import sqlite3
+import threading
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Sequence
+
+logger = logging.getLogger(__name__)
+
+# Запросы, для которых снимается план
+EXPLAINED = ('SELECT', 'INSERT', 'UPDATE', 'DELETE', 'WITH', 'REPLACE')
+
+
+def percentile(samples: Sequence[float], share: float) -> float:
+    """
+    Перцентиль выборки (ближайший ранг), 0 для пустой выборки
+    """
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    rank = max(0, min(len(ordered) - 1, round(share * len(ordered)) - 1))
+    return ordered[rank]
+
+
+@dataclass
+class QueryStats:
+    """
+    Статистика запроса: число выполнений (count), суммарное время (total),
+    последние sample_size времен выполнения (samples) для перцентилей
+    и план запроса (plan, строки detail из EXPLAIN QUERY PLAN)
+    """
+    count: int = 0
+    total: float = 0.0
+    samples: deque[float] = field(default_factory=lambda: deque(maxlen=1024))
+    plan: list[str] = field(default_factory=list)
+
+    @property
+    def p50(self) -> float:
+        """ Медиана времени выполнения """
+        return percentile(self.samples, 0.5)
+
+    @property
+    def p95(self) -> float:
+        """ 95-й перцентиль времени выполнения """
+        return percentile(self.samples, 0.95)
+
+    @property
+    def full_scan(self) -> bool:
+        """ Читает ли запрос таблицу целиком (SCAN без индекса) """
+        return any(step.startswith('SCAN') and 'INDEX' not in step
+                   for step in self.plan)
+
+
+class QueryProfiler:
+    """
+    Профилировщик запросов.
+    slow_threshold - время в секундах, начиная с которого запрос
+    записывается в журнал как медленный
+    explain - снимать план для новых текстов запросов
+    sample_size - число последних времен, по которым считаются перцентили
+    """
+
+    def __init__(self,
+                 slow_threshold: float = 0.1,
+                 explain: bool = True,
+                 sample_size: int = 1024) -> None:
+        self.slow_threshold = slow_threshold
+        self.explain = explain
+        self.sample_size = sample_size
+        self._stats: dict[str, QueryStats] = {}
+        self._lock = threading.Lock()
+
+    def is_new(self, sql: str) -> bool:
+        """ Не встречался ли еще запрос с таким текстом """
+        return sql not in self._stats
+
+    def capture_plan(self, con: sqlite3.Connection, sql: str, params: Any) -> None:
+        """
+        Снять план запроса, если он еще не снят
+        """
+        if not self.explain or not self.is_new(sql) \
+                or not sql.lstrip().upper().startswith(EXPLAINED):
+            return
+        try:
+            rows = con.execute(f'EXPLAIN QUERY PLAN {sql}', params).fetchall()
+        except sqlite3.Error:
+            return
+        plan = [row[-1] for row in rows]
+        with self._lock:
+            stats = self._stats.setdefault(sql, self._new_stats())
+            stats.plan = plan
+        if stats.full_scan:
+            logger.info('full table scan: %s; plan: %s', sql, '; '.join(plan))
+
+    def _new_stats(self) -> QueryStats:
+        return QueryStats(samples=deque(maxlen=self.sample_size))
+
+    def record(self, sql: str, duration: float) -> None:
+        """
+        Учесть выполнение запроса за duration секунд
+        """
+        with self._lock:
+            stats = self._stats.setdefault(sql, self._new_stats())
+            stats.count += 1
+            stats.total += duration
+            stats.samples.append(duration)
+        if duration >= self.slow_threshold:
+            logger.warning('slow query (%.3f s): %s', duration, sql)
+
+    def stats(self, sql: str) -> QueryStats:
+        """ Статистика запроса с текстом sql """
+        with self._lock:
+            return self._stats.get(sql) or self._new_stats()
+
+    def report(self) -> dict[str, dict[str, Any]]:
+        """
+        Сводка по всем запросам: {текст запроса: {count, total, p50, p95,
+        full_scan, plan}}, от запросов с наибольшим суммарным временем
+        """
+        with self._lock:
+            items = sorted(self._stats.items(), key=lambda item: -item[1].total)
+        return {sql: {'count': stats.count,
+                      'total': stats.total,
+                      'p50': stats.p50,
+                      'p95': stats.p95,
+                      'full_scan': stats.full_scan,
+                      'plan': list(stats.plan)}
+                for sql, stats in items if stats.count}
+
+    def reset(self) -> None:
+        """ Сбросить накопленную статистику и планы """
+        with self._lock:
+            self._stats.clear()
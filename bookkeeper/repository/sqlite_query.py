@@ -0,0 +1,259 @@
+"""
+Модуль описывает построитель параметризованных SQL-запросов для SQLiteRepository
+
+Значения попадают в запрос только через параметры (?), поэтому текст запроса
+зависит лишь от таблицы и набора полей. Тексты запросов кешируются, а sqlite3
+находит готовые подготовленные выражения в своем кеше вместо повторного
+разбора SQL при каждом вызове.
+"""
+from functools import lru_cache
+from typing import Any, Iterable
+
+from bookkeeper.repository.conditions import Condition
+from bookkeeper.repository.sqlite_schema import fts_table
+
+# Форма условия WHERE: пары (поле, оператор) без значений
+Shape = tuple[tuple[str, str], ...]
+
+_CONDITIONS = {
+    'eq': '{column} = ?',
+    'null': '{column} IS NULL',
+    'gt': '{column} > ?',
+    'ge': '{column} >= ?',
+    'lt': '{column} < ?',
+    'le': '{column} <= ?',
+    'between': '{column} BETWEEN ? AND ?',
+    # условия keyset-пагинации (NULL в sqlite упорядочен перед всеми значениями)
+    'after': '({column}, pk) > (?, ?)',
+    'after_null': '({column} IS NOT NULL OR pk > ?)',
+    'not_null': '{column} IS NOT NULL',
+    'before': '(({column}, pk) < (?, ?) OR {column} IS NULL)',
+    'before_value': '({column} < ? OR {column} IS NULL)',
+    'before_null': '({column} IS NULL AND pk < ?)',
+    'none': '0',
+}
+
+
+@lru_cache(maxsize=1024)
+def _where_sql(shape: Shape) -> str:
+    if not shape:
+        return ''
+    return ' WHERE ' + ' AND '.join(
+        _CONDITIONS[op].format(column=column) for column, op in shape)
+
+
+@lru_cache(maxsize=1024)
+def _select_sql(table_name: str,
+                columns: tuple[str, ...],
+                shape: Shape,
+                order: tuple[str, bool] | None = None) -> str:
+    sql = f'SELECT {", ".join(columns)} FROM {table_name}' + _where_sql(shape)
+    if order is not None:
+        column, descending = order
+        direction = 'DESC' if descending else 'ASC'
+        sql += f' ORDER BY {column} {direction}'
+        if column != 'pk':
+            sql += f', pk {direction}'
+    return sql
+
+
+def _keyset(column: str,
+            after: Any,
+            after_pk: int | None,
+            descending: bool) -> tuple[str, list[Any]]:
+    """
+    Условие keyset-пагинации: оператор и параметры (см. iter_all)
+    """
+    if column == 'pk':
+        bound = after_pk if after_pk is not None else after
+        return ('lt' if descending else 'gt'), [bound]
+    if after is not None:
+        if after_pk is not None:
+            return ('before' if descending else 'after'), [after, after_pk]
+        return ('before_value' if descending else 'gt'), [after]
+    if after_pk is not None:
+        return ('before_null' if descending else 'after_null'), [after_pk]
+    return ('none' if descending else 'not_null'), []
+
+
+_AGGREGATES = {
+    'sum': 'SUM',
+    'count': 'COUNT',
+    'min': 'MIN',
+    'max': 'MAX',
+    'avg': 'AVG',
+}
+
+
+@lru_cache(maxsize=256)
+def _aggregate_sql(table_name: str,
+                   func: str,
+                   column: str,
+                   shape: Shape,
+                   group_by: str | None) -> str:
+    selected = f'{_AGGREGATES[func]}({column})'
+    if group_by is None:
+        return f'SELECT {selected} FROM {table_name}' + _where_sql(shape)
+    return (f'SELECT {group_by}, {selected} FROM {table_name}' + _where_sql(shape)
+            + f' GROUP BY {group_by}')
+
+
+@lru_cache(maxsize=256)
+def _insert_sql(table_name: str, columns: tuple[str, ...], verb: str = 'INSERT') -> str:
+    placeholders = ', '.join('?' * len(columns))
+    return f'{verb} INTO {table_name} ({", ".join(columns)}) VALUES ({placeholders})'
+
+
+@lru_cache(maxsize=256)
+def _upsert_sql(table_name: str, columns: tuple[str, ...]) -> str:
+    assignments = ', '.join(f'{column} = excluded.{column}' for column in columns)
+    return (_insert_sql(table_name, ('pk', *columns))
+            + f' ON CONFLICT (pk) DO UPDATE SET {assignments}')
+
+
+@lru_cache(maxsize=256)
+def _search_sql(table_name: str) -> str:
+    fts = fts_table(table_name)
+    return f'SELECT rowid FROM {fts} WHERE {fts} MATCH ? ORDER BY rank LIMIT ?'
+
+
+@lru_cache(maxsize=256)
+def _update_sql(table_name: str, columns: tuple[str, ...]) -> str:
+    assignments = ', '.join(f'{column} = ?' for column in columns)
+    return f'UPDATE {table_name} SET {assignments} WHERE pk = ?'
+
+
+@lru_cache(maxsize=256)
+def _delete_sql(table_name: str) -> str:
+    return f'DELETE FROM {table_name} WHERE pk = ?'
+
+
+class QueryBuilder:
+    """
+    Построитель запросов к одной таблице.
+    table_name - имя таблицы
+    fields - имена столбцов таблицы, кроме pk
+    Методы возвращают текст запроса, а методы с условием - еще и список
+    параметров к нему. Запросы выборки перечисляют столбцы (pk, *fields)
+    явно, в порядке, на который рассчитан декодер строк.
+    """
+
+    table_name: str
+    fields: tuple[str, ...]
+
+    def __init__(self, table_name: str, fields: Iterable[str]) -> None:
+        self.table_name = table_name
+        self.fields = tuple(fields)
+        self._selected = ('pk', *self.fields)
+        self._columns = frozenset(self._selected)
+
+    def where(self, where: dict[str, Any] | None) -> tuple[Shape, list[Any]]:
+        """
+        Разобрать условие {'название_поля': значение} на форму и параметры.
+        Значение None означает проверку IS NULL, объект Condition -
+        соответствующее сравнение (см. conditions)
+        """
+        shape = []
+        params = []
+        for column, value in (where or {}).items():
+            if column not in self._columns:
+                raise ValueError(f'unknown field {column!r} in table {self.table_name}')
+            if value is None:
+                shape.append((column, 'null'))
+            elif isinstance(value, Condition):
+                shape.append((column, value.op))
+                params.extend(value.params())
+            else:
+                shape.append((column, 'eq'))
+                params.append(value)
+        return tuple(shape), params
+
+    def select(self,
+               where: dict[str, Any] | None = None,
+               fields: Iterable[str] | None = None) -> tuple[str, list[Any]]:
+        """
+        Запрос всех строк, удовлетворяющих условию.
+        fields - выбрать только эти столбцы (по умолчанию pk и все поля)
+        """
+        shape, params = self.where(where)
+        columns = self._selected if fields is None else self.columns(fields)
+        return _select_sql(self.table_name, columns, shape), params
+
+    def columns(self, fields: Iterable[str]) -> tuple[str, ...]:
+        """ Проверить имена столбцов таблицы """
+        columns = tuple(fields)
+        for column in columns:
+            if column not in self._columns:
+                raise ValueError(f'unknown field {column!r} in table {self.table_name}')
+        return columns
+
+    def select_ordered(self,
+                       where: dict[str, Any] | None,
+                       order_by: str,
+                       descending: bool = False,
+                       after: Any = None,
+                       after_pk: int | None = None) -> tuple[str, list[Any]]:
+        """
+        Запрос строк по условию в порядке order_by (затем pk), начиная
+        после строки со значением after и id after_pk, если они заданы
+        """
+        if order_by not in self._columns:
+            raise ValueError(f'unknown field {order_by!r} in table {self.table_name}')
+        shape, params = self.where(where)
+        if after is not None or after_pk is not None:
+            op, keyset_params = _keyset(order_by, after, after_pk, descending)
+            shape += ((order_by, op),)
+            params += keyset_params
+        return _select_sql(self.table_name, self._selected, shape,
+                           (order_by, descending)), params
+
+    def aggregate(self,
+                  func: str,
+                  field: str,
+                  where: dict[str, Any] | None = None,
+                  group_by: str | None = None) -> tuple[str, list[Any]]:
+        """
+        Запрос агрегата func по столбцу field (см. AbstractRepository.aggregate).
+        С группировкой строки результата - (значение group_by, агрегат)
+        """
+        if func not in _AGGREGATES:
+            raise ValueError(f'unknown aggregate function {func!r}')
+        self.columns([field] if group_by is None else [field, group_by])
+        shape, params = self.where(where)
+        return _aggregate_sql(self.table_name, func, field, shape, group_by), params
+
+    def select_by_pk(self) -> str:
+        """ Запрос одной строки по pk """
+        return _select_sql(self.table_name, self._selected, (('pk', 'eq'),))
+
+    def insert(self, with_pk: bool = False) -> str:
+        """
+        Запрос вставки строки, параметры - значения полей в порядке fields
+        (с pk в начале, если with_pk)
+        """
+        columns = ('pk', *self.fields) if with_pk else self.fields
+        return _insert_sql(self.table_name, columns)
+
+    def upsert(self) -> str:
+        """
+        Запрос вставки или замены строки с заданным pk,
+        параметры - pk и значения полей в порядке fields.
+        Существующая строка обновляется (UPDATE), а не удаляется и вставляется
+        заново, чтобы срабатывали триггеры обновления (см. sqlite_schema)
+        """
+        return _upsert_sql(self.table_name, self.fields)
+
+    def search(self) -> str:
+        """
+        Запрос id строк, найденных полнотекстовым индексом таблицы,
+        в порядке убывания релевантности; параметры - выражение MATCH и limit
+        """
+        return _search_sql(self.table_name)
+
+    def update(self) -> str:
+        """ Запрос обновления строки, параметры - значения полей и pk """
+        return _update_sql(self.table_name, self.fields)
+
+    def delete(self) -> str:
+        """ Запрос удаления строки по pk """
+        return _delete_sql(self.table_name)
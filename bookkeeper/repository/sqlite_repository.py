@@ -1,12 +1,27 @@
 """
 Модель реализует репозиторий, работающий с СУБД sqlite
 """
-from typing import Any, Optional
 import sqlite3
+from concurrent.futures import Future
+from functools import partial
+from types import TracebackType
+from typing import Any, Callable, ContextManager, Iterable, Iterator, Sequence
 from inspect import get_annotations
 
 
-from bookkeeper.repository.abstract_repository import AbstractRepository, T
+from bookkeeper.repository.abstract_repository import (
+    AbstractRepository, T, DEFAULT_BATCH_SIZE, DEFAULT_SEARCH_LIMIT, row_type
+)
+from bookkeeper.repository.sqlite_connection import SQLiteConnectionPool
+from bookkeeper.repository.sqlite_decoder import (
+    compile_projection_decoder, compile_row_decoder, value_decoder
+)
+from bookkeeper.repository.sqlite_profiler import QueryProfiler
+from bookkeeper.repository.sqlite_query import QueryBuilder
+from bookkeeper.repository.sqlite_schema import (
+    DEFAULT_INDEXES, drop_schema, ensure_schema, table_columns
+)
+from bookkeeper.repository.text_search import match_query
 
 
 DB_FILE = 'bookkeeper/databases/client.sqlite.db'
@@ -17,153 +32,378 @@ class SQLiteRepository(AbstractRepository[T]):
     Класс репозитория, работающий с sqlite
     Методы:
         CRUD - add, get, update, delete, get_all
+        Потоковое чтение - iter_all
+        Пакетные операции - add_many, update_many, delete_many
         Работа с таблицами - create_table, drop_table
-        Адаптер для парсинга данных с СУБД - __parse_query_to_class
+        Декодер строк СУБД в объекты модели - decode_row
+        Отложенная запись (возвращает Future) - add_nowait, add_many_nowait,
+            update_nowait, delete_nowait
+        Работа с соединением - transaction, close
+            (или использование как контекстного менеджера)
+        Полнотекстовый поиск - search
+
+    Соединения с файлом базы данных берутся из общего пула
+    (SQLiteConnectionPool) и живут до закрытия репозитория, а не открываются
+    заново на каждую операцию.
+    Запросы строятся QueryBuilder'ом: значения передаются параметрами,
+    а тексты запросов кешируются.
+    Типы столбцов выводятся из аннотаций модели, индексы задаются параметром
+    indexes (по умолчанию - DEFAULT_INDEXES для таблицы), существующие таблицы
+    обновляются миграциями (см. sqlite_schema).
+    text_fields - текстовые поля, по которым строится полнотекстовый индекс
+    FTS5 для метода search (по умолчанию индекса нет).
+    С параметром wal=True файл переводится в режим журнала WAL,
+    а все изменения выполняются общим для файла фоновым потоком записи;
+    чтение идет параллельно на соединениях вызывающих потоков.
+    Профилировщик profiler (QueryProfiler) подключается к пулу соединений
+    файла и учитывает запросы всех его репозиториев.
     """
 
     db_file: str
     table_name: str
     cls: type
     fields: dict[str, type]
+    queries: QueryBuilder
+    decode_row: Callable[[sqlite3.Cursor, tuple[Any, ...]], T]
+    indexes: list[tuple[str, ...]]
+    text_fields: tuple[str, ...]
+    wal: bool
 
-    def __init__(self, cls: type, db_file: str = DB_FILE) -> None:
+    def __init__(self,
+                 cls: type,
+                 db_file: str = DB_FILE,
+                 indexes: list[tuple[str, ...]] | None = None,
+                 wal: bool = False,
+                 profiler: QueryProfiler | None = None,
+                 text_fields: Sequence[str] = ()) -> None:
         self.db_file = db_file
         self.table_name = cls.__name__.lower()
         self.fields = get_annotations(cls, eval_str=True)
         self.fields.pop('pk')
         self.cls = cls
+        self.queries = QueryBuilder(self.table_name, self.fields)
+        self.decode_row = compile_row_decoder(cls, self.fields)
+        self._projections: dict[tuple[str, ...], Callable[..., Any]] = {}
+        if indexes is None:
+            indexes = DEFAULT_INDEXES.get(self.table_name, [])
+        self.indexes = indexes
+        self.text_fields = tuple(self.queries.columns(text_fields))
+        if self.text_fields:
+            self.search = self._search
+        self.wal = wal
+        self._pool: SQLiteConnectionPool | None = \
+            SQLiteConnectionPool.acquire(db_file, wal)
+        if profiler is not None:
+            self._pool.profiler = profiler
         self.create_table()
 
+    def __enter__(self) -> 'SQLiteRepository[T]':
+        return self
+
+    def __exit__(self,
+                 exc_type: type[BaseException] | None,
+                 exc_val: BaseException | None,
+                 exc_tb: TracebackType | None) -> None:
+        self.close()
+
+    @property
+    def pool(self) -> SQLiteConnectionPool:
+        """
+        Пул соединений репозитория
+        """
+        if self._pool is None:
+            raise RuntimeError(f'repository for {self.table_name} is closed')
+        return self._pool
+
+    def transaction(self) -> ContextManager[Any]:
+        """
+        Транзакция на общем соединении файла: изменения всех репозиториев
+        этого файла внутри блока with фиксируются один раз при выходе из него
+        """
+        return self.pool.transaction()
+
+    def close(self) -> None:
+        """
+        Освобождает соединения репозитория. Соединения с файлом закрываются,
+        когда закрыт последний использующий их репозиторий
+        """
+        if self._pool is not None:
+            self._pool.release()
+            self._pool = None
+
     def reset_db_file(self, db_file: str = DB_FILE) -> None:
         """
         Функия меняет файл для сохранения базы данных (БЕЗ переноса данных!)
         """
+        profiler = self.pool.profiler
         self.drop_table()
+        self.close()
         self.db_file = db_file
+        self._pool = SQLiteConnectionPool.acquire(db_file, self.wal)
+        if profiler is not None:
+            self._pool.profiler = profiler
         self.create_table()
 
     def create_table(self) -> None:
         """
-        Создает таблицу в базе данных, если она не существует
+        Создает таблицу и ее индексы в базе данных, если они не существуют,
+        а существующую таблицу приводит к текущей версии схемы.
+        Внутри открытой транзакции изменения схемы становятся ее частью
         """
-        with sqlite3.connect(self.db_file) as con:
-            cur = con.cursor()
-            query = f"CREATE TABLE IF NOT EXISTS {self.table_name} "
-            query += "(pk INTEGER PRIMARY KEY, "
-            query += ', '.join(list(self.fields.keys())) + ')'
-            cur.execute(query)
-        con.close()
-
-    def __parse_query_to_class(self, query: tuple[Any] | None) -> Optional[T] | None:
-        if query is not None:
-            query_dict = dict(zip({"pk": int} | self.fields, query))
-            out = self.cls(**query_dict)
-        else:
-            out = None
-        return out
+        with self.pool.transaction() as con:
+            ensure_schema(con, self.table_name,
+                          table_columns(self.fields), self.indexes, self.text_fields)
 
     def drop_table(self) -> None:
         """
         Удаляет таблицу из базы данных
         """
-        with sqlite3.connect(self.db_file) as con:
-            cur = con.cursor()
-            cur.execute(f"DROP TABLE IF EXISTS {self.table_name}")
-        con.close()
+        with self.pool.transaction() as con:
+            drop_schema(con, self.table_name)
 
-    def add(self, obj: T) -> int:
+    def _values(self, obj: T) -> list[Any]:
+        return [getattr(obj, x) for x in self.fields]
+
+    def _check_new(self, obj: T) -> None:
         if getattr(obj, 'pk', None) != 0:
             raise ValueError(f'trying to add object {obj} with filled `pk` attribute')
-        names = ', '.join(self.fields.keys())
-        placeholders = ', '.join("?" * len(self.fields))
-        values = [getattr(obj, x) for x in self.fields]
-        with sqlite3.connect(self.db_file) as con:
-            cur = con.cursor()
-            cur.execute('PRAGMA foreign_keys = ON')
-            cur.execute(
-                f'INSERT INTO {self.table_name} ({names}) VALUES ({placeholders})',
-                values
-            )
-            obj.pk = cur.lastrowid
-        con.close()
+
+    def add(self, obj: T) -> int:
+        return self.add_nowait(obj).result()
+
+    def add_nowait(self, obj: T) -> Future[int]:
+        """
+        Поставить добавление объекта в очередь записи и вернуть Future с его id.
+        Вне режима WAL объект добавляется сразу
+        """
+        self._check_new(obj)
+        return self.pool.submit(partial(self._insert, obj))
+
+    def _insert(self, obj: T, con: sqlite3.Connection) -> int:
+        with self.pool.transaction():
+            cur = self.pool.execute(con, self.queries.insert(), self._values(obj))
+        if cur.lastrowid is None:
+            raise sqlite3.DatabaseError(f'no row id for insert into {self.table_name}')
+        obj.pk = cur.lastrowid
         return obj.pk
 
+    def _cursor(self) -> sqlite3.Cursor:
+        cur = self.pool.connection().cursor()
+        cur.row_factory = self.decode_row
+        return cur
+
+    def _projection(self, fields: Sequence[str]) -> Callable[..., Any]:
+        """
+        Декодер строк из столбцов fields (генерируется один раз на набор полей)
+        """
+        columns = self.queries.columns(fields)
+        decode = self._projections.get(columns)
+        if decode is None:
+            annotations = {column: self.fields.get(column, int) for column in columns}
+            decode = compile_projection_decoder(row_type(columns), annotations)
+            self._projections[columns] = decode
+        return decode
+
     def get(self, pk: int) -> T | None:
-        with sqlite3.connect(self.db_file) as con:
-            cur = con.cursor()
-            raw_res = cur.execute(
-                f"SELECT * FROM {self.table_name} WHERE pk={pk}"
-            )
-            res = self.__parse_query_to_class(raw_res.fetchone())
-        con.close()
+        cur = self._cursor()
+        res: T | None = self.pool.execute(
+            cur, self.queries.select_by_pk(), (pk,)).fetchone()
         return res
 
     def get_all(self,
                 where: dict[str, Any] | None = None,
-                subquery: str | None = None) -> list[Optional[T]]:
-        with sqlite3.connect(self.db_file) as con:
-            cur = con.cursor()
-            query = f"SELECT * FROM {self.table_name}"
-            if where is not None:
-                query += " WHERE " + ' AND '.join(
-                    [f"{key} = {value}"
-                     for key, value in where.items()
-                     if value is not None
-                     and isinstance(value, int) or isinstance(value, float)] +
-                    [f"{key} = '{value}'"
-                     for key, value in where.items()
-                     if value is not None
-                     and not (isinstance(value, int) or isinstance(value, float))]
-                )
-            if subquery is not None:
-                query += " " + subquery
-
-            raw_res = cur.execute(query)
-            res = raw_res.fetchall()
-        con.close()
-        out = [self.__parse_query_to_class(res[pk]) for pk in range(len(res))]
-        return out
+                fields: Sequence[str] | None = None,
+                subquery: str | None = None) -> list[Any]:
+        """
+        Получить все записи по условию where (см. AbstractRepository.get_all).
+        fields - выбрать только эти столбцы и вернуть строки-кортежи
+        subquery - дополнительный фрагмент SQL, дописываемый в конец запроса
+        """
+        cur = self._cursor()
+        if fields is not None:
+            cur.row_factory = self._projection(fields)
+        query, params = self.queries.select(where, fields)
+        if subquery is not None:
+            query += " " + subquery
+        return self.pool.fetchall(cur, query, params)
+
+    def _decoder(self, field: str) -> Callable[[Any], Any]:
+        """ Приведение значения столбца вне строки модели к типу поля """
+        return value_decoder(self.fields.get(field, int))
+
+    def aggregate(self,
+                  func: str,
+                  field: str = 'pk',
+                  where: dict[str, Any] | None = None,
+                  group_by: str | None = None) -> Any:
+        """
+        Вычислить агрегат (см. AbstractRepository.aggregate) запросом
+        SUM/COUNT/.../GROUP BY, не создавая объектов модели
+        """
+        query, params = self.queries.aggregate(func, field, where, group_by)
+        rows = self.pool.fetchall(self.pool.connection(), query, params)
+        decode_value = self._decoder(field) if func in ('min', 'max') \
+            else (lambda value: value)
+        if group_by is None:
+            return decode_value(rows[0][0])
+        decode_key = self._decoder(group_by)
+        return {decode_key(key): decode_value(value) for key, value in rows}
+
+    def _search(self, query: str, limit: int = DEFAULT_SEARCH_LIMIT) -> list[int]:
+        """
+        Полнотекстовый поиск (см. Searchable) по индексу FTS5
+        полей text_fields, результаты ранжируются функцией bm25;
+        метод search есть, только если они заданы
+        """
+        expression = match_query(query)
+        if not expression:
+            return []
+        rows = self.pool.fetchall(self.pool.connection(), self.queries.search(),
+                                  [expression, limit])
+        return [pk for pk, in rows]
+
+    def iter_all(self,
+                 where: dict[str, Any] | None = None,
+                 order_by: str = 'pk',
+                 batch_size: int = DEFAULT_BATCH_SIZE,
+                 after: Any = None,
+                 after_pk: int | None = None,
+                 descending: bool = False) -> Iterator[T]:
+        """
+        Перебрать записи (см. AbstractRepository.iter_all), читая их
+        с курсора пачками по batch_size строк. Продолжение после записи
+        (after, after_pk) выполняется условием по индексу, а не пропуском строк
+        """
+        query, params = self.queries.select_ordered(
+            where, order_by, descending, after, after_pk)
+        cur = self._cursor()
+        self.pool.execute(cur, query, params)
+        while rows := cur.fetchmany(batch_size):
+            yield from rows
 
     def update(self, obj: T) -> None:
+        self.update_nowait(obj).result()
+
+    def update_nowait(self, obj: T) -> Future[None]:
+        """
+        Поставить обновление объекта в очередь записи (см. add_nowait)
+        """
         if obj.pk == 0:
             raise ValueError('attempt to update object with unknown primary key')
-        with sqlite3.connect(self.db_file) as con:
-            cur = con.cursor()
-            sql_query = f"UPDATE {self.table_name} SET "
-            sql_query += ','.join(
-                [f"{attr} = {val}"
-                 for attr, val in obj.__dict__.items()
-                 if attr != 'pk' and val is not None
-                 and isinstance(val, int) or isinstance(val, float)] +
-                [f"{attr} = '{val}'"
-                 for attr, val in obj.__dict__.items()
-                 if attr != 'pk' and val is not None
-                 and not (isinstance(val, int) or isinstance(val, float))]
-            )
-            sql_query += f" WHERE pk={obj.pk}"
-            cur.execute(sql_query)
-        con.close()
+        return self.pool.submit(partial(self._update_many, [obj]))
 
     def delete(self, pk: int) -> None:
+        self.delete_nowait(pk).result()
+
+    def delete_nowait(self, pk: int) -> Future[None]:
+        """
+        Поставить удаление записи в очередь записи (см. add_nowait)
+        """
         if pk == 0:
             raise ValueError('attempt to update object with unknown primary key')
-        with sqlite3.connect(self.db_file) as con:
+        return self.pool.submit(partial(self._delete_many, [pk]))
+
+    def add_many(self, objs: Iterable[T]) -> list[int]:
+        """
+        Добавляет объекты одной транзакцией (executemany).
+        Id назначаются подряд после максимального id в таблице,
+        блокировка на запись берется (транзакцией пула) до их вычисления
+        """
+        return self.add_many_nowait(objs).result()
+
+    def add_many_nowait(self, objs: Iterable[T]) -> Future[list[int]]:
+        """
+        Поставить добавление объектов в очередь записи (см. add_many, add_nowait)
+        """
+        batch = list(objs)
+        for obj in batch:
+            self._check_new(obj)
+        return self.pool.submit(partial(self._insert_many, batch))
+
+    def _insert_many(self, batch: list[T], con: sqlite3.Connection) -> list[int]:
+        if not batch:
+            return []
+        with self.pool.transaction():
             cur = con.cursor()
-            cur.execute(
-                f"DELETE FROM {self.table_name} WHERE pk={pk}"
+            self.pool.execute(cur, f'SELECT COALESCE(MAX(pk), 0) FROM {self.table_name}')
+            first_pk = cur.fetchone()[0] + 1
+            pks = list(range(first_pk, first_pk + len(batch)))
+            self.pool.executemany(
+                cur,
+                self.queries.insert(with_pk=True),
+                ([pk, *self._values(obj)] for pk, obj in zip(pks, batch))
+            )
+        for pk, obj in zip(pks, batch):
+            obj.pk = pk
+        return pks
+
+    def update_many(self, objs: Iterable[T]) -> None:
+        batch = list(objs)
+        if any(obj.pk == 0 for obj in batch):
+            raise ValueError('attempt to update object with unknown primary key')
+        self.pool.submit(partial(self._update_many, batch)).result()
+
+    def _update_many(self, batch: list[T], con: sqlite3.Connection) -> None:
+        with self.pool.transaction():
+            self.pool.executemany(
+                con,
+                self.queries.update(),
+                ([*self._values(obj), obj.pk] for obj in batch)
+            )
+
+    def put_many(self, objs: Iterable[T]) -> None:
+        """
+        Записывает объекты с назначенными id одной транзакцией
+        (INSERT ... ON CONFLICT DO UPDATE), см. SupportsPutMany
+        """
+        self.put_many_nowait(objs).result()
+
+    def put_many_nowait(self, objs: Iterable[T]) -> Future[None]:
+        """
+        Поставить запись объектов в очередь записи (см. put_many, add_nowait)
+        """
+        batch = list(objs)
+        if any(obj.pk == 0 for obj in batch):
+            raise ValueError('attempt to put object with unknown primary key')
+        return self.pool.submit(partial(self._put_many, batch))
+
+    def _put_many(self, batch: list[T], con: sqlite3.Connection) -> None:
+        with self.pool.transaction():
+            self.pool.executemany(
+                con,
+                self.queries.upsert(),
+                ([obj.pk, *self._values(obj)] for obj in batch)
             )
-        con.close()
+
+    def delete_many(self, pks: Iterable[int]) -> None:
+        batch = list(pks)
+        if 0 in batch:
+            raise ValueError('attempt to delete object with unknown primary key')
+        self.pool.submit(partial(self._delete_many, batch)).result()
+
+    def _delete_many(self, batch: list[int], con: sqlite3.Connection) -> None:
+        with self.pool.transaction():
+            self.pool.executemany(
+                con, self.queries.delete(), ((pk,) for pk in batch))
 
     @classmethod
     def repository_factory(cls,
                            models: list[type],
-                           db_file: str | None = None) -> dict[type, type]:
+                           db_file: str | None = None,
+                           wal: bool = False,
+                           profiler: QueryProfiler | None = None) -> dict[type, Any]:
         """
         Создает хэш с таблицами по моделям данных
         (Паттерн AbstractFactory)
+        Все репозитории разделяют общий пул соединений с файлом СУБД
         :param models: список классов, описывающих аннотацию типов
         в таблице
         :param db_file: относительный путь к СУБД
+        :param wal: включить режим WAL с фоновым потоком записи
+        :param profiler: профилировщик запросов к файлу СУБД
         :return: хэш с репозиториями для классов-аннотаций
         """
-        return {model: cls(model, db_file) for model in models}
+        if db_file is None:
+            db_file = DB_FILE
+        return {model: cls(model, db_file, wal=wal, profiler=profiler)
+                for model in models}
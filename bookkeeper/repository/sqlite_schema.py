@@ -0,0 +1,259 @@
+"""
+Модуль описывает схему таблиц SQLiteRepository: типы столбцов, индексы и
+версионные миграции существующих файлов базы данных
+
+Типы столбцов выводятся из аннотаций модели. Версия схемы каждой таблицы
+хранится в служебной таблице, и при открытии репозитория к таблице
+применяются все миграции новее записанной версии.
+Даты (столбцы DATETIME) хранятся как целое число секунд от начала эпохи,
+адаптер и конвертер для них регистрируются в sqlite3 при импорте модуля.
+Полнотекстовый индекс таблицы - виртуальная таблица FTS5 с внешним
+содержимым (content=таблица), которую триггеры обновляют вместе с таблицей.
+"""
+import sqlite3
+from datetime import datetime, timedelta, timezone
+from types import NoneType, UnionType
+from typing import Any, Callable, Sequence, Union, get_args, get_origin
+
+
+SCHEMA_VERSION_TABLE = '_schema_version'
+
+SQL_TYPES: dict[Any, str] = {
+    int: 'INTEGER',
+    bool: 'INTEGER',
+    float: 'REAL',
+    str: 'TEXT',
+    bytes: 'BLOB',
+    datetime: 'DATETIME',
+}
+
+# Индексы, объявленные по умолчанию для таблиц моделей приложения
+DEFAULT_INDEXES: dict[str, list[tuple[str, ...]]] = {
+    'category': [('name',)],
+    'expense': [('expense_date',), ('category',)],
+    'budget': [('duration', 'expiration_date'), ('expiration_date',)],
+}
+
+
+EPOCH = datetime(1970, 1, 1)
+_SECOND = timedelta(seconds=1)
+
+
+def adapt_datetime(value: datetime) -> int:
+    """
+    Перевести дату в число секунд от начала эпохи. Наивные даты считаются
+    заданными в UTC, даты с часовым поясом переводятся в UTC
+    """
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return (value - EPOCH) // _SECOND
+
+
+def convert_datetime(raw: bytes) -> datetime:
+    """
+    Перевести значение столбца DATETIME в наивную дату (UTC).
+    Значения в текстовом формате старых версий тоже поддерживаются
+    """
+    try:
+        return EPOCH + int(raw) * _SECOND
+    except ValueError:
+        return datetime.fromisoformat(raw.decode())
+
+
+sqlite3.register_adapter(datetime, adapt_datetime)
+sqlite3.register_converter('DATETIME', convert_datetime)
+
+
+def field_type(annotation: Any) -> Any:
+    """
+    Тип поля модели по аннотации: для Optional-аннотаций (int | None) - тип
+    без None, для остальных - сама аннотация
+    """
+    if get_origin(annotation) in (Union, UnionType):
+        args = [arg for arg in get_args(annotation) if arg is not NoneType]
+        if len(args) == 1:
+            return args[0]
+    return annotation
+
+
+def column_type(annotation: Any) -> str:
+    """
+    Тип столбца sqlite для аннотации поля модели,
+    для неизвестных типов возвращается пустая строка (столбец без типа)
+    """
+    return SQL_TYPES.get(field_type(annotation), '')
+
+
+def table_columns(fields: dict[str, Any]) -> dict[str, str]:
+    """
+    Типы столбцов таблицы (кроме pk) по аннотациям полей модели
+    """
+    return {name: column_type(annotation) for name, annotation in fields.items()}
+
+
+def create_table_sql(table_name: str, columns: dict[str, str]) -> str:
+    """
+    Запрос создания таблицы с типизированными столбцами
+    """
+    definitions = ', '.join(f'{name} {sql_type}'.rstrip()
+                            for name, sql_type in columns.items())
+    return (f'CREATE TABLE IF NOT EXISTS {table_name} '
+            f'(pk INTEGER PRIMARY KEY, {definitions})')
+
+
+def create_index_sql(table_name: str, index: tuple[str, ...]) -> str:
+    """
+    Запрос создания индекса по столбцам index
+    """
+    name = f'idx_{table_name}_{"_".join(index)}'
+    return f'CREATE INDEX IF NOT EXISTS {name} ON {table_name} ({", ".join(index)})'
+
+
+def fts_table(table_name: str) -> str:
+    """ Имя таблицы полнотекстового индекса """
+    return f'{table_name}_fts'
+
+
+def _fts_columns(con: sqlite3.Connection, table_name: str) -> list[str]:
+    info = con.execute(f'PRAGMA table_info({fts_table(table_name)})').fetchall()
+    return [row[1] for row in info]
+
+
+def _drop_fts(con: sqlite3.Connection, table_name: str) -> None:
+    for suffix in ('ai', 'ad', 'au'):
+        con.execute(f'DROP TRIGGER IF EXISTS {fts_table(table_name)}_{suffix}')
+    con.execute(f'DROP TABLE IF EXISTS {fts_table(table_name)}')
+
+
+def _ensure_fts(con: sqlite3.Connection,
+                table_name: str, text_fields: Sequence[str]) -> None:
+    """
+    Создать полнотекстовый индекс по столбцам text_fields и триггеры,
+    поддерживающие его. Индекс с другим набором столбцов пересоздается
+    и заполняется по строкам таблицы
+    """
+    fts = fts_table(table_name)
+    columns = ', '.join(text_fields)
+    new = ', '.join(f'new.{field}' for field in text_fields)
+    old = ', '.join(f'old.{field}' for field in text_fields)
+    if _fts_columns(con, table_name) != list(text_fields):
+        _drop_fts(con, table_name)
+        con.execute(f"CREATE VIRTUAL TABLE {fts} USING fts5({columns}, "
+                    f"content='{table_name}', content_rowid='pk', "
+                    f"tokenize='unicode61 remove_diacritics 0')")
+        con.execute(f"INSERT INTO {fts} ({fts}) VALUES ('rebuild')")
+    insert = f'INSERT INTO {fts} (rowid, {columns}) VALUES (new.pk, {new});'
+    delete = (f"INSERT INTO {fts} ({fts}, rowid, {columns}) "
+              f"VALUES ('delete', old.pk, {old});")
+    con.execute(f'CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {table_name} '
+                f'BEGIN {insert} END')
+    con.execute(f'CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {table_name} '
+                f'BEGIN {delete} END')
+    con.execute(f'CREATE TRIGGER IF NOT EXISTS {fts}_au '
+                f'AFTER UPDATE OF {columns} ON {table_name} '
+                f'BEGIN {delete} {insert} END')
+
+
+def _retype_columns(con: sqlite3.Connection,
+                    table_name: str, columns: dict[str, str]) -> None:
+    """
+    Миграция 1: пересоздать таблицу со столбцами без типов.
+    Строки копируются в новую таблицу, строковое 'None', записанное старыми
+    версиями в нетекстовые столбцы, заменяется на NULL
+    """
+    info = con.execute(f'PRAGMA table_info({table_name})').fetchall()
+    old_types = {row[1]: row[2] for row in info}
+    if all(old_types.get(name) == sql_type for name, sql_type in columns.items()):
+        return
+    common = [name for name in columns if name in old_types]
+    selected = [name if columns[name] in ('TEXT', '') else f"NULLIF({name}, 'None')"
+                for name in common]
+    tmp_name = f'{table_name}__migrate'
+    con.execute(create_table_sql(tmp_name, columns))
+    con.execute(f'INSERT INTO {tmp_name} (pk, {", ".join(common)}) '
+                f'SELECT pk, {", ".join(selected)} FROM {table_name}')
+    con.execute(f'DROP TABLE {table_name}')
+    con.execute(f'ALTER TABLE {tmp_name} RENAME TO {table_name}')
+
+
+def _dates_to_epoch(con: sqlite3.Connection,
+                    table_name: str, columns: dict[str, str]) -> None:
+    """
+    Миграция 2: перевести даты, записанные текстом, в секунды от начала эпохи.
+    Нераспознанные значения остаются как есть
+    """
+    for name, sql_type in columns.items():
+        if sql_type == 'DATETIME':
+            con.execute(
+                f"UPDATE {table_name} SET {name} = "
+                f"COALESCE(CAST(strftime('%s', {name}) AS INTEGER), {name}) "
+                f"WHERE typeof({name}) = 'text'")
+
+
+Migration = Callable[[sqlite3.Connection, str, dict[str, str]], None]
+
+# Миграции по порядку версий: после i-й миграции версия таблицы равна i + 1
+MIGRATIONS: list[Migration] = [
+    _retype_columns,
+    _dates_to_epoch,
+]
+
+
+def _get_version(con: sqlite3.Connection, table_name: str) -> int:
+    row = con.execute(
+        f'SELECT version FROM {SCHEMA_VERSION_TABLE} WHERE table_name = ?',
+        (table_name,)).fetchone()
+    return 0 if row is None else int(row[0])
+
+
+def _set_version(con: sqlite3.Connection, table_name: str, version: int) -> None:
+    con.execute(
+        f'INSERT OR REPLACE INTO {SCHEMA_VERSION_TABLE} (table_name, version) '
+        'VALUES (?, ?)', (table_name, version))
+
+
+def _table_exists(con: sqlite3.Connection, table_name: str) -> bool:
+    return con.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?",
+        (table_name,)).fetchone() is not None
+
+
+def ensure_schema(con: sqlite3.Connection,
+                  table_name: str,
+                  columns: dict[str, str],
+                  indexes: list[tuple[str, ...]],
+                  text_fields: Sequence[str] = ()) -> None:
+    """
+    Создать таблицу с индексами или привести существующую таблицу
+    к текущей версии схемы. Изменения выполняются в транзакции вызывающего
+    (transaction пула), функция сама ее не фиксирует.
+    text_fields - столбцы полнотекстового индекса (пусто - индекс не нужен;
+    уже созданный индекс при этом не удаляется)
+    """
+    con.execute(f'CREATE TABLE IF NOT EXISTS {SCHEMA_VERSION_TABLE} '
+                '(table_name TEXT PRIMARY KEY, version INTEGER)')
+    if not _table_exists(con, table_name):
+        con.execute(create_table_sql(table_name, columns))
+        _set_version(con, table_name, len(MIGRATIONS))
+    else:
+        version = _get_version(con, table_name)
+        for migration in MIGRATIONS[version:]:
+            migration(con, table_name, columns)
+        if version < len(MIGRATIONS):
+            _set_version(con, table_name, len(MIGRATIONS))
+    for index in indexes:
+        con.execute(create_index_sql(table_name, index))
+    if text_fields:
+        _ensure_fts(con, table_name, text_fields)
+
+
+def drop_schema(con: sqlite3.Connection, table_name: str) -> None:
+    """
+    Удалить таблицу вместе с ее полнотекстовым индексом
+    и записью о версии ее схемы (в транзакции вызывающего, см. ensure_schema)
+    """
+    _drop_fts(con, table_name)
+    con.execute(f'DROP TABLE IF EXISTS {table_name}')
+    if _table_exists(con, SCHEMA_VERSION_TABLE):
+        con.execute(f'DELETE FROM {SCHEMA_VERSION_TABLE} WHERE table_name = ?',
+                    (table_name,))
@@ -0,0 +1,103 @@
+"""
+Модуль описывает полнотекстовый поиск по текстовым полям записей
+
+Текст разбивается на слова (последовательности букв и цифр) в нижнем
+регистре так же, как токенизатор unicode61 полнотекстового индекса FTS5
+в sqlite. Найденные записи ранжируются по BM25 с теми же параметрами,
+что и функция bm25() FTS5, поэтому MemoryRepository и SQLiteRepository
+возвращают результаты поиска в одинаковом порядке.
+"""
+import re
+from collections import Counter
+from heapq import nsmallest
+from math import log
+from typing import Any, Iterable
+
+from bookkeeper.repository.abstract_repository import DEFAULT_SEARCH_LIMIT
+
+# Параметры BM25 (как в bm25() FTS5)
+K1 = 1.2
+B = 0.75
+
+_WORD = re.compile(r'[^\W_]+')
+
+
+def tokenize(text: str) -> list[str]:
+    """ Слова текста в нижнем регистре """
+    return _WORD.findall(text.lower())
+
+
+def match_query(query: str) -> str:
+    """
+    Выражение MATCH для FTS5: все слова query, каждое в кавычках,
+    чтобы знаки препинания и операторы FTS5 в запросе не разбирались
+    """
+    return ' '.join(f'"{word}"' for word in tokenize(query))
+
+
+def _text(obj: Any, fields: Iterable[str]) -> str:
+    values = (getattr(obj, field, None) for field in fields)
+    return ' '.join(str(value) for value in values if value is not None)
+
+
+class TextIndex:
+    """
+    Инвертированный индекс по текстовым полям fields: для каждого слова -
+    id объектов и число вхождений слова в них. Поиск находит объекты,
+    содержащие все слова запроса, и ранжирует их по BM25
+    """
+
+    fields: tuple[str, ...]
+
+    def __init__(self, fields: Iterable[str]) -> None:
+        self.fields = tuple(fields)
+        self._postings: dict[str, dict[int, int]] = {}
+        self._terms: dict[int, Counter[str]] = {}
+        self._lengths: dict[int, int] = {}
+        self._total = 0
+
+    def insert(self, pk: int, obj: Any) -> None:
+        """ Добавить объект с id pk в индекс """
+        terms = Counter(tokenize(_text(obj, self.fields)))
+        self._terms[pk] = terms
+        self._lengths[pk] = terms.total()
+        self._total += self._lengths[pk]
+        for term, frequency in terms.items():
+            self._postings.setdefault(term, {})[pk] = frequency
+
+    def remove(self, pk: int) -> None:
+        """ Убрать объект с id pk из индекса """
+        terms = self._terms.pop(pk)
+        self._total -= self._lengths.pop(pk)
+        for term in terms:
+            posting = self._postings[term]
+            del posting[pk]
+            if not posting:
+                del self._postings[term]
+
+    def search(self, query: str, limit: int = DEFAULT_SEARCH_LIMIT) -> list[int]:
+        """
+        Id не более limit объектов, содержащих все слова query,
+        от наиболее к наименее релевантным
+        """
+        words = tokenize(query)
+        if not words or not self._terms:
+            return []
+        postings = [self._postings.get(word, {}) for word in words]
+        found = set(sorted(postings, key=len)[0])
+        for posting in postings:
+            found.intersection_update(posting)
+        rows = len(self._terms)
+        average = self._total / rows
+        weights = []
+        for posting in postings:
+            idf = log((rows - len(posting) + 0.5) / (len(posting) + 0.5))
+            weights.append(idf if idf > 0 else 1e-6)
+
+        def rank(pk: int) -> tuple[float, int]:
+            norm = K1 * (1 - B + B * self._lengths[pk] / average)
+            score = sum(weight * posting[pk] * (K1 + 1) / (posting[pk] + norm)
+                        for weight, posting in zip(weights, postings))
+            return -score, pk
+
+        return nsmallest(limit, found, key=rank)
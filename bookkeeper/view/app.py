@@ -57,8 +57,6 @@ class MainWindow(QtWidgets.QWidget):
     get_categories_handler: Optional[Callable]
     add_expense_handler: Optional[Callable]
     edit_expense_handler: Optional[Callable]
-    edit_budgets_handler: Optional[Callable]
-    get_db_expense_handler: Optional[Callable]
 
     get_budgets_handler: Optional[Callable]
     set_budgets_handler: Optional[Callable]
@@ -85,9 +83,7 @@ class MainWindow(QtWidgets.QWidget):
             get_handler=self.get_expenses_handler,
             get_categories_handler=self.get_categories_handler,
             add_handler=self.add_expense_handler,
-            edit_handler=self.edit_expense_handler,
-            edit_budgets_handler=self.edit_budgets_handler,
-            get_db_expense_handler=self.get_db_expense_handler
+            edit_handler=self.edit_expense_handler
         )
         self.categories_page = categoriesPage(
             get_handler=self.get_category_handler,
@@ -119,8 +115,6 @@ class MainWindow(QtWidgets.QWidget):
         self.get_categories_handler = handlers[1]
         self.add_expense_handler = handlers[2]
         self.edit_expense_handler = handlers[3]
-        self.edit_budgets_handler = handlers[4]
-        self.get_db_expense_handler = handlers[5]
 
     def register_budgets_handlers(self, handlers: list[Optional[Callable]]) -> None:
         self.get_budgets_handler = handlers[0]
@@ -39,6 +39,9 @@ class BudgetWindow(QtWidgets.QWidget):
                  budgets_getter: Optional[Callable],
                  **kwargs) -> None:
         super().__init__(*args, **kwargs)
+        self.getter = budgets_getter
+        # показанные бюджеты по строкам таблицы
+        self.rows: list[Budget] = []
 
         self.layout = QtWidgets.QVBoxLayout()
         self.setLayout(self.layout)
@@ -63,19 +66,38 @@ class BudgetWindow(QtWidgets.QWidget):
         self.set_budgets(budgets_getter)
 
     def build_budgets(self, data: list[Budget]) -> None:
+        self.rows = []
         for i, row in enumerate(data):
-            self.budgets_table.setItem(
-                i, 0,
-                QtWidgets.QTableWidgetItem(row.duration)
-            )
-            self.budgets_table.setItem(
-                i, 1,
-                QtWidgets.QTableWidgetItem(str(row.amount))
-            )
-            self.budgets_table.setItem(
-                i, 2,
-                QtWidgets.QTableWidgetItem(str(row.limits))
-            )
+            self.set_row(i, row)
+            self.rows.append(row)
+
+    def set_row(self, i: int, row: Budget) -> None:
+        for column, text in enumerate((row.duration, str(row.amount), str(row.limits))):
+            self.budgets_table.setItem(i, column, QtWidgets.QTableWidgetItem(text))
+
+    def put_row(self, budget: Budget) -> None:
+        """
+        Показать добавленный или измененный бюджет: в таблице остается
+        последний бюджет каждого срока
+        """
+        for i, shown in enumerate(self.rows):
+            if shown.pk == budget.pk or (shown.duration == budget.duration
+                                         and shown.expiration_date
+                                         < budget.expiration_date):
+                self.rows[i] = budget
+                self.set_row(i, budget)
+                return
+            if shown.duration == budget.duration:
+                return
+        if len(self.rows) == self.budgets_table.rowCount():
+            self.budgets_table.insertRow(len(self.rows))
+        self.set_row(len(self.rows), budget)
+        self.rows.append(budget)
+
+    def remove_row(self, pk: int) -> None:
+        # вместо удаленного бюджета показывается предыдущий того же срока
+        if any(shown.pk == pk for shown in self.rows):
+            self.set_budgets(self.getter)
 
     def set_budgets(self, budgets_getter: Callable) -> None:
         if self.budgets_table.itemAt(0, 0) is not None:
@@ -25,6 +25,8 @@ class categoriesList(QtWidgets.QWidget):
         super().__init__(*args, **kwargs)
         self.getter = category_getter
         self.editor = category_editor
+        # id категории в каждой строке таблицы
+        self.row_pks: list[int] = []
 
         self.layout = QtWidgets.QVBoxLayout()
         self.setLayout(self.layout)
@@ -75,21 +77,41 @@ class categoriesList(QtWidgets.QWidget):
     #     self.layout.addWidget(self.category_tree)
 
     def build_categories(self, data: list[Category]) -> None:
+        self.row_pks = []
         for i, row in enumerate(data):
-            self.categories_table.setItem(
-                i, 0,
-                QtWidgets.QTableWidgetItem(str(row.name).capitalize())
-            )
-            category_id_item = QtWidgets.QTableWidgetItem(str(row.pk))
-            category_id_item.setFlags( QtCore.Qt.ItemIsSelectable | QtCore.Qt.ItemIsEnabled )
-            self.categories_table.setItem(
-                i, 1,
-                category_id_item
-            )
-            self.categories_table.setItem(
-                i, 2,
-                QtWidgets.QTableWidgetItem(str(row.parent))
-            )
+            self.set_row(i, row)
+            self.row_pks.append(row.pk)
+
+    def set_row(self, i: int, row: Category) -> None:
+        texts = (str(row.name).capitalize(), str(row.pk), str(row.parent))
+        for column, text in enumerate(texts):
+            item = self.categories_table.item(i, column)
+            if item is not None:
+                if item.text() != text:
+                    item.setText(text)
+                continue
+            item = QtWidgets.QTableWidgetItem(text)
+            if column == 1:
+                item.setFlags( QtCore.Qt.ItemIsSelectable | QtCore.Qt.ItemIsEnabled )
+            self.categories_table.setItem(i, column, item)
+
+    def put_row(self, category: Category) -> None:
+        """ Показать добавленную или измененную категорию, не перестраивая таблицу """
+        self.categories_table.blockSignals(True)
+        try:
+            if category.pk in self.row_pks:
+                self.set_row(self.row_pks.index(category.pk), category)
+            else:
+                self.categories_table.insertRow(len(self.row_pks))
+                self.set_row(len(self.row_pks), category)
+                self.row_pks.append(category.pk)
+        finally:
+            self.categories_table.blockSignals(False)
+
+    def remove_row(self, pk: int) -> None:
+        if pk in self.row_pks:
+            self.categories_table.removeRow(self.row_pks.index(pk))
+            self.row_pks.remove(pk)
 
     def set_categories(self, category_getter: Callable) -> None:
         if self.categories_table.itemAt(0, 0) is not None:
@@ -5,6 +5,7 @@ from datetime import datetime
 from PySide6 import QtWidgets, QtCore
 from typing import Callable, Optional
 
+from bookkeeper.models.category import Category
 from bookkeeper.models.expense import Expense
 
 
@@ -21,14 +22,12 @@ class expensesList(QtWidgets.QWidget):
     def __init__(self, *args,
                  expenses_getter: Optional[Callable],
                  expenses_editor: Optional[Callable],
-                 budgets_editor: Optional[Callable],
-                 db_expense_getter: Optional[Callable],
                  **kwargs) -> None:
         super().__init__(*args, **kwargs)
 
         self.editor = expenses_editor
-        self.budgets_editor = budgets_editor
-        self.db_expense_getter = db_expense_getter
+        # id расхода в каждой строке таблицы
+        self.row_pks: list[int] = []
 
         self.layout = QtWidgets.QVBoxLayout()
         self.setLayout(self.layout)
@@ -55,27 +54,38 @@ class expensesList(QtWidgets.QWidget):
         self.set_expenses(expenses_getter)
 
     def build_expenses(self, data: list[Expense]) -> None:
+        self.row_pks = []
         for i, row in enumerate(data):
-            self.expenses_table.setItem(
-                i, 0,
-                QtWidgets.QTableWidgetItem(
-                    datetime.strptime(
-                        row.expense_date, "%Y-%m-%d %H:%M:%S"
-                    ).strftime("%d-%m-%Y")
-                )
-            )
-            self.expenses_table.setItem(
-                i, 1,
-                QtWidgets.QTableWidgetItem(str(row.amount))
-            )
-            self.expenses_table.setItem(
-                i, 2,
-                QtWidgets.QTableWidgetItem(str(row.category).capitalize())
-            )
-            self.expenses_table.setItem(
-                i, 3,
-                QtWidgets.QTableWidgetItem(str(row.comment))
-            )
+            self.set_row(i, row)
+            self.row_pks.append(row.pk)
+
+    def set_row(self, i: int, row: Expense) -> None:
+        texts = (row.expense_date.strftime("%d-%m-%Y"), str(row.amount),
+                 str(row.category).capitalize(), str(row.comment))
+        for column, text in enumerate(texts):
+            item = self.expenses_table.item(i, column)
+            if item is None:
+                self.expenses_table.setItem(i, column, QtWidgets.QTableWidgetItem(text))
+            elif item.text() != text:
+                item.setText(text)
+
+    def put_row(self, expense: Expense) -> None:
+        """ Показать добавленный или измененный расход, не перестраивая таблицу """
+        self.expenses_table.blockSignals(True)
+        try:
+            if expense.pk in self.row_pks:
+                self.set_row(self.row_pks.index(expense.pk), expense)
+            else:
+                self.expenses_table.insertRow(len(self.row_pks))
+                self.set_row(len(self.row_pks), expense)
+                self.row_pks.append(expense.pk)
+        finally:
+            self.expenses_table.blockSignals(False)
+
+    def remove_row(self, pk: int) -> None:
+        if pk in self.row_pks:
+            self.expenses_table.removeRow(self.row_pks.index(pk))
+            self.row_pks.remove(pk)
 
     def set_expenses(self, expenses_getter: Callable) -> None:
         if self.expenses_table.itemAt(0, 0) is not None:
@@ -106,23 +116,15 @@ class expensesList(QtWidgets.QWidget):
     @QtCore.Slot()
     def table_item_changed(self, item):
         table_position = self.expenses_table.indexFromItem(item)
-        row, column = table_position.row(), table_position.column()
+        row = table_position.row()
 
-        pk = row + 1
+        pk = self.row_pks[row]
         amount = float(self.expenses_table.item(row, 1).text())
         category = self.expenses_table.item(row, 2).text()
         expense_date = datetime.strptime(
             self.expenses_table.item(row, 0).text(), "%d-%m-%Y"
         )
         comment = self.expenses_table.item(row, 3).text()
-        if column == 1:
-            old_value = self.db_expense_getter(pk)
-            self.budgets_editor(value=-old_value.amount + amount, date=expense_date)
-        print("table item changed: ",
-              pk, " with amount ", amount,
-              " and category ", category,
-              " and expense date ", expense_date,
-              " and comment ", comment)
         self.editor(pk, amount, category, expense_date, comment)
 
 
@@ -164,10 +166,22 @@ class chooseCategoryElement(QtWidgets.QWidget):
         self.category_box = QtWidgets.QComboBox()
         categories = category_list_getter()
         for category in categories:
-            self.category_box.addItem(category)
+            self.category_box.addItem(category.name, category.pk)
 
         self.layout.addWidget(self.category_box)
 
+    def put_row(self, category: Category) -> None:
+        index = self.category_box.findData(category.pk)
+        if index < 0:
+            self.category_box.addItem(category.name, category.pk)
+        else:
+            self.category_box.setItemText(index, category.name)
+
+    def remove_row(self, pk: int) -> None:
+        index = self.category_box.findData(pk)
+        if index >= 0:
+            self.category_box.removeItem(index)
+
 
 class addCommentElement(QtWidgets.QWidget):
     def __init__(self, *args, **kwargs) -> None:
@@ -186,12 +200,10 @@ class elementAddExpense(QtWidgets.QWidget):
     def __init__(self, *args,
                  get_category_list: Callable,
                  adder: Callable,
-                 budgets_editor: Callable,
                  **kwargs) -> None:
         super().__init__(*args, **kwargs)
 
         self.adder = adder
-        self.budgets_editor = budgets_editor
 
         self.layout = QtWidgets.QVBoxLayout()
         self.setLayout(self.layout)
@@ -222,7 +234,6 @@ class elementAddExpense(QtWidgets.QWidget):
               " date ", date, " category ", category,
               " comment ", comment)
         self.adder(amount, date, category, comment)
-        self.budgets_editor(value=amount, date=date)
 
 
 class expensesPage(QtWidgets.QWidget):
@@ -231,8 +242,6 @@ class expensesPage(QtWidgets.QWidget):
                  get_categories_handler: Optional[Callable],
                  add_handler: Optional[Callable],
                  edit_handler: Optional[Callable],
-                 edit_budgets_handler: Optional[Callable],
-                 get_db_expense_handler: Optional[Callable],
                  **kwargs) -> None:
         super().__init__(*args, **kwargs)
 
@@ -241,15 +250,12 @@ class expensesPage(QtWidgets.QWidget):
 
         self.expenses_list = expensesList(
             expenses_getter=get_handler,
-            expenses_editor=edit_handler,
-            budgets_editor=edit_budgets_handler,
-            db_expense_getter=get_db_expense_handler
+            expenses_editor=edit_handler
         )
         self.layout.addWidget(self.expenses_list)
 
         self.add_expense = elementAddExpense(
             get_category_list=get_categories_handler,
-            adder=add_handler,
-            budgets_editor=edit_budgets_handler
+            adder=add_handler
         )
         self.layout.addWidget(self.add_expense)
@@ -1,14 +1,21 @@
 from datetime import datetime, timedelta
-from typing import Protocol, Callable, Optional
+from typing import Any, Protocol, Callable, Optional
 from dateutil import relativedelta
 
 from bookkeeper.view.app import View
 from bookkeeper.repository.sqlite_repository import SQLiteRepository
+from bookkeeper.repository.cached_repository import CachedRepository
+from bookkeeper.repository.metrics import MeteredRepository, MetricsRegistry
+from bookkeeper.repository.rollup_repository import ARCHIVE_FILE, RollupRepository
 from bookkeeper.models.category import Category
 from bookkeeper.models.budget import Budget
 from bookkeeper.models.expense import Expense
 from bookkeeper.utils import build_dict_tree_from_list
-from bookkeeper.repository.abstract_repository import AbstractRepository
+from bookkeeper.repository.abstract_repository import AbstractRepository, unit_of_work
+from bookkeeper.repository.conditions import Between, Ge, Lt
+from bookkeeper.repository.events import (
+    ChangeEvent, ChangeKind, EventHub, ObservableRepository
+)
 
 categories_example = [
     ["продукты", None, 1],
@@ -53,9 +60,15 @@ class Bookkeeper:
         self.view.register_handlers(self.get_handlers())
         self.repository_factory = repository_factory
 
-        self.cat_repo = repository_factory[Category]
-        self.budget_repo = repository_factory[Budget]
-        self.expenses_repo = repository_factory[Expense]
+        # представления обновляются по событиям изменений, пачкой на транзакцию
+        self.events = EventHub()
+        self.events.subscribe(self.on_changes)
+        self.cat_repo = ObservableRepository(
+            repository_factory[Category], self.events, 'category')
+        self.budget_repo = ObservableRepository(
+            repository_factory[Budget], self.events, 'budget')
+        self.expenses_repo = ObservableRepository(
+            repository_factory[Expense], self.events, 'expense')
 
         self.view.start_app()
 
@@ -71,9 +84,7 @@ class Bookkeeper:
                 self.get_expenses,
                 self.get_categories_list,
                 self.add_expense,
-                self.edit_expenses,
-                self.update_budgets,
-                self.get_expense_from_repo
+                self.edit_expenses
             ],
             "budget": [
                 self.get_budget,
@@ -82,6 +93,22 @@ class Bookkeeper:
         }
         return handlers_dist
 
+    def on_changes(self, events: list[ChangeEvent]) -> None:
+        # изменения применяются к строкам представлений, таблицы не перечитываются
+        window = self.view.window
+        views = {
+            'category': [window.categories_page.categories_list,
+                         window.expenses_page.add_expense.choose_category],
+            'expense': [window.expenses_page.expenses_list],
+            'budget': [window.budget_page.budget_window],
+        }
+        for event in events:
+            for view in views[event.model]:
+                if event.kind is ChangeKind.DELETED:
+                    view.remove_row(event.pk)
+                else:
+                    view.put_row(event.obj)
+
     def get_category_tree(self) -> list[Category]:
         categories_list = self.cat_repo.get_all()
         # categories_tree = build_dict_tree_from_list(categories_list)
@@ -90,10 +117,6 @@ class Bookkeeper:
     def add_new_category(self,
                          category_name: str, parent_id: int | None = None) -> None:
         self.cat_repo.add(Category(name=category_name, parent=parent_id))
-        self.view.window.categories_page.categories_list.set_categories(
-            category_getter=self.get_category_tree)
-        self.view.window.expenses_page.add_expense.choose_category.update_categories(
-            category_list_getter=self.get_categories_list)
 
     def edit_existing_category(
             self,
@@ -103,17 +126,9 @@ class Bookkeeper:
             new_name = self.cat_repo.get(category_id).name
         self.cat_repo.update(
             Category(name=new_name, parent=new_parent_id, pk=category_id))
-        self.view.window.categories_page.categories_list.set_categories(
-            category_getter=self.get_category_tree)
-        self.view.window.expenses_page.add_expense.choose_category.update_categories(
-            category_list_getter=self.get_categories_list)
 
     def delete_category(self, category_id: int) -> None:
         self.cat_repo.delete(category_id)
-        self.view.window.categories_page.categories_list.set_categories(
-            category_getter=self.get_category_tree)
-        self.view.window.expenses_page.add_expense.choose_category.update_categories(
-            category_list_getter=self.get_categories_list)
 
     def get_expenses(self) -> list[Expense]:
         expenses = self.expenses_repo.get_all()
@@ -132,48 +147,46 @@ class Bookkeeper:
             category=category,
             expense_date=expense_date,
             comment=comment)
-        self.expenses_repo.update(edit_expense)
+        with unit_of_work(self.expenses_repo, self.budget_repo):
+            old_amount = self.expenses_repo.get(pk).amount
+            if amount != old_amount:
+                self.add_to_budgets(value=amount - old_amount, date=expense_date)
+            self.expenses_repo.update(edit_expense)
 
     def add_expense(
             self,
             amount: float,
             date: datetime,
             category: str, comment: str) -> None:
-        self.expenses_repo.add(
-            Expense(
-                amount=amount, category=category, expense_date=date, comment=comment))
-        self.view.window.expenses_page.expenses_list.set_expenses(
-            expenses_getter=self.get_expenses)
+        with unit_of_work(self.expenses_repo, self.budget_repo):
+            self.expenses_repo.add(
+                Expense(
+                    amount=amount, category=category, expense_date=date, comment=comment))
+            self.add_to_budgets(value=amount, date=date)
 
-    def get_categories_list(self) -> list[str]:
-        categories_list = self.cat_repo.get_all()
-        categories = []
-        for category in categories_list:
-            categories.append(category.name)
-        return categories
+    def get_categories_list(self) -> list[Any]:
+        return self.cat_repo.get_all(fields=['pk', 'name'])
 
     def get_budget(self) -> list[Budget]:
-        day_budgets = self.budget_repo.get_all(
-            subquery="WHERE expiration_date=(SELECT MAX(expiration_date) "
-                     + "FROM budget WHERE duration='День')")
-        week_budgets = self.budget_repo.get_all(
-            subquery="WHERE expiration_date=(SELECT MAX(expiration_date) "
-                     + "FROM budget WHERE duration='Неделя')")
-        month_budgets = self.budget_repo.get_all(
-            subquery="WHERE expiration_date=(SELECT MAX(expiration_date) "
-                     + "FROM budget WHERE duration='Месяц')")
-        return day_budgets + week_budgets + month_budgets
+        latest = self.budget_repo.aggregate(
+            'max', 'expiration_date', group_by='duration')
+        budgets = []
+        for duration in ("День", "Неделя", "Месяц"):
+            if duration in latest:
+                budgets += self.budget_repo.get_all(
+                    {'duration': duration, 'expiration_date': latest[duration]})
+        return budgets
 
     def get_expenses_from_data_range(
             self,
             end_date: datetime,
-            start_date: datetime = datetime.now()) -> list[Expense]:
-        start = start_date.strftime("%Y-%m-%d %H:%M:%S")
-        end = end_date.strftime("%Y-%m-%d %H:%M:%S")
-        expenses = self.expenses_repo.get_all(
-            subquery=f"WHERE expense_date <= '{end}' AND expense_date > '{start}'"
-        )
-        return expenses
+            start_date: datetime | None = None) -> list[Expense]:
+        if start_date is None:
+            start_date = datetime.now()
+        # как и прежде, полуинтервал (start_date, end_date]: даты хранятся
+        # в целых секундах, поэтому нижняя граница сдвигается на секунду
+        return self.expenses_repo.get_all(
+            {'expense_date': Between(start_date + timedelta(seconds=1), end_date)})
 
     def set_budget(self, amount: float, duration: str) -> None:
         if duration == "День":
@@ -184,43 +197,45 @@ class Bookkeeper:
             expiration_date = datetime.now() + relativedelta.relativedelta(months=1)
         else:
             raise ValueError("Wrong duration, set День/Неделя/Месяц")
-        possible_expenses = self.get_expenses_from_data_range(end_date=expiration_date)
-        start_amount = 0.0
-        for expense in possible_expenses:
-            start_amount += expense.amount
+        # расходы за (сейчас, expiration_date], как в get_expenses_from_data_range
+        start_amount = self.expenses_repo.aggregate(
+            'sum', 'amount',
+            {'expense_date': Between(datetime.now() + timedelta(seconds=1),
+                                     expiration_date)})
         budget = Budget(
-            amount=start_amount,
+            amount=start_amount or 0.0,
             limits=amount,
             duration=duration,
             expiration_date=expiration_date)
         self.budget_repo.add(budget)
-        self.view.window.budget_page.budget_window.set_budgets(
-            budgets_getter=self.get_budget)
 
     def get_budgets_with_appropriate_period(self, date: datetime) -> list[Budget]:
-        d_str = date.strftime("%Y-%m-%d %H:%M:%S")
         budgets = self.budget_repo.get_all(
-            subquery=f"WHERE start_date < '{d_str}' AND expiration_date >= '{d_str}'"
-        )
+            {'expiration_date': Ge(date), 'start_date': Lt(date)})
         return budgets
 
-    def update_budgets(self, value: float, date: datetime) -> None:
+    def add_to_budgets(self, value: float, date: datetime) -> None:
         budgets = self.get_budgets_with_appropriate_period(date=date)
         for budget in budgets:
             budget.amount += value
-            self.budget_repo.update(budget)
-
-        self.view.window.budget_page.budget_window.set_budgets(
-            budgets_getter=self.get_budget)
-
-    def get_expense_from_repo(self, pk: int) -> Expense:
-        return self.expenses_repo.get(pk)
+        self.budget_repo.update_many(budgets)
 
 
 if __name__ == "__main__":
-    app = Bookkeeper(
-        view=View(), repository_factory=SQLiteRepository.repository_factory(
-            models=[Category, Expense, Budget],
-            db_file='bookkeeper/databases/client.sqlite.db'
-        )
+    repositories = SQLiteRepository.repository_factory(
+        models=[Category, Expense, Budget],
+        db_file='bookkeeper/databases/client.sqlite.db'
     )
+    repositories[Category] = CachedRepository(repositories[Category])
+    # агрегаты расходов учитывают сводки свернутых старых расходов
+    # (свертка: python -m bookkeeper.repository.rollup_repository --cutoff ...)
+    repositories[Expense] = RollupRepository(repositories[Expense], ARCHIVE_FILE)
+    metrics = MetricsRegistry()
+    repositories = {model: MeteredRepository(repo, metrics, model.__name__.lower())
+                    for model, repo in repositories.items()}
+    try:
+        app = Bookkeeper(view=View(), repository_factory=repositories)
+    finally:
+        # метрики обращений к базе за сеанс (формат Prometheus)
+        with open('bookkeeper/databases/metrics.prom', 'w', encoding='utf-8') as file:
+            file.write(metrics.to_prometheus())
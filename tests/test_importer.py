@@ -0,0 +1,159 @@
+from datetime import datetime
+from textwrap import dedent
+
+import pytest
+
+from bookkeeper.importer import (
+    CategoryResolver, import_expenses, main, parse_amount, read_csv, read_ofx
+)
+from bookkeeper.models.category import Category
+from bookkeeper.models.expense import Expense
+from bookkeeper.repository.memory_repository import MemoryRepository
+from bookkeeper.repository.sqlite_connection import SQLiteConnectionPool
+from bookkeeper.repository.sqlite_repository import SQLiteRepository
+
+CSV = dedent('''\
+    Дата;Сумма;Категория;Описание
+    2023-01-05;1 250,50;продукты;магазин
+    2023-01-06;300;книги;
+    2023-01-07;abc;книги;ошибка
+    2023-01-08;99.9;одежда;неизвестная категория
+    2023-01-09;-40;книги;возврат
+''')
+
+OFX = dedent('''\
+    OFXHEADER:100
+    <OFX><BANKMSGSRSV1><STMTTRNRS><STMTRS><BANKTRANLIST>
+    <STMTTRN>
+    <TRNTYPE>DEBIT
+    <DTPOSTED>20230105120000[-5:EST]
+    <TRNAMT>-12.50
+    <NAME>Coffee shop
+    <MEMO>latte
+    </STMTTRN>
+    <STMTTRN><TRNTYPE>CREDIT<DTPOSTED>20230106<TRNAMT>1000.00<NAME>Salary</STMTTRN>
+    <STMTTRN><TRNTYPE>DEBIT<DTPOSTED>20230107<TRNAMT>-3<NAME>Bus</STMTTRN>
+    </BANKTRANLIST></STMTRS></STMTTRNRS></BANKMSGSRSV1></OFX>
+''')
+
+MAPPING = {'expense_date': 'Дата', 'amount': 'Сумма',
+           'category': 'Категория', 'comment': 'Описание'}
+
+
+@pytest.fixture
+def categories():
+    repo = MemoryRepository(indexes=['name'])
+    repo.add_many([Category('продукты'), Category('книги'), Category('транспорт')])
+    return repo
+
+
+def test_parse_amount():
+    assert parse_amount('1 250,50') == 1250.5
+    assert parse_amount('1,250.50') == 1250.5
+    assert parse_amount('1.234,56') == 1234.56
+    assert parse_amount('1,234,567.5') == 1234567.5
+    assert parse_amount('12,5') == 12.5
+    assert parse_amount('1,234,567') == parse_amount('1.234.567') == 1234567.0
+    assert parse_amount('1 234.567,8') == 1234567.8
+    assert parse_amount('1,234') == parse_amount('1.234') == 1234.0
+    assert parse_amount('0.05') == 0.05
+    assert parse_amount('\xa0300') == 300.0
+    with pytest.raises(ValueError):
+        parse_amount('abc')
+
+
+def test_read_csv():
+    records = list(read_csv(CSV.splitlines(), MAPPING, delimiter=';'))
+    assert records[0] == {'amount': '1 250,50', 'category': 'продукты',
+                          'expense_date': '2023-01-05', 'comment': 'магазин'}
+    assert len(records) == 5
+
+
+def test_read_csv_debits_negative():
+    lines = ['amount;category', '-1 250,50;книги', '300;книги', ' -3;книги', ';книги']
+    records = list(read_csv(lines, delimiter=';', debits_negative=True))
+    assert [record['amount'] for record in records] == ['1 250,50', '', '3', '']
+
+
+def test_read_ofx():
+    records = list(read_ofx(OFX.splitlines()))
+    assert records == [
+        {'amount': '12.50', 'expense_date': '2023-01-05T12:00:00',
+         'comment': 'Coffee shop latte'},
+        {'amount': '', 'expense_date': '2023-01-06T00:00:00', 'comment': 'Salary'},
+        {'amount': '3', 'expense_date': '2023-01-07T00:00:00', 'comment': 'Bus'},
+    ]
+
+
+def test_import_csv(categories, caplog):
+    expenses = MemoryRepository()
+    reports = []
+    stats = import_expenses(read_csv(CSV.splitlines(), MAPPING, ';'), expenses,
+                            categories, batch_size=1,
+                            progress=lambda s: reports.append((s.read, s.imported)))
+    assert (stats.read, stats.imported, stats.skipped) == (5, 2, 3)
+    assert reports == [(1, 1), (2, 2)]
+    first, second = expenses.get_all()
+    assert (first.amount, first.category, first.expense_date, first.comment) == \
+        (1250.5, 'продукты', datetime(2023, 1, 5), 'магазин')
+    assert second.category == 'книги'
+    assert 'unknown category' in caplog.text
+    assert 'negative amount' in caplog.text
+
+
+def test_import_ofx_batches(categories):
+    expenses = MemoryRepository()
+    calls = []
+    add_many = expenses.add_many
+    expenses.add_many = lambda batch: calls.append(len(batch)) or add_many(batch)
+    stats = import_expenses(read_ofx(OFX.splitlines() * 3), expenses, categories,
+                            batch_size=4, default_category='транспорт')
+    assert (stats.read, stats.imported, stats.skipped) == (9, 6, 3)
+    assert calls == [4, 2]
+    assert {obj.category for obj in expenses.get_all()} == {'транспорт'}
+
+
+def test_category_resolver_caches(categories):
+    resolver = CategoryResolver(categories, create_missing=True)
+    lookups = []
+    get_all = categories.get_all
+    categories.get_all = lambda *args, **kwargs: lookups.append(args) or \
+        get_all(*args, **kwargs)
+    assert resolver.resolve(' книги ') == 'книги'
+    assert resolver.resolve('книги') == 'книги'
+    assert resolver.resolve('спорт') == 'спорт'
+    assert len(lookups) == 2
+    assert resolver.pks == {'книги': 2, 'спорт': 4}
+
+
+def test_cli(tmp_path, capsys):
+    source = tmp_path / 'statement.csv'
+    source.write_text(CSV, encoding='utf-8')
+    db_file = str(tmp_path / 'db.sqlite')
+    args = [str(source), '--db', db_file, '--delimiter', ';', '--create-categories',
+            *(f'--map={field}={column}' for field, column in MAPPING.items())]
+    assert main(args) == 1
+    assert 'imported 3' in capsys.readouterr().err
+    with SQLiteRepository(Expense, db_file) as repo:
+        assert [obj.amount for obj in repo.get_all()] == [1250.5, 300.0, 99.9]
+    with pytest.raises(SystemExit):
+        main([str(source), '--map', 'unknown=column'])
+
+
+def test_cli_debits_negative(tmp_path):
+    source = tmp_path / 'statement.csv'
+    source.write_text('amount,category\n-12.5,книги\n40,книги\n', encoding='utf-8')
+    db_file = str(tmp_path / 'db.sqlite')
+    assert main([str(source), '--db', db_file, '--create-categories',
+                 '--debits-negative']) == 1
+    with SQLiteRepository(Expense, db_file) as repo:
+        assert [obj.amount for obj in repo.get_all()] == [12.5]
+
+
+def test_cli_closes_repositories_on_error(tmp_path):
+    source = tmp_path / 'statement.csv'
+    source.write_text('amount,category\n1,книги\n', encoding='cp1251')
+    db_file = str(tmp_path / 'db.sqlite')
+    with pytest.raises(UnicodeDecodeError):
+        main([str(source), '--db', db_file, '--create-categories'])
+    assert SQLiteConnectionPool._key(db_file) not in SQLiteConnectionPool._pools
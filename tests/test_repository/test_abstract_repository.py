@@ -1,4 +1,6 @@
-from bookkeeper.repository.abstract_repository import AbstractRepository
+from bookkeeper.repository.abstract_repository import (
+    AbstractRepository, Searchable, SupportsPutMany, bind_optional, unit_of_work
+)
 
 import pytest
 
@@ -18,3 +20,39 @@ def test_can_create_subclass():
 
     t = Test()
     assert isinstance(t, AbstractRepository)
+    assert not isinstance(t, SupportsPutMany)
+
+
+def test_bind_optional():
+    class Source:
+        def put_many(self, objs): return 'source put_many'
+        def search(self, query, limit=10): return [query]
+
+    class Wrapper:
+        def _search(self, repo, query, limit=10): return ['wrapped', *repo.search(query)]
+
+    class Writer:
+        def put_many(self, objs): return 'own put_many'
+
+    wrapper = Wrapper()
+    bind_optional(wrapper, Source())
+    assert wrapper.put_many([]) == 'source put_many'
+    assert wrapper.search('x') == ['wrapped', 'x']
+    writer = Writer()
+    bind_optional(writer, Source())
+    assert writer.put_many([]) == 'own put_many'
+    plain = Wrapper()
+    bind_optional(plain, object())
+    assert not isinstance(plain, (SupportsPutMany, Searchable))
+
+
+def test_default_transaction_is_noop():
+    class Test(AbstractRepository):
+        def add(self, obj): pass
+        def get(self, pk): pass
+        def get_all(self, where=None): pass
+        def update(self, obj): pass
+        def delete(self, pk): pass
+
+    with unit_of_work(Test(), Test()):
+        pass
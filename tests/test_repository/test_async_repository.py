@@ -0,0 +1,88 @@
+import asyncio
+from dataclasses import dataclass
+
+import pytest
+
+from bookkeeper.repository.async_repository import (
+    AsyncMemoryRepository, AsyncSQLiteRepository
+)
+from bookkeeper.repository.sqlite_repository import SQLiteRepository
+
+
+@dataclass
+class Custom:
+    name: str
+    value: int = 0
+    pk: int = 0
+
+
+async def collect(aiterator):
+    return [obj async for obj in aiterator]
+
+
+async def crud(repo):
+    obj = Custom('first', 1)
+    pk = await repo.add(obj)
+    assert obj.pk == pk
+    assert await repo.get(pk) == obj
+    await repo.update(Custom('changed', 2, pk=pk))
+    assert await repo.get_all({'value': 2}) == [Custom('changed', 2, pk=pk)]
+    pks = await repo.add_many([Custom(str(i), i) for i in range(5)])
+    assert len(pks) == 5
+    names = [o.name for o in await collect(repo.iter_all(order_by='value', batch_size=2))]
+    assert names == ['0', '1', 'changed', '2', '3', '4']
+    await repo.delete(pk)
+    await repo.delete_many(pks[:2])
+    assert [o.name for o in await repo.get_all()] == ['2', '3', '4']
+    assert await repo.get_all({'value': 3}, fields=['name']) == [('3',)]
+
+
+def test_memory_crud():
+    asyncio.run(crud(AsyncMemoryRepository()))
+
+
+@pytest.mark.parametrize('wal', [False, True])
+def test_sqlite_crud(tmp_path, wal):
+    async def run():
+        with SQLiteRepository(Custom, str(tmp_path / 'db.sqlite'), wal=wal) as sync_repo:
+            async with AsyncSQLiteRepository(sync_repo, max_workers=2) as repo:
+                await crud(repo)
+
+    asyncio.run(run())
+
+
+@pytest.mark.parametrize('wal', [False, True])
+def test_sqlite_in_memory(wal):
+    async def run():
+        with SQLiteRepository(Custom, ':memory:', wal=wal) as sync_repo:
+            async with AsyncSQLiteRepository(sync_repo, max_workers=2) as repo:
+                await crud(repo)
+            assert [o.name for o in sync_repo.get_all()] == ['2', '3', '4']
+
+    asyncio.run(run())
+
+
+@pytest.mark.parametrize('wal', [False, True])
+def test_sqlite_in_memory_concurrent(wal):
+    async def run():
+        with SQLiteRepository(Custom, ':memory:', wal=wal) as sync_repo:
+            async with AsyncSQLiteRepository(sync_repo, max_workers=8) as repo:
+                results = await asyncio.gather(
+                    *(repo.add(Custom(str(i), i % 3)) for i in range(300)),
+                    *(repo.get_all({'value': i % 3}) for i in range(300)))
+            assert sorted(results[:300]) == list(range(1, 301))
+            assert len(sync_repo.get_all()) == 300
+
+    asyncio.run(run())
+
+
+def test_sqlite_concurrent_requests(tmp_path):
+    async def run():
+        with SQLiteRepository(Custom, str(tmp_path / 'db.sqlite')) as sync_repo:
+            async with AsyncSQLiteRepository(sync_repo, max_workers=2) as repo:
+                await repo.add_many([Custom(str(i), i % 3) for i in range(30)])
+                results = await asyncio.gather(
+                    *(repo.get_all({'value': i % 3}) for i in range(20)))
+                assert [len(r) for r in results] == [10] * 20
+
+    asyncio.run(run())
@@ -0,0 +1,162 @@
+import sqlite3
+import time
+from dataclasses import dataclass
+
+import pytest
+
+from bookkeeper.repository.abstract_repository import AbstractRepository
+from bookkeeper.repository.buffered_repository import BufferedRepository
+from bookkeeper.repository.memory_repository import MemoryRepository
+from bookkeeper.repository.sqlite_repository import SQLiteRepository
+
+
+@dataclass
+class Custom:
+    name: str
+    value: int = 0
+    pk: int = 0
+
+
+@pytest.fixture
+def source():
+    return MemoryRepository()
+
+
+@pytest.fixture
+def repo(source):
+    with BufferedRepository(source, max_pending=3, flush_interval=None) as r:
+        yield r
+
+
+def test_pks_assigned_after_existing(source):
+    source.add_many(Custom(str(i)) for i in range(2))
+    with BufferedRepository(source, flush_interval=None) as repo:
+        assert repo.add(Custom('new')) == 3
+    assert source.get(3).name == 'new'
+    assert source.add(Custom('next')) == 4
+
+
+def test_writes_are_buffered(repo, source):
+    obj = Custom('a')
+    pk = repo.add(obj)
+    assert repo.pending == 1
+    assert repo.get(pk) is obj
+    assert source.get(pk) is None
+    repo.flush()
+    assert repo.pending == 0
+    assert source.get(pk) is obj
+
+
+def test_flush_on_size_limit(repo, source):
+    pks = repo.add_many(Custom(str(i)) for i in range(3))
+    assert repo.pending == 0
+    assert [source.get(pk).name for pk in pks] == ['0', '1', '2']
+
+
+def test_update_of_pending_add(repo, source):
+    pk = repo.add(Custom('a'))
+    repo.update(Custom('b', pk=pk))
+    assert repo.pending == 1
+    repo.flush()
+    assert source.get(pk).name == 'b'
+
+
+def test_update_existing(repo, source):
+    pk = source.add(Custom('a'))
+    repo.update(Custom('b', pk=pk))
+    assert repo.get(pk).name == 'b'
+    assert source.get(pk).name == 'a'
+    assert repo.get_all()[0].name == 'b'
+
+
+def test_cannot_add_with_pk(repo):
+    with pytest.raises(ValueError):
+        repo.add(Custom('a', pk=1))
+    with pytest.raises(ValueError):
+        repo.update(Custom('a'))
+
+
+def test_delete_flushes(repo, source):
+    pk = repo.add(Custom('a'))
+    repo.delete(pk)
+    assert source.get_all() == []
+
+
+def test_flush_on_time(source):
+    with BufferedRepository(source, flush_interval=0.01) as repo:
+        pk = repo.add(Custom('a'))
+        deadline = time.monotonic() + 5
+        while source.get(pk) is None and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert repo.pending == 0
+        assert source.get(pk).name == 'a'
+
+
+def test_flush_on_time_sqlite_in_memory():
+    with SQLiteRepository(Custom, ':memory:') as source, \
+            BufferedRepository(source, flush_interval=0.01) as repo:
+        pk = repo.add(Custom('a'))
+        deadline = time.monotonic() + 5
+        while repo.pending and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert source.get(pk).name == 'a'
+
+
+def test_flush_on_close_sqlite(tmp_path):
+    db_file = str(tmp_path / 'test.sqlite.db')
+    with SQLiteRepository(Custom, db_file) as source:
+        source.add(Custom('old'))
+        with BufferedRepository(source, flush_interval=None) as repo:
+            pks = repo.add_many(Custom(str(i), i) for i in range(10))
+            assert len(source.get_all()) == 1
+        assert pks == list(range(2, 12))
+    with SQLiteRepository(Custom, db_file) as reopened:
+        assert [o.value for o in reopened.get_all()] == [0, *range(10)]
+
+
+def test_failed_flush_keeps_changes(tmp_path):
+    with SQLiteRepository(Custom, str(tmp_path / 'test.sqlite.db')) as source:
+        repo = BufferedRepository(source, flush_interval=None)
+        repo.add(Custom('a'))
+        repo.add(Custom('b', value=object()))
+        with pytest.raises(sqlite3.Error):
+            repo.flush()
+        assert repo.pending == 2
+        assert source.get_all() == []
+        repo.update(Custom('b', pk=2))
+        repo.close()
+        assert [o.name for o in source.get_all()] == ['a', 'b']
+
+
+def test_requires_put_many():
+    class Plain(AbstractRepository):
+        def add(self, obj): pass
+        def get(self, pk): pass
+        def get_all(self, where=None, fields=None): return []
+        def update(self, obj): pass
+        def delete(self, pk): pass
+
+    with pytest.raises(TypeError):
+        BufferedRepository(Plain())
+
+
+def test_rolled_back_transaction_discards_changes(tmp_path):
+    with SQLiteRepository(Custom, str(tmp_path / 'test.sqlite.db')) as source:
+        with BufferedRepository(source, flush_interval=0.01) as repo:
+            kept = repo.add(Custom('kept'))
+            with pytest.raises(ZeroDivisionError):
+                with repo.transaction():
+                    repo.add(Custom('lost'))
+                    repo.update(Custom('changed', pk=kept))
+                    time.sleep(0.05)
+                    1 / 0
+            assert repo.get(kept).name == 'kept'
+            assert repo.add(Custom('next')) == kept + 1
+        assert [o.name for o in source.get_all()] == ['kept', 'next']
+
+
+def test_put_many(repo, source):
+    repo.put_many([Custom('a', pk=10)])
+    assert repo.add(Custom('b')) == 11
+    repo.flush()
+    assert [o.pk for o in source.get_all()] == [10, 11]
@@ -0,0 +1,141 @@
+from dataclasses import dataclass
+
+import pytest
+
+from bookkeeper.repository.abstract_repository import (
+    AbstractRepository, Searchable, SupportsPutMany
+)
+from bookkeeper.repository.cached_repository import CachedRepository
+from bookkeeper.repository.conditions import Ge
+from bookkeeper.repository.memory_repository import MemoryRepository
+from bookkeeper.repository.sqlite_repository import SQLiteRepository
+
+
+@dataclass
+class Custom:
+    name: str
+    value: int = 0
+    pk: int = 0
+
+
+class Plain(AbstractRepository):
+    def add(self, obj): pass
+    def get(self, pk): pass
+    def get_all(self, where=None, fields=None): return []
+    def update(self, obj): pass
+    def delete(self, pk): pass
+
+
+@pytest.fixture
+def source():
+    return MemoryRepository()
+
+
+@pytest.fixture
+def repo(source):
+    return CachedRepository(source)
+
+
+def test_crud(repo):
+    obj = Custom('first', 1)
+    pk = repo.add(obj)
+    assert repo.get(pk) == obj
+    obj2 = Custom('second', 2, pk=pk)
+    repo.update(obj2)
+    assert repo.get(pk) == obj2
+    repo.delete(pk)
+    assert repo.get(pk) is None
+
+
+def test_get_hits_cache(repo, source):
+    pk = source.add(Custom('a'))
+    assert repo.get(pk).name == 'a'
+    source.delete(pk)
+    assert repo.get(pk).name == 'a'
+    assert (repo.object_stats.hits, repo.object_stats.misses) == (1, 1)
+    assert repo.object_stats.hit_rate == 0.5
+
+
+def test_lru_eviction(source):
+    repo = CachedRepository(source, max_objects=2)
+    pks = source.add_many(Custom(str(i)) for i in range(3))
+    for pk in pks:
+        repo.get(pk)
+    repo.get(pks[0])
+    assert repo.object_stats.misses == 4
+
+
+def test_get_all_hits_cache(repo, source):
+    pks = source.add_many(Custom(str(i), i) for i in range(4))
+    first = repo.get_all({'value': Ge(2)})
+    first.clear()
+    assert [o.name for o in repo.get_all({'value': Ge(2)})] == ['2', '3']
+    assert (repo.query_stats.hits, repo.query_stats.misses) == (1, 1)
+    repo.get(pks[2])
+    assert repo.object_stats.hits == 1
+
+
+def test_write_invalidates_matching_queries(repo):
+    repo.add_many(Custom(str(i), i) for i in range(4))
+    repo.get_all()
+    repo.get_all({'value': Ge(2)})
+    repo.get_all({'value': 0})
+    repo.add(Custom('new', 5))
+    assert len(repo.get_all()) == 5
+    assert [o.name for o in repo.get_all({'value': Ge(2)})] == ['2', '3', 'new']
+    repo.get_all({'value': 0})
+    assert repo.query_stats.hits == 1
+
+
+def test_update_and_delete_invalidate(repo):
+    pks = repo.add_many(Custom(str(i), i) for i in range(4))
+    assert len(repo.get_all({'value': Ge(2)})) == 2
+    repo.update(Custom('moved', 0, pk=pks[3]))
+    assert [o.name for o in repo.get_all({'value': Ge(2)})] == ['2']
+    repo.delete_many([pks[2]])
+    assert repo.get_all({'value': Ge(2)}) == []
+    assert repo.get(pks[2]) is None
+
+
+def test_fields_use_cached_objects(repo):
+    repo.add_many(Custom(str(i), i) for i in range(3))
+    assert repo.get_all({'value': Ge(1)}, fields=['name']) == [('1',), ('2',)]
+    assert [row.name for row in repo.get_all({'value': Ge(1)}, fields=['name'])] == \
+        ['1', '2']
+    assert repo.query_stats.hits == 1
+
+
+def test_unhashable_where_is_not_cached(repo):
+    repo.add(Custom('a'))
+    assert len(repo.get_all({'name': ['a']})) == 0
+    assert repo.query_stats.misses == 0
+
+
+def test_extra_arguments_pass_through(tmp_path):
+    with SQLiteRepository(Custom, str(tmp_path / 'test.sqlite.db')) as source:
+        repo = CachedRepository(source)
+        repo.add_many(Custom(str(i), i) for i in range(3))
+        result = repo.get_all(subquery='WHERE value > 0')
+        assert [o.name for o in result] == ['1', '2']
+        assert repo.query_stats.misses == 0
+
+
+def test_rollback_clears_cache(tmp_path):
+    with SQLiteRepository(Custom, str(tmp_path / 'test.sqlite.db')) as source:
+        repo = CachedRepository(source)
+        with pytest.raises(RuntimeError):
+            with repo.transaction():
+                pk = repo.add(Custom('a'))
+                raise RuntimeError
+        assert repo.get(pk) is None
+        assert repo.get_all() == []
+
+
+def test_capabilities_follow_source(repo):
+    assert isinstance(repo, SupportsPutMany)
+    assert not isinstance(repo, Searchable)
+    indexed = CachedRepository(MemoryRepository(text_fields=['name']))
+    assert isinstance(indexed, Searchable)
+    plain = CachedRepository(Plain())
+    assert not isinstance(plain, SupportsPutMany)
+    assert not isinstance(plain, Searchable)
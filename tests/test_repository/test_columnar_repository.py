@@ -0,0 +1,146 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from bookkeeper.models.expense import Expense
+from bookkeeper.repository.columnar_repository import (
+    BLOCK_SIZE, ColumnarExpenseRepository, mask_and
+)
+from bookkeeper.repository.conditions import Between, Ge, Gt, Le, Lt
+from bookkeeper.repository.memory_repository import MemoryRepository
+
+START = datetime(2023, 1, 1)
+
+
+def make_expenses(n):
+    return [Expense(amount=float(i % 50), category=f'cat{i % 7}',
+                    expense_date=START + timedelta(hours=i), added_date=START,
+                    comment='' if i % 3 else 'note') for i in range(n)]
+
+
+@pytest.fixture
+def repo():
+    return ColumnarExpenseRepository()
+
+
+@pytest.fixture
+def filled():
+    columnar, memory = ColumnarExpenseRepository(), MemoryRepository()
+    columnar.add_many(make_expenses(3 * BLOCK_SIZE))
+    memory.add_many(make_expenses(3 * BLOCK_SIZE))
+    # удаления переносят строки между блоками
+    for pk in range(1, 3 * BLOCK_SIZE, 97):
+        columnar.delete(pk)
+        memory.delete(pk)
+    return columnar, memory
+
+
+def test_crud(repo):
+    obj = Expense(100.0, 'food', START, START, 'lunch')
+    pk = repo.add(obj)
+    assert obj.pk == pk
+    assert repo.get(pk) == obj
+    obj.amount = 200.0
+    repo.update(obj)
+    assert repo.get(pk).amount == 200.0
+    repo.delete(pk)
+    assert repo.get(pk) is None
+    assert len(repo) == 0
+
+
+def test_errors(repo):
+    with pytest.raises(ValueError):
+        repo.add(Expense(1.0, 'food', pk=1))
+    with pytest.raises(ValueError):
+        repo.update(Expense(1.0, 'food'))
+    with pytest.raises(KeyError):
+        repo.delete(1)
+    with pytest.raises(ValueError):
+        repo.get_all({'unknown': 1})
+
+
+def test_delete_many_and_put_many(repo):
+    pks = repo.add_many(make_expenses(5))
+    repo.delete_many([pks[0], pks[0], pks[1]])
+    with pytest.raises(KeyError):
+        repo.delete_many([pks[2], pks[0]])
+    assert len(repo) == 3
+    repo.put_many([Expense(7.0, 'new', START, START, pk=10),
+                   Expense(8.0, 'new', START, START, pk=pks[2])])
+    assert repo.get(pks[2]).amount == 8.0
+    assert repo.add(Expense(1.0, 'food')) == 11
+
+
+@pytest.mark.parametrize('where', [
+    {'category': 'cat3'},
+    {'category': 'missing'},
+    {'category': Between('cat2', 'cat4')},
+    {'comment': 'note', 'amount': Gt(40)},
+    {'amount': 10},
+    {'amount': Le(3), 'category': 'cat1'},
+    {'expense_date': Between(START + timedelta(days=100), START + timedelta(days=200))},
+    {'expense_date': Lt(START + timedelta(days=10))},
+    {'expense_date': Ge(START + timedelta(days=400)), 'amount': Between(5, 6)},
+    {'pk': Between(100, 5000)},
+])
+def test_get_all_matches_memory(filled, where):
+    columnar, memory = filled
+    assert sorted(obj.pk for obj in columnar.get_all(where)) == \
+        [obj.pk for obj in memory.get_all(where)]
+
+
+def test_get_all_fields(filled):
+    columnar, memory = filled
+    where = {'category': 'cat2', 'expense_date': Lt(START + timedelta(days=30))}
+    fields = ['pk', 'expense_date', 'category']
+    assert sorted(columnar.get_all(where, fields=fields)) == \
+        memory.get_all(where, fields=fields)
+
+
+@pytest.mark.parametrize('func, field', [
+    ('sum', 'amount'), ('avg', 'amount'), ('count', 'amount'), ('sum', 'pk'),
+    ('min', 'expense_date'), ('max', 'expense_date'), ('max', 'pk'),
+])
+def test_aggregate_matches_memory(filled, func, field):
+    columnar, memory = filled
+    # группа, где все суммы пусты
+    for repo in filled:
+        repo.add_many([Expense(None, 'unpriced', START, START) for _ in range(2)])
+    where = {'amount': Ge(10)}
+    assert columnar.aggregate(func, field, where) == \
+        memory.aggregate(func, field, where)
+    assert columnar.aggregate(func, field, group_by='category') == \
+        memory.aggregate(func, field, group_by='category')
+
+
+def test_aggregate_empty_and_nulls(repo):
+    assert repo.aggregate('sum', 'amount') is None
+    assert repo.aggregate('count') == 0
+    repo.add_many([Expense(None, 'food', START, START),
+                   Expense(5.0, 'food', START, START)])
+    assert repo.aggregate('sum', 'amount') == 5.0
+    assert repo.aggregate('count', 'amount', group_by='category') == {'food': 1}
+    assert [obj.pk for obj in repo.get_all({'amount': None})] == [1]
+    repo.add(Expense(None, 'books', START, START))
+    assert repo.aggregate('sum', 'amount', group_by='category') == \
+        {'food': 5.0, 'books': None}
+    assert repo.aggregate('count', 'amount', group_by='category') == \
+        {'food': 1, 'books': 0}
+    with pytest.raises(ValueError):
+        repo.aggregate('median', 'amount')
+
+
+def test_many_distinct_values(repo):
+    repo.add_many(Expense(1.0, f'cat{i}', START, START, comment=str(i))
+                  for i in range(70_000))
+    for i in range(300):
+        repo.add(Expense(2.0, f'single{i}', START, START))
+    assert repo.aggregate('sum', 'amount', {'category': Ge('single')}) \
+        == 600.0
+    assert repo.aggregate('count', where={'category': 'cat300'}) == 1
+    assert repo.get_all({'comment': '69999'})[0].category == 'cat69999'
+
+
+def test_mask_and():
+    assert mask_and(None, b'\x01\x00') == b'\x01\x00'
+    assert mask_and(b'\x01\x01\x00', b'\x00\x01\x00') == b'\x00\x01\x00'
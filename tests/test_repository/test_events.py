@@ -0,0 +1,100 @@
+import pytest
+
+from bookkeeper.models.category import Category
+from bookkeeper.repository.abstract_repository import unit_of_work
+from bookkeeper.repository.events import (
+    ChangeEvent, ChangeKind, EventHub, ObservableRepository
+)
+from bookkeeper.repository.memory_repository import MemoryRepository
+from bookkeeper.repository.sqlite_repository import SQLiteRepository
+
+
+@pytest.fixture
+def hub():
+    return EventHub()
+
+
+@pytest.fixture
+def received(hub):
+    batches = []
+    hub.subscribe(batches.append)
+    return batches
+
+
+@pytest.fixture
+def repo(hub):
+    return ObservableRepository(MemoryRepository(), hub, 'category')
+
+
+def test_add_update_delete(repo, received):
+    obj = Category('food')
+    pk = repo.add(obj)
+    assert received == [[ChangeEvent('category', ChangeKind.INSERTED, pk,
+                                     ('name', 'parent'), obj)]]
+    repo.update(Category('meal', pk=pk))
+    assert received[-1][0].kind == ChangeKind.UPDATED
+    assert received[-1][0].fields == ('name',)
+    repo.update(Category('meal', pk=pk))
+    assert len(received) == 2
+    repo.delete(pk)
+    assert received[-1] == [ChangeEvent('category', ChangeKind.DELETED, pk)]
+
+
+def test_failed_mutation_publishes_nothing(repo, received):
+    with pytest.raises(KeyError):
+        repo.delete(1)
+    assert received == []
+
+
+def test_many(repo, received):
+    pks = repo.add_many([Category('a'), Category('b')])
+    assert [event.pk for event in received[0]] == pks
+    repo.delete_many([pks[0], pks[0]])
+    assert [event.pk for event in received[1]] == [pks[0]]
+
+
+def test_put_many_kinds(hub, received):
+    repo = ObservableRepository(MemoryRepository(), hub)
+    assert repo.model == 'MemoryRepository'
+    pk = repo.add(Category('a'))
+    repo.put_many([Category('b', pk=pk), Category('c', pk=10)])
+    assert [(event.kind, event.pk) for event in received[-1]] == \
+        [(ChangeKind.UPDATED, pk), (ChangeKind.INSERTED, 10)]
+
+
+def test_transaction_delivers_one_batch(hub, received, tmp_path):
+    repos = SQLiteRepository.repository_factory(
+        models=[Category], db_file=str(tmp_path / 'db.sqlite'))
+    repo = ObservableRepository(repos[Category], hub)
+    assert repo.model == 'category'
+    other = ObservableRepository(MemoryRepository(), hub, 'other')
+    with unit_of_work(repo, other):
+        repo.add(Category('a'))
+        other.add(Category('b'))
+        assert received == []
+    assert [event.model for event in received[0]] == ['category', 'other']
+    with pytest.raises(RuntimeError):
+        with repo.transaction():
+            repo.add(Category('c'))
+            raise RuntimeError
+    assert len(received) == 1
+    assert [obj.name for obj in repo.get_all()] == ['a']
+
+
+def test_subscriptions(hub, repo, caplog):
+    models = []
+
+    def fail(events):
+        raise RuntimeError('broken view')
+
+    hub.subscribe(fail)
+    unsubscribe = hub.subscribe(lambda events: models.append(events[0].model),
+                                models=['category'])
+    hub.subscribe(lambda events: pytest.fail('unexpected events'), models=['budget'])
+    repo.add(Category('a'))
+    assert models == ['category']
+    assert 'broken view' in caplog.text
+    unsubscribe()
+    unsubscribe()
+    repo.add(Category('b'))
+    assert models == ['category']
@@ -1,3 +1,4 @@
+from bookkeeper.repository.conditions import Between, Ge, Gt, Le, Lt
 from bookkeeper.repository.memory_repository import MemoryRepository
 
 import pytest
@@ -69,3 +70,189 @@ def test_get_all_with_condition(repo, custom_class):
         objects.append(o)
     assert repo.get_all({'name': '0'}) == [objects[0]]
     assert repo.get_all({'test': 'test'}) == objects
+
+
+def test_add_many(repo, custom_class):
+    objects = [custom_class() for i in range(3)]
+    pks = repo.add_many(objects)
+    assert pks == [o.pk for o in objects]
+    assert repo.get_all() == objects
+
+
+def test_add_many_checks_all_before_adding(repo, custom_class):
+    objects = [custom_class(), custom_class()]
+    objects[1].pk = 5
+    with pytest.raises(ValueError):
+        repo.add_many(objects)
+    assert repo.get_all() == []
+
+
+def test_update_and_delete_many(repo, custom_class):
+    objects = [custom_class() for i in range(3)]
+    repo.add_many(objects)
+    new = custom_class()
+    new.pk = objects[0].pk
+    repo.update_many([new])
+    assert repo.get(new.pk) is new
+    repo.delete_many([objects[1].pk, objects[2].pk])
+    assert repo.get_all() == [new]
+    with pytest.raises(KeyError):
+        repo.delete_many([objects[1].pk])
+
+
+def test_iter_all_ordered_with_keyset(repo, custom_class):
+    objects = []
+    for value in [3, None, 1, 3, 2]:
+        o = custom_class()
+        o.value = value
+        repo.add(o)
+        objects.append(o)
+    ordered = list(repo.iter_all(order_by='value'))
+    assert ordered == [objects[i] for i in (1, 2, 4, 0, 3)]
+    assert list(repo.iter_all(order_by='value', after=3, after_pk=objects[0].pk)) \
+        == [objects[3]]
+    assert list(repo.iter_all(order_by='value', after=None, after_pk=objects[1].pk)) \
+        == ordered[1:]
+    assert list(repo.iter_all(order_by='value', after=2, descending=True)) \
+        == [objects[2], objects[1]]
+    assert list(repo.iter_all(after_pk=3)) == objects[3:]
+
+
+def test_get_all_with_range_conditions(repo, custom_class):
+    objects = []
+    for i in range(5):
+        o = custom_class()
+        o.value = i if i != 2 else None
+        repo.add(o)
+        objects.append(o)
+    assert repo.get_all({'value': Between(1, 3)}) == [objects[1], objects[3]]
+    assert repo.get_all({'value': Lt(1)}) == [objects[0]]
+    assert repo.get_all({'value': Le(1)}) == objects[:2]
+    assert repo.get_all({'value': Gt(3)}) == [objects[4]]
+    assert repo.get_all({'value': Ge(3)}) == objects[3:]
+
+
+def test_put_many(repo, custom_class):
+    obj = custom_class()
+    obj.pk = 5
+    repo.put_many([obj])
+    assert repo.get(5) is obj
+    assert repo.add(custom_class()) == 6
+    with pytest.raises(ValueError):
+        repo.put_many([custom_class()])
+
+
+def test_get_all_fields(repo, custom_class):
+    objects = [custom_class() for _ in range(3)]
+    for i, obj in enumerate(objects):
+        obj.value = i
+        repo.add(obj)
+    rows = repo.get_all({'value': Ge(1)}, fields=['pk', 'value'])
+    assert rows == [(2, 1), (3, 2)]
+    assert rows[0].value == 1
+    assert type(rows[0]) is type(repo.get_all(fields=['pk', 'value'])[0])
+
+
+def test_aggregate(repo, custom_class):
+    for group, value in [('a', 1), ('a', 2), ('b', 4), ('b', None)]:
+        obj = custom_class()
+        obj.group, obj.value = group, value
+        repo.add(obj)
+    assert repo.aggregate('sum', 'value') == 7
+    assert repo.aggregate('count', 'value') == 3
+    assert repo.aggregate('avg', 'value', {'group': 'a'}) == 1.5
+    assert repo.aggregate('sum', 'value', group_by='group') == {'a': 3, 'b': 4}
+    assert repo.aggregate('count', 'value', group_by='group') == {'a': 2, 'b': 1}
+    assert repo.aggregate('max', 'value', {'value': Gt(10)}) is None
+    assert repo.aggregate('count', where={'value': Gt(10)}) == 0
+    with pytest.raises(ValueError):
+        repo.aggregate('median', 'value')
+
+
+@pytest.fixture
+def indexed_repo():
+    return MemoryRepository(indexes=['name'])
+
+
+def make(custom_class, name, value=0):
+    obj = custom_class()
+    obj.name, obj.value = name, value
+    return obj
+
+
+def test_index_lookup(indexed_repo, custom_class):
+    objects = [make(custom_class, name, i) for i, name in enumerate('abab')]
+    indexed_repo.add_many(objects)
+    assert indexed_repo.get_all({'name': 'b'}) == [objects[1], objects[3]]
+    assert indexed_repo.get_all({'name': 'b', 'value': Ge(2)}) == [objects[3]]
+    assert indexed_repo.get_all({'name': 'c'}) == []
+    assert indexed_repo.get_all({'value': 2}) == [objects[2]]
+    assert indexed_repo.get_all({'name': ['a']}) == []
+
+
+def test_index_skips_scan(indexed_repo, custom_class):
+    indexed_repo.add(custom_class())
+    obj = indexed_repo.get(indexed_repo.add(make(custom_class, 'a')))
+    assert indexed_repo.get_all({'name': 'a'}) == [obj]
+
+
+def test_index_follows_changes(indexed_repo, custom_class):
+    obj = make(custom_class, 'a')
+    pk = indexed_repo.add(obj)
+    obj.name = 'b'
+    indexed_repo.update(obj)
+    assert indexed_repo.get_all({'name': 'a'}) == []
+    assert indexed_repo.get_all({'name': 'b'}) == [obj]
+    indexed_repo.delete(pk)
+    assert indexed_repo.get_all({'name': 'b'}) == []
+    other = make(custom_class, 'c')
+    other.pk = 7
+    indexed_repo.put_many([other])
+    indexed_repo.delete_many([7])
+    assert indexed_repo.get_all({'name': 'c'}) == []
+
+
+class _Custom:
+    pk = 0
+
+
+@pytest.fixture
+def ranged():
+    plain, indexed = MemoryRepository(), MemoryRepository(range_indexes=['value'])
+    for value in [5, None, 3, 5, 1, None, 8, 3]:
+        for r in (plain, indexed):
+            r.add(make(_Custom, 'x', value))
+    return plain, indexed
+
+
+@pytest.mark.parametrize('condition', [
+    Between(3, 5), Lt(5), Le(5), Gt(3), Ge(3), Between(6, 2), 5, None])
+def test_range_index_lookup(ranged, condition):
+    plain, indexed = ranged
+    expected = [o.pk for o in plain.get_all({'value': condition})]
+    assert [o.pk for o in indexed.get_all({'value': condition})] == expected
+
+
+@pytest.mark.parametrize('descending', [False, True])
+def test_range_index_ordered_iteration(ranged, descending):
+    plain, indexed = ranged
+    expected = [o.pk for o in plain.iter_all(order_by='value', descending=descending)]
+    assert [o.pk for o in indexed.iter_all(order_by='value', descending=descending)] \
+        == expected
+    for obj in plain.get_all():
+        for after_pk in (obj.pk, None):
+            args = dict(order_by='value', after=obj.value, after_pk=after_pk,
+                        descending=descending)
+            assert [o.pk for o in indexed.iter_all(**args)] == \
+                [o.pk for o in plain.iter_all(**args)]
+
+
+def test_range_index_follows_changes(ranged):
+    _, indexed = ranged
+    obj = indexed.get(1)
+    obj.value = None
+    indexed.update(obj)
+    assert [o.pk for o in indexed.get_all({'value': Ge(5)})] == [4, 7]
+    indexed.delete(4)
+    assert [o.pk for o in indexed.iter_all({'name': 'x'}, order_by='value')] == \
+        [1, 2, 6, 5, 3, 8, 7]
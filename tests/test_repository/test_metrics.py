@@ -0,0 +1,101 @@
+import json
+from dataclasses import dataclass
+
+import pytest
+
+from bookkeeper.models.expense import Expense
+from bookkeeper.repository.abstract_repository import Searchable
+from bookkeeper.repository.columnar_repository import ColumnarExpenseRepository
+from bookkeeper.repository.memory_repository import MemoryRepository
+from bookkeeper.repository.metrics import (
+    Histogram, MeteredRepository, MetricsRegistry, estimate_size
+)
+from bookkeeper.repository.sqlite_repository import SQLiteRepository
+
+
+@dataclass
+class Custom:
+    name: str
+    value: int = 0
+    pk: int = 0
+
+
+@pytest.fixture
+def registry():
+    return MetricsRegistry()
+
+
+@pytest.fixture
+def repo(registry):
+    return MeteredRepository(MemoryRepository(), registry, model='custom')
+
+
+def test_estimate_size():
+    assert estimate_size(Custom('abc', 1, pk=2)) == 19
+    assert estimate_size(('ab', None, 1.5)) == 10
+
+
+def test_histogram():
+    histogram = Histogram(buckets=(1, 2))
+    for value in (0.5, 1.5, 1.7, 3):
+        histogram.observe(value)
+    assert histogram.cumulative() == [('1', 1), ('2', 3), ('+Inf', 4)]
+    assert (histogram.count, histogram.sum) == (4, 6.7)
+
+
+def test_counts_rows_and_bytes(repo, registry):
+    pks = repo.add_many(Custom(str(i), i) for i in range(3))
+    repo.get(pks[0])
+    repo.get(100)
+    assert len(repo.get_all()) == 3
+    assert [o.name for o in repo.iter_all(order_by='value')] == ['0', '1', '2']
+    add_many = registry.get('custom', 'add_many')
+    assert (add_many.calls, add_many.rows, add_many.bytes) == (1, 3, 0)
+    get = registry.get('custom', 'get')
+    assert (get.calls, get.rows, get.bytes) == (2, 1, 17)
+    assert registry.get('custom', 'get_all').bytes == 51
+    assert registry.get('custom', 'iter_all').rows == 3
+    assert registry.get('custom', 'get').latency.count == 2
+
+
+def test_errors(repo, registry):
+    with pytest.raises(KeyError):
+        repo.delete(1)
+    assert registry.get('custom', 'delete').errors == 1
+
+
+def test_search_only_if_supported(registry):
+    repo = MeteredRepository(MemoryRepository(text_fields=['name']), registry, 'custom')
+    pk = repo.add(Custom('coffee'))
+    assert repo.search('coffee') == [pk]
+    assert registry.get('custom', 'search').rows == 1
+    columnar = MeteredRepository(ColumnarExpenseRepository(), registry)
+    assert not isinstance(columnar, Searchable)
+    with pytest.raises(AttributeError):
+        columnar.search('coffee')
+    columnar.put_many([Expense(1.0, 'food', pk=1)])
+
+
+def test_disabled(repo):
+    disabled = MetricsRegistry(enabled=False)
+    metered = MeteredRepository(MemoryRepository(), disabled)
+    metered.add(Custom('a'))
+    assert list(metered.iter_all()) == metered.get_all()
+    assert disabled.to_dict() == {}
+
+
+def test_export(tmp_path, registry):
+    with SQLiteRepository(Custom, str(tmp_path / 'test.sqlite.db')) as sqlite_repo:
+        repo = MeteredRepository(sqlite_repo, registry)
+        repo.add(Custom('a'))
+        repo.aggregate('count')
+    data = json.loads(registry.to_json())
+    assert data['custom']['add']['calls'] == 1
+    assert data['custom']['aggregate']['latency']['buckets']['+Inf'] == 1
+    text = registry.to_prometheus()
+    assert 'bookkeeper_repository_calls_total{model="custom",method="add"} 1' in text
+    assert '# TYPE bookkeeper_repository_latency_seconds histogram' in text
+    assert 'bookkeeper_repository_latency_seconds_bucket' \
+        '{model="custom",method="add",le="+Inf"} 1' in text
+    assert 'bookkeeper_repository_latency_seconds_count' \
+        '{model="custom",method="aggregate"} 1' in text
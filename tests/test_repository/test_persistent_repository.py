@@ -0,0 +1,152 @@
+import threading
+from dataclasses import dataclass
+
+import pytest
+
+from bookkeeper.repository.append_log import AppendLog, read_frames, write_atomic
+from bookkeeper.repository.persistent_repository import PersistentMemoryRepository
+
+
+@dataclass
+class Custom:
+    name: str = ''
+    value: int = 0
+    pk: int = 0
+
+
+@dataclass
+class Extended:
+    name: str = ''
+    comment: str = 'none'
+    pk: int = 0
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / 'custom')
+
+
+@pytest.fixture
+def repo(path):
+    with PersistentMemoryRepository(Custom, path, fsync=False) as r:
+        yield r
+
+
+def test_read_frames_stops_at_bad_crc(tmp_path):
+    path = str(tmp_path / 'frames')
+    write_atomic(path, [b'one', b'two', b'three'])
+    with open(path, 'r+b') as file:
+        file.seek(-1, 2)
+        file.write(b'X')
+    payloads, end = read_frames(path)
+    assert payloads == [b'one', b'two']
+    assert end == 2 * 8 + 6
+
+
+def test_append_log_truncates_torn_tail(tmp_path):
+    path = str(tmp_path / 'log')
+    log = AppendLog(path, fsync=False)
+    log.sync(log.append(b'first'))
+    log.close()
+    with open(path, 'ab') as file:
+        file.write(b'\x10\x00')
+    log = AppendLog(path, fsync=False)
+    assert log.replay() == [b'first']
+    assert log.replay() == []
+    log.sync(log.append(b'second'))
+    log.close()
+    assert read_frames(path)[0] == [b'first', b'second']
+
+
+def test_reopen(repo, path):
+    pks = repo.add_many(Custom(str(i), i) for i in range(5))
+    repo.delete(pks[0])
+    obj = repo.get(pks[1])
+    obj.value = 100
+    repo.update(obj)
+    repo.close()
+    with PersistentMemoryRepository(Custom, path, fsync=False) as reopened:
+        assert reopened.get_all() == repo.get_all()
+        assert reopened.get(pks[1]).value == 100
+        assert reopened.add(Custom('new')) == pks[-1] + 1
+
+
+def test_pk_not_reused_after_delete(repo, path):
+    pk = repo.add(Custom())
+    repo.delete(pk)
+    repo.close()
+    with PersistentMemoryRepository(Custom, path, fsync=False) as reopened:
+        assert reopened.add(Custom()) == pk + 1
+
+
+def test_snapshot(repo, path):
+    pks = repo.add_many(Custom(str(i), i) for i in range(10))
+    repo.snapshot()
+    assert len(read_frames(repo.snapshot_path)[0]) == 2
+    assert read_frames(repo.log_path)[0] == []
+    repo.delete(pks[0])
+    repo.close()
+    with PersistentMemoryRepository(Custom, path, fsync=False) as reopened:
+        assert [obj.pk for obj in reopened.get_all()] == pks[1:]
+
+
+def test_automatic_snapshot(path):
+    with PersistentMemoryRepository(Custom, path, fsync=False,
+                                    snapshot_every=5) as r:
+        for i in range(12):
+            r.add(Custom(str(i), i))
+        assert len(read_frames(r.log_path)[0]) < 5
+    with PersistentMemoryRepository(Custom, path, fsync=False) as reopened:
+        assert len(reopened.get_all()) == 12
+
+
+def test_transaction_single_sync(repo, monkeypatch):
+    calls = []
+    sync = repo._log.sync
+    monkeypatch.setattr(repo._log, 'sync',
+                        lambda seq=None: calls.append(seq) or sync(seq))
+    with repo.transaction():
+        repo.add(Custom('a'))
+        repo.add(Custom('b'))
+        assert calls == []
+    assert len(calls) == 1
+    repo.add_many([Custom('c'), Custom('d')])
+    assert len(calls) == 2
+
+
+def test_concurrent_writes(repo, path):
+    def worker(n):
+        for i in range(20):
+            repo.add(Custom(str(n), i))
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    repo.close()
+    with PersistentMemoryRepository(Custom, path, fsync=False) as reopened:
+        assert len(reopened.get_all()) == 80
+
+
+def test_model_fields_changed(repo, path):
+    repo.add(Custom('a', 1))
+    repo.close()
+    with PersistentMemoryRepository(Extended, path, fsync=False) as reopened:
+        assert reopened.get_all() == [Extended('a', pk=1)]
+
+
+def test_indexes_rebuilt(repo, path):
+    repo.add_many(Custom(str(i % 2), i) for i in range(6))
+    repo.close()
+    with PersistentMemoryRepository(Custom, path, fsync=False, indexes=['name'],
+                                    range_indexes=['value']) as reopened:
+        assert [obj.value for obj in reopened.get_all({'name': '1'})] == [1, 3, 5]
+
+
+def test_destroy(repo):
+    repo.add(Custom())
+    repo.snapshot()
+    repo.destroy()
+    assert read_frames(repo.log_path) == ([], 0)
+    assert read_frames(repo.snapshot_path) == ([], 0)
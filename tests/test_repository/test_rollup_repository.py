@@ -0,0 +1,141 @@
+from datetime import datetime
+
+import pytest
+
+from bookkeeper.models.expense import Expense
+from bookkeeper.repository.abstract_repository import Searchable, SupportsPutMany
+from bookkeeper.repository.conditions import Between, Ge, Lt
+from bookkeeper.repository.rollup_repository import (
+    RollupRepository, main, period_start
+)
+from bookkeeper.repository.sqlite_repository import SQLiteRepository
+
+
+def expense(amount, date, category='food'):
+    return Expense(amount, category, expense_date=date, added_date=date)
+
+
+EXPENSES = [
+    expense(10.0, datetime(2020, 1, 5, 10)),
+    expense(20.0, datetime(2020, 1, 5, 18)),
+    expense(5.0, datetime(2020, 1, 6), 'books'),
+    expense(None, datetime(2020, 2, 1), 'books'),
+    expense(7.0, datetime(2021, 3, 1, 12)),
+    expense(1.0, datetime(2023, 6, 1)),
+    expense(2.0, datetime(2023, 6, 2), 'books'),
+]
+
+QUERIES = [
+    ('sum', 'amount', None, None),
+    ('count', 'pk', None, None),
+    ('count', 'amount', None, None),
+    ('avg', 'amount', None, None),
+    ('min', 'amount', None, None),
+    ('max', 'amount', {'category': 'food'}, None),
+    ('sum', 'amount', {'expense_date': Lt(datetime(2021, 1, 1))}, None),
+    ('sum', 'amount', {'expense_date': Between(datetime(2020, 1, 1),
+                                               datetime(2023, 6, 1))}, 'category'),
+    ('count', 'pk', {'category': 'books'}, 'category'),
+    ('min', 'expense_date', None, None),
+    ('sum', 'amount', {'amount': Ge(7.0)}, None),
+    ('max', 'pk', None, 'category'),
+]
+
+
+@pytest.fixture
+def repos(tmp_path):
+    live = SQLiteRepository(Expense, str(tmp_path / 'live.sqlite'))
+    reference = SQLiteRepository(Expense, str(tmp_path / 'reference.sqlite'))
+    live.add_many(expense(e.amount, e.expense_date, e.category) for e in EXPENSES)
+    reference.add_many(expense(e.amount, e.expense_date, e.category) for e in EXPENSES)
+    with RollupRepository(live, str(tmp_path / 'archive.sqlite')) as rollup:
+        yield rollup, reference
+    live.close()
+    reference.close()
+
+
+def test_period_start():
+    date = datetime(2020, 5, 17, 13, 45)
+    assert period_start(date, 'day') == datetime(2020, 5, 17)
+    assert period_start(date, 'month') == datetime(2020, 5, 1)
+    with pytest.raises(ValueError):
+        period_start(date, 'week')
+
+
+@pytest.mark.parametrize('granularity', ['day', 'month'])
+def test_compact_moves_rows(repos, granularity):
+    rollup, _ = repos
+    assert rollup.compact(datetime(2022, 1, 1), granularity) == 5
+    assert [obj.pk for obj in rollup.get_all()] == [6, 7]
+    assert [obj.pk for obj in rollup.archive.get_all()] == [1, 2, 3, 4, 5]
+    assert rollup.get(1).amount == 10.0
+    summaries = rollup.summaries.get_all({'category': 'food'})
+    if granularity == 'day':
+        assert [(s.period, s.amount, s.rows) for s in summaries] == \
+            [(datetime(2020, 1, 5), 30.0, 2), (datetime(2021, 3, 1), 7.0, 1)]
+    else:
+        assert [(s.period, s.amount, s.rows) for s in summaries] == \
+            [(datetime(2020, 1, 1), 30.0, 2), (datetime(2021, 3, 1), 7.0, 1)]
+
+
+@pytest.mark.parametrize('func, field, where, group_by', QUERIES)
+def test_aggregate_matches_uncompacted(repos, func, field, where, group_by):
+    rollup, reference = repos
+    rollup.compact(datetime(2021, 6, 1))
+    rollup.add(expense(3.0, datetime(2020, 1, 5)))
+    rollup.compact(datetime(2021, 6, 1))
+    reference.add(expense(3.0, datetime(2020, 1, 5)))
+    assert rollup.aggregate(func, field, where, group_by) == \
+        reference.aggregate(func, field, where, group_by)
+
+
+def test_highest_pk_is_kept(repos):
+    rollup, _ = repos
+    assert rollup.compact(datetime(2030, 1, 1)) == 6
+    assert [obj.pk for obj in rollup.get_all()] == [7]
+    assert rollup.add(expense(1.0, datetime(2024, 1, 1))) == 8
+    assert rollup.aggregate('count') == 8
+
+
+def test_compact_failure_rolls_back(repos):
+    rollup, _ = repos
+    rollup.archive.put_many([Expense(1.0, 'food', pk=3)])
+    with pytest.raises(Exception):
+        rollup.compact(datetime(2022, 1, 1))
+    assert len(rollup.get_all()) == 7
+    assert rollup.summaries.get_all() == []
+    assert rollup.compact(datetime(2020, 1, 6)) == 2
+
+
+def test_optional_capabilities(repos, tmp_path):
+    rollup, _ = repos
+    assert isinstance(rollup, SupportsPutMany)
+    assert not isinstance(rollup, Searchable)
+    with SQLiteRepository(Expense, str(tmp_path / 'text.sqlite'),
+                          text_fields=['comment']) as live, \
+            RollupRepository(live, str(tmp_path / 'text_archive.sqlite')) as indexed:
+        pk = indexed.add(Expense(1.0, 'food', comment='coffee'))
+        assert indexed.search('coffee') == [pk]
+
+
+def test_unknown_aggregate(repos):
+    rollup, _ = repos
+    with pytest.raises(ValueError):
+        rollup.aggregate('median', 'amount')
+    with pytest.raises(ValueError):
+        rollup.aggregate('sum', 'unknown')
+
+
+def test_cli(tmp_path, capsys):
+    db_file, archive_file = str(tmp_path / 'db.sqlite'), str(tmp_path / 'archive.sqlite')
+    with SQLiteRepository(Expense, db_file) as repo:
+        repo.add_many(expense(e.amount, e.expense_date, e.category) for e in EXPENSES)
+    assert main(['--cutoff', '2022-01-01', '--granularity', 'month',
+                 '--db', db_file, '--archive', archive_file]) == 0
+    assert 'moved 5 expenses' in capsys.readouterr().err
+    with SQLiteRepository(Expense, db_file) as repo:
+        assert [obj.pk for obj in repo.get_all()] == [6, 7]
+    with SQLiteRepository(Expense, archive_file) as archive:
+        assert len(archive.get_all()) == 5
+    with pytest.raises(SystemExit):
+        main(['--cutoff', 'yesterday'])
@@ -0,0 +1,173 @@
+import os
+import sqlite3
+from datetime import datetime
+
+import pytest
+
+from bookkeeper.models.expense import Expense
+from bookkeeper.repository import sharded_repository
+from bookkeeper.repository.conditions import Between, Ge, Lt
+from bookkeeper.repository.sharded_repository import ShardedRepository, year_range
+
+
+def expense(amount, year, month=6, category='food'):
+    date = datetime(year, month, 1)
+    return Expense(amount, category, expense_date=date, added_date=date)
+
+
+@pytest.fixture
+def repo(tmp_path):
+    with ShardedRepository(Expense, str(tmp_path / 'shards')) as r:
+        yield r
+
+
+@pytest.fixture
+def filled(repo):
+    repo.add_many(expense(float(year - 2000), year, category=f'cat{year % 2}')
+                  for year in range(2010, 2024))
+    return repo
+
+
+def test_year_range():
+    assert year_range(datetime(2020, 5, 1)) == (2020, 2020)
+    assert year_range(Between(datetime(2019, 1, 1), datetime(2021, 1, 1))) == (2019, 2021)
+    assert year_range(Ge(datetime(2019, 1, 1))) == (2019, None)
+    assert year_range(Lt(datetime(2019, 1, 1))) == (None, 2019)
+
+
+def test_crud(repo):
+    obj = expense(100.0, 2022)
+    pk = repo.add(obj)
+    assert obj.pk == pk == 1
+    assert repo.get(pk) == obj
+    assert os.path.exists(repo.shard_path(2022))
+    obj.amount = 50.0
+    repo.update(obj)
+    assert repo.get(pk).amount == 50.0
+    repo.delete(pk)
+    assert repo.get(pk) is None
+    with pytest.raises(KeyError):
+        repo.delete(pk)
+    with pytest.raises(ValueError):
+        repo.add(obj)
+
+
+def test_pks_span_shards(filled):
+    assert filled.years == list(range(2010, 2024))
+    assert [obj.pk for obj in filled.get_all()] == list(range(1, 15))
+    assert filled.add(expense(1.0, 2011)) == 15
+
+
+def test_update_moves_between_shards(filled):
+    obj = filled.get(1)
+    obj.expense_date = datetime(2023, 2, 1)
+    filled.update(obj)
+    assert filled.get_all({'expense_date': Lt(datetime(2011, 1, 1))}) == []
+    assert filled.get(1).expense_date == datetime(2023, 2, 1)
+    assert sorted(o.pk for o in filled.get_all(
+        {'expense_date': Ge(datetime(2023, 1, 1))})) == [1, 14]
+
+
+def test_range_query_attaches_overlapping_shards(filled, monkeypatch):
+    attached = []
+    attach = filled._attach
+    monkeypatch.setattr(
+        filled, '_attach',
+        lambda con, years: attached.append(list(years)) or attach(con, years))
+    where = {'expense_date': Between(datetime(2015, 1, 1), datetime(2016, 12, 31))}
+    assert [obj.amount for obj in filled.get_all(where)] == [15.0, 16.0]
+    assert attached == [[2015, 2016]]
+
+
+def test_attach_limit(filled):
+    # 14 шардов читаются двумя запросами, подключенных - не больше MAX_ATTACHED
+    assert len(filled.get_all()) == 14
+    con = filled.catalog.connection()
+    databases = con.execute('PRAGMA database_list').fetchall()
+    assert len(databases) <= sharded_repository.MAX_ATTACHED + 2
+
+
+def test_get_all_fields(filled):
+    rows = filled.get_all({'category': 'cat1', 'expense_date': Ge(datetime(2020, 1, 1))},
+                          fields=['pk', 'expense_date'])
+    assert rows == [(12, datetime(2021, 6, 1)), (14, datetime(2023, 6, 1))]
+    assert rows[0].expense_date == datetime(2021, 6, 1)
+
+
+def test_aggregate(filled):
+    assert filled.aggregate('sum', 'amount') == sum(range(10, 24))
+    assert filled.aggregate('count') == 14
+    assert filled.aggregate('avg', 'amount', {'expense_date': Lt(datetime(2012, 1, 1))}) \
+        == 10.5
+    assert filled.aggregate('max', 'expense_date') == datetime(2023, 6, 1)
+    assert filled.aggregate('sum', 'amount', group_by='category') == \
+        {'cat0': sum(range(10, 24, 2)), 'cat1': sum(range(11, 24, 2))}
+    assert filled.aggregate('sum', 'amount', {'expense_date': datetime(1999, 1, 1)}) \
+        is None
+    with pytest.raises(ValueError):
+        filled.aggregate('median', 'amount')
+
+
+def test_freeze(filled, tmp_path):
+    filled.freeze(2010)
+    assert filled.get(1).amount == 10.0
+    obj = filled.get(1)
+    with pytest.raises(ValueError):
+        filled.update(obj)
+    with pytest.raises(ValueError):
+        filled.add(expense(1.0, 2010))
+    filled.close()
+    with ShardedRepository(Expense, str(tmp_path / 'shards')) as reopened:
+        assert len(reopened.get_all({'expense_date': Lt(datetime(2011, 1, 1))})) == 1
+        with pytest.raises(ValueError):
+            reopened.delete(1)
+
+
+def fail_on(repo, year, event):
+    repo._shard(year)
+    with sqlite3.connect(repo.shard_path(year)) as con:
+        con.execute(f'CREATE TRIGGER fail_{event.lower()} BEFORE {event} ON expense '
+                    "BEGIN SELECT RAISE(ABORT, 'disk full'); END")
+
+
+def heal(repo, year, event):
+    with sqlite3.connect(repo.shard_path(year)) as con:
+        con.execute(f'DROP TRIGGER fail_{event.lower()}')
+
+
+def test_failed_write_is_atomic_across_shards(repo):
+    repo.add(expense(1.0, 2020))
+    fail_on(repo, 2021, 'INSERT')
+    batch = [expense(2.0, 2020), expense(3.0, 2021), expense(4.0, 2019)]
+    with pytest.raises(sqlite3.DatabaseError):
+        repo.add_many(batch)
+    assert [obj.pk for obj in batch] == [0, 0, 0]
+    assert [obj.amount for obj in repo.get_all()] == [1.0]
+    heal(repo, 2021, 'INSERT')
+    assert repo.add_many(batch) == [2, 3, 4]
+    assert sorted(obj.pk for obj in repo.get_all()) == [1, 2, 3, 4]
+
+
+def test_failed_move_keeps_single_copy(repo):
+    obj = expense(1.0, 2020)
+    repo.add(obj)
+    fail_on(repo, 2020, 'DELETE')
+    obj.expense_date = datetime(2021, 1, 1)
+    with pytest.raises(sqlite3.DatabaseError):
+        repo.update(obj)
+    assert [o.expense_date.year for o in repo.get_all()] == [2020]
+    heal(repo, 2020, 'DELETE')
+    repo.update(obj)
+    assert [o.expense_date.year for o in repo.get_all()] == [2021]
+    fail_on(repo, 2021, 'DELETE')
+    with pytest.raises(sqlite3.DatabaseError):
+        repo.delete(obj.pk)
+    assert repo.get(obj.pk) == obj
+
+
+def test_write_over_attach_limit(repo):
+    pks = repo.add_many(expense(1.0, year) for year in range(2000, 2025))
+    assert pks == list(range(1, 26))
+    assert len(repo.get_all()) == 25
+    repo.delete_many(pks)
+    assert repo.get_all() == []
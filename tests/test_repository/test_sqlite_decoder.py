@@ -0,0 +1,40 @@
+from dataclasses import dataclass
+from datetime import datetime
+
+from bookkeeper.repository.abstract_repository import row_type
+from bookkeeper.repository.sqlite_decoder import (
+    compile_projection_decoder, compile_row_decoder
+)
+
+
+@dataclass
+class Row:
+    amount: float
+    date: datetime
+    parent: int | None = None
+    comment: str = ''
+    pk: int = 0
+
+
+def test_decode_row():
+    decode = compile_row_decoder(
+        Row, {'amount': float, 'date': datetime, 'parent': int | None, 'comment': str})
+    obj = decode(None, (3, 10, '2023-01-09 15:09:00', None, 'text'))
+    assert obj == Row(10.0, datetime(2023, 1, 9, 15, 9), None, 'text', pk=3)
+    assert isinstance(obj.amount, float)
+
+
+def test_decode_keeps_null_and_native_values():
+    decode = compile_row_decoder(Row, {'amount': float, 'date': datetime,
+                                       'parent': int | None, 'comment': str})
+    date = datetime(2023, 1, 9)
+    assert decode(None, (1, None, date, 2, '')) == Row(None, date, 2, '', pk=1)
+
+
+def test_decode_projection():
+    row_cls = row_type(('amount', 'pk'))
+    decode = compile_projection_decoder(row_cls, {'amount': float, 'pk': int})
+    row = decode(None, (10, 3))
+    assert row == (10.0, 3)
+    assert isinstance(row.amount, float)
+    assert type(row) is row_cls
@@ -0,0 +1,74 @@
+import logging
+from dataclasses import dataclass
+
+import pytest
+
+from bookkeeper.repository.sqlite_profiler import QueryProfiler, percentile
+from bookkeeper.repository.sqlite_repository import SQLiteRepository
+
+
+@dataclass
+class Custom:
+    name: str
+    value: int = 0
+    pk: int = 0
+
+
+@pytest.fixture
+def profiler():
+    return QueryProfiler(slow_threshold=10)
+
+
+@pytest.fixture
+def repo(tmp_path, profiler):
+    with SQLiteRepository(Custom, str(tmp_path / 'test.sqlite.db'), indexes=[('name',)],
+                          profiler=profiler) as r:
+        yield r
+
+
+def test_percentile():
+    assert percentile([], 0.5) == 0.0
+    assert percentile([3.0, 1.0, 2.0], 0.5) == 2.0
+    assert percentile([float(i) for i in range(1, 101)], 0.95) == 95.0
+
+
+def test_statistics_per_statement(repo, profiler):
+    repo.add_many(Custom(str(i), i) for i in range(10))
+    for _ in range(3):
+        repo.get_all({'name': '1'})
+    query, _ = repo.queries.select({'name': '1'})
+    stats = profiler.stats(query)
+    assert stats.count == 3
+    assert stats.total >= stats.p95 >= stats.p50 > 0
+    report = profiler.report()
+    assert report[query]['count'] == 3
+    assert report[repo.queries.insert(with_pk=True)]['count'] == 1
+
+
+def test_query_plan(repo, profiler):
+    repo.get_all({'name': 'a'})
+    repo.get_all({'value': 1})
+    indexed = profiler.stats(repo.queries.select({'name': 'a'})[0])
+    scan = profiler.stats(repo.queries.select({'value': 1})[0])
+    assert any('INDEX' in step for step in indexed.plan)
+    assert not indexed.full_scan
+    assert scan.full_scan
+
+
+def test_raw_subquery_is_profiled(repo, profiler):
+    repo.get_all(subquery='WHERE value > 1')
+    assert any('value > 1' in query for query in profiler.report())
+
+
+def test_slow_query_log(repo, profiler, caplog):
+    profiler.slow_threshold = 0
+    with caplog.at_level(logging.WARNING, logger='bookkeeper.repository.sqlite_profiler'):
+        repo.get(1)
+    assert 'slow query' in caplog.text
+    assert repo.queries.select_by_pk() in caplog.text
+
+
+def test_reset(repo, profiler):
+    repo.get(1)
+    profiler.reset()
+    assert profiler.report() == {}
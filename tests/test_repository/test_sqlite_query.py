@@ -0,0 +1,62 @@
+import pytest
+
+from bookkeeper.repository.sqlite_query import QueryBuilder
+
+
+@pytest.fixture
+def builder():
+    return QueryBuilder('custom', ['name', 'value'])
+
+
+def test_select_is_parameterized(builder):
+    query, params = builder.select({'name': "it's", 'value': None})
+    assert query == \
+        'SELECT pk, name, value FROM custom WHERE name = ? AND value IS NULL'
+    assert params == ["it's"]
+
+
+def test_select_without_condition(builder):
+    assert builder.select() == ('SELECT pk, name, value FROM custom', [])
+
+
+def test_statement_text_is_cached(builder):
+    first, _ = builder.select({'name': 'a'})
+    second, _ = QueryBuilder('custom', ['name', 'value']).select({'name': 'b'})
+    assert first is second
+    assert builder.update() is builder.update()
+
+
+def test_write_statements(builder):
+    assert builder.insert() == 'INSERT INTO custom (name, value) VALUES (?, ?)'
+    assert builder.insert(with_pk=True) == \
+        'INSERT INTO custom (pk, name, value) VALUES (?, ?, ?)'
+    assert builder.upsert() == \
+        'INSERT INTO custom (pk, name, value) VALUES (?, ?, ?) ' \
+        'ON CONFLICT (pk) DO UPDATE SET name = excluded.name, value = excluded.value'
+    assert builder.search() == \
+        'SELECT rowid FROM custom_fts WHERE custom_fts MATCH ? ORDER BY rank LIMIT ?'
+    assert builder.update() == 'UPDATE custom SET name = ?, value = ? WHERE pk = ?'
+    assert builder.delete() == 'DELETE FROM custom WHERE pk = ?'
+
+
+def test_unknown_field(builder):
+    with pytest.raises(ValueError):
+        builder.select({'name; DROP TABLE custom': 1})
+
+
+def test_select_fields(builder):
+    assert builder.select({'value': 1}, ['name']) == \
+        ('SELECT name FROM custom WHERE value = ?', [1])
+    with pytest.raises(ValueError):
+        builder.select(fields=['name', 'missing'])
+
+
+def test_aggregate(builder):
+    assert builder.aggregate('sum', 'value', {'name': 'a'}) == \
+        ('SELECT SUM(value) FROM custom WHERE name = ?', ['a'])
+    assert builder.aggregate('count', 'pk', group_by='name') == \
+        ('SELECT name, COUNT(pk) FROM custom GROUP BY name', [])
+    with pytest.raises(ValueError):
+        builder.aggregate('sum', 'value; DROP TABLE custom')
+    with pytest.raises(ValueError):
+        builder.aggregate('median', 'value')
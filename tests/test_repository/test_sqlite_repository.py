@@ -0,0 +1,318 @@
+import sqlite3
+import threading
+from dataclasses import dataclass
+from datetime import datetime
+
+import pytest
+
+from bookkeeper.repository.abstract_repository import unit_of_work
+from bookkeeper.repository.conditions import Between, Ge
+from bookkeeper.repository.sqlite_repository import SQLiteRepository
+
+
+@dataclass
+class Custom:
+    name: str
+    value: int = 0
+    pk: int = 0
+
+
+@dataclass
+class Dated:
+    amount: float
+    date: datetime
+    pk: int = 0
+
+
+@pytest.fixture
+def db_file(tmp_path):
+    return str(tmp_path / 'test.sqlite.db')
+
+
+@pytest.fixture
+def repo(db_file):
+    with SQLiteRepository(Custom, db_file) as r:
+        yield r
+
+
+def test_crud(repo):
+    obj = Custom('first', 1)
+    pk = repo.add(obj)
+    assert obj.pk == pk
+    assert repo.get(pk) == obj
+    obj2 = Custom('second', 2, pk=pk)
+    repo.update(obj2)
+    assert repo.get(pk) == obj2
+    repo.delete(pk)
+    assert repo.get(pk) is None
+
+
+def test_cannot_add_with_pk(repo):
+    with pytest.raises(ValueError):
+        repo.add(Custom('name', pk=1))
+
+
+def test_cannot_update_without_pk(repo):
+    with pytest.raises(ValueError):
+        repo.update(Custom('name'))
+
+
+def test_get_all_with_condition(repo):
+    objects = [Custom(str(i), i % 2) for i in range(5)]
+    for o in objects:
+        repo.add(o)
+    assert repo.get_all() == objects
+    assert repo.get_all({'name': '0'}) == [objects[0]]
+    assert repo.get_all({'value': 1}) == [objects[1], objects[3]]
+
+
+def test_factory_shares_connection(db_file):
+    @dataclass
+    class Other:
+        title: str
+        pk: int = 0
+
+    repos = SQLiteRepository.repository_factory([Custom, Other], db_file)
+    assert repos[Custom].pool is repos[Other].pool
+    assert repos[Custom].pool.connection() is repos[Other].pool.connection()
+    for r in repos.values():
+        r.close()
+
+
+def test_pool_closed_with_last_repository(db_file):
+    first = SQLiteRepository(Custom, db_file)
+    second = SQLiteRepository(Custom, db_file)
+    pool = first.pool
+    con = pool.connection()
+    first.close()
+    con.execute('SELECT 1')
+    second.close()
+    with pytest.raises(Exception):
+        con.execute('SELECT 1')
+    with pytest.raises(RuntimeError):
+        first.get(1)
+
+
+def test_add_many(repo):
+    repo.add(Custom('existing'))
+    objects = [Custom(str(i), i) for i in range(3)]
+    pks = repo.add_many(objects)
+    assert pks == [2, 3, 4]
+    assert [o.pk for o in objects] == pks
+    assert repo.get_all()[1:] == objects
+
+
+def test_add_many_is_atomic(repo):
+    objects = [Custom('a'), Custom('b', pk=3)]
+    with pytest.raises(ValueError):
+        repo.add_many(objects)
+    assert repo.get_all() == []
+    assert objects[0].pk == 0
+
+
+def test_update_and_delete_many(repo):
+    objects = [Custom(str(i), i) for i in range(3)]
+    repo.add_many(objects)
+    for o in objects:
+        o.value += 10
+    repo.update_many(objects)
+    assert repo.get_all() == objects
+    repo.delete_many([objects[0].pk, objects[2].pk])
+    assert repo.get_all() == [objects[1]]
+
+
+def test_put_many(repo):
+    pk = repo.add(Custom('a'))
+    repo.put_many([Custom('b', pk=pk), Custom('c', pk=5)])
+    assert [(o.pk, o.name) for o in repo.get_all()] == [(1, 'b'), (5, 'c')]
+    assert repo.add(Custom('d')) == 6
+    with pytest.raises(ValueError):
+        repo.put_many([Custom('e')])
+
+
+def test_get_all_fields(db_file):
+    with SQLiteRepository(Dated, db_file) as repo:
+        date = datetime(2023, 1, 9, 15, 9)
+        repo.add_many([Dated(1, date), Dated(2.5, date)])
+        rows = repo.get_all({'amount': Ge(2)}, fields=['pk', 'date', 'amount'])
+        assert rows == [(2, date, 2.5)]
+        assert (rows[0].pk, rows[0].date) == (2, date)
+        assert [row.amount for row in repo.get_all(fields=['amount'])] == [1.0, 2.5]
+        assert isinstance(repo.get_all(fields=['amount'])[0].amount, float)
+        with pytest.raises(ValueError):
+            repo.get_all(fields=['missing'])
+
+
+def test_aggregate(db_file):
+    with SQLiteRepository(Dated, db_file) as repo:
+        first, second = datetime(2023, 1, 9), datetime(2023, 1, 10)
+        repo.add_many([Dated(1, first), Dated(2.5, first), Dated(4, second)])
+        assert repo.aggregate('sum', 'amount') == 7.5
+        assert repo.aggregate('count') == 3
+        assert repo.aggregate('max', 'date') == second
+        assert repo.aggregate('sum', 'amount', group_by='date') == \
+            {first: 3.5, second: 4.0}
+        assert repo.aggregate('sum', 'amount', {'amount': Ge(10)}) is None
+        assert repo.aggregate('count', where={'amount': Ge(10)}) == 0
+
+
+def test_values_with_quotes(repo):
+    obj = Custom("it's \"quoted\"", 1)
+    repo.add(obj)
+    assert repo.get_all({'name': obj.name}) == [obj]
+    obj.name = "O'Brien"
+    repo.update(obj)
+    assert repo.get(obj.pk) == obj
+
+
+def test_typed_columns_and_indexes(db_file):
+    with SQLiteRepository(Custom, db_file, indexes=[('name', 'value')]) as r:
+        con = r.pool.connection()
+        info = con.execute('PRAGMA table_info(custom)').fetchall()
+        assert [(row[1], row[2]) for row in info] == \
+            [('pk', 'INTEGER'), ('name', 'TEXT'), ('value', 'INTEGER')]
+        plan = con.execute('EXPLAIN QUERY PLAN SELECT * FROM custom '
+                           'WHERE name = ? AND value > ?', ('a', 1)).fetchall()
+        assert 'idx_custom_name_value' in plan[0][-1]
+
+
+def test_migrate_untyped_table(db_file):
+    con = sqlite3.connect(db_file)
+    con.execute('CREATE TABLE custom (pk INTEGER PRIMARY KEY, name, value)')
+    con.execute("INSERT INTO custom VALUES (1, 'first', 'None'), (2, 'second', '5')")
+    con.commit()
+    con.close()
+    with SQLiteRepository(Custom, db_file) as r:
+        assert r.get_all() == [Custom('first', None, 1), Custom('second', 5, 2)]
+        version = r.pool.connection().execute(
+            "SELECT version FROM _schema_version WHERE table_name = 'custom'"
+        ).fetchone()[0]
+        assert version >= 1
+
+
+def test_iter_all_ordered_with_keyset(repo):
+    objects = [Custom(str(i), value) for i, value in enumerate([3, None, 1, 3, 2])]
+    repo.add_many(objects)
+    ordered = list(repo.iter_all(order_by='value', batch_size=2))
+    assert ordered == [objects[i] for i in (1, 2, 4, 0, 3)]
+    assert list(repo.iter_all(order_by='value', after=3, after_pk=objects[0].pk)) \
+        == [objects[3]]
+    assert list(repo.iter_all(order_by='value', after=None, after_pk=objects[1].pk)) \
+        == ordered[1:]
+    assert list(repo.iter_all(order_by='value', after=2, descending=True)) \
+        == [objects[2], objects[1]]
+    assert list(repo.iter_all(after_pk=3)) == objects[3:]
+    assert list(repo.iter_all({'value': 3}, descending=True)) == \
+        [objects[3], objects[0]]
+
+
+def test_wal_background_writer(db_file):
+    with SQLiteRepository(Custom, db_file, wal=True) as r:
+        con = r.pool.connection()
+        assert con.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+        futures = [r.add_nowait(Custom(str(i), i)) for i in range(5)]
+        assert [f.result() for f in futures] == [1, 2, 3, 4, 5]
+        many = r.add_many_nowait([Custom('x'), Custom('y')])
+        assert many.result() == [6, 7]
+        r.update(Custom('changed', 10, pk=1))
+        r.delete(2)
+        assert r.get(1) == Custom('changed', 10, pk=1)
+        assert r.get(2) is None
+        assert r.pool.writer is not None
+        thread_names = []
+        r.pool.submit(lambda _: thread_names.append(
+            threading.current_thread().name)).result()
+        assert thread_names == [r.pool.writer.thread.name]
+
+
+def test_wal_writer_reports_errors(db_file):
+    with SQLiteRepository(Custom, db_file, wal=True) as r:
+        def fail(con):
+            con.execute('INSERT INTO missing VALUES (1)')
+        future = r.pool.submit(fail)
+        with pytest.raises(sqlite3.OperationalError):
+            future.result()
+        assert r.add(Custom('after error')) == 1
+
+
+def test_unit_of_work_commits_once(db_file):
+    @dataclass
+    class Other:
+        title: str
+        pk: int = 0
+
+    repos = SQLiteRepository.repository_factory([Custom, Other], db_file)
+    first, second = repos[Custom], repos[Other]
+    commits = []
+    first.pool.connection().set_trace_callback(
+        lambda sql: commits.append(sql) if sql == 'COMMIT' else None)
+    with unit_of_work(first, second):
+        first.add(Custom('a'))
+        first.add_many([Custom('b'), Custom('c')])
+        second.add(Other('x'))
+        first.update(Custom('changed', pk=1))
+        assert sqlite3.connect(db_file).execute(
+            'SELECT COUNT(*) FROM custom').fetchone()[0] == 0
+    assert commits == ['COMMIT']
+    assert [c.name for c in first.get_all()] == ['changed', 'b', 'c']
+    for r in repos.values():
+        r.close()
+
+
+def test_unit_of_work_rolls_back(repo):
+    repo.add(Custom('kept'))
+    with pytest.raises(ZeroDivisionError):
+        with repo.transaction():
+            repo.add(Custom('lost'))
+            repo.delete(1)
+            1 / 0
+    assert repo.get_all() == [Custom('kept', pk=1)]
+
+
+def test_schema_changes_join_open_transaction(repo):
+    @dataclass
+    class Other:
+        title: str
+        pk: int = 0
+
+    with pytest.raises(ZeroDivisionError):
+        with repo.transaction():
+            repo.add(Custom('lost'))
+            SQLiteRepository(Other, repo.db_file).close()
+            1 / 0
+    assert repo.get_all() == []
+
+
+def test_dates_and_floats_are_decoded(db_file):
+    with SQLiteRepository(Dated, db_file) as r:
+        obj = Dated(10, datetime(2023, 1, 9, 15, 9))
+        r.add(obj)
+        [got] = r.get_all()
+        assert got == obj
+        assert isinstance(got.amount, float)
+        assert isinstance(got.date, datetime)
+
+
+def test_dates_stored_as_epoch_seconds(db_file):
+    with SQLiteRepository(Dated, db_file, indexes=[('date',)]) as r:
+        objects = [Dated(i, datetime(2023, 1, i + 1, 12)) for i in range(5)]
+        r.add_many(objects)
+        raw = r.pool.connection().execute(
+            'SELECT date + 0, typeof(date) FROM dated WHERE pk = 1').fetchone()
+        assert raw == (1672574400, 'integer')
+        assert r.get_all({'date': Between(datetime(2023, 1, 2), datetime(2023, 1, 4))}) \
+            == objects[1:3]
+        assert r.get_all({'date': Ge(datetime(2023, 1, 4, 12))}) == objects[3:]
+        query, params = r.queries.select({'date': Between(1, 2)})
+        plan = r.pool.connection().execute('EXPLAIN QUERY PLAN ' + query, params)
+        assert 'idx_dated_date' in plan.fetchone()[-1]
+
+
+def test_migrate_text_dates(db_file):
+    con = sqlite3.connect(db_file)
+    con.execute('CREATE TABLE dated (pk INTEGER PRIMARY KEY, amount, date)')
+    con.execute("INSERT INTO dated VALUES (1, 1.5, '2023-03-13 23:00:25.939531')")
+    con.commit()
+    con.close()
+    with SQLiteRepository(Dated, db_file) as r:
+        assert r.get_all() == [Dated(1.5, datetime(2023, 3, 13, 23, 0, 25), 1)]
@@ -0,0 +1,118 @@
+from datetime import datetime
+
+import pytest
+
+from bookkeeper.models.expense import Expense
+from bookkeeper.repository.abstract_repository import Searchable
+from bookkeeper.repository.memory_repository import MemoryRepository
+from bookkeeper.repository.metrics import MeteredRepository, MetricsRegistry
+from bookkeeper.repository.sqlite_repository import SQLiteRepository
+from bookkeeper.repository.text_search import TextIndex, match_query, tokenize
+
+DATE = datetime(2023, 1, 1)
+COMMENTS = [
+    'Кофе и круассан в кафе',
+    'coffee beans, coffee filter',
+    'Coffee',
+    'taxi to the airport',
+    'lunch with coffee after a long meeting at the office',
+    '',
+]
+FIELDS = ('comment', 'category')
+
+
+def expenses():
+    return [Expense(float(i), 'food' if i % 2 else 'transport', DATE, DATE, comment)
+            for i, comment in enumerate(COMMENTS)]
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def repo(request, tmp_path):
+    if request.param == 'memory':
+        r = MemoryRepository(text_fields=FIELDS)
+    else:
+        r = SQLiteRepository(Expense, str(tmp_path / 'db.sqlite'), text_fields=FIELDS)
+    r.add_many(expenses())
+    yield r
+    if request.param == 'sqlite':
+        r.close()
+
+
+def test_tokenize():
+    assert tokenize('Кофе, coffee_beans и 2 CAFÉ!') == \
+        ['кофе', 'coffee', 'beans', 'и', '2', 'café']
+    assert match_query('coffee AND "tea"') == '"coffee" "and" "tea"'
+    assert match_query('!!!') == ''
+
+
+@pytest.mark.parametrize('query, expected', [
+    ('coffee', [2, 3, 5]),
+    ('КОФЕ', [1]),
+    ('coffee office', [5]),
+    ('food coffee', [2]),
+    ('transport', [1, 3, 5]),
+    ('tea', []),
+    ('', []),
+    ('coffee"* OR', []),
+])
+def test_search(repo, query, expected):
+    assert sorted(repo.search(query)) == expected
+
+
+def test_ranking_matches_fts5(tmp_path):
+    memory = MemoryRepository(text_fields=FIELDS)
+    memory.add_many(expenses())
+    with SQLiteRepository(Expense, str(tmp_path / 'db.sqlite'),
+                          text_fields=FIELDS) as sqlite:
+        sqlite.add_many(expenses())
+        for query in ('coffee', 'transport', 'food'):
+            assert memory.search(query) == sqlite.search(query)
+        assert memory.search('coffee', limit=1) == sqlite.search('coffee', limit=1) == [2]
+
+
+def test_index_follows_changes(repo):
+    obj = repo.get(4)
+    obj.comment = 'coffee to go'
+    repo.update(obj)
+    assert 4 in repo.search('coffee')
+    assert repo.search('taxi') == []
+    repo.delete(3)
+    assert 3 not in repo.search('coffee')
+    repo.put_many([Expense(1.0, 'food', DATE, DATE, 'green tea', pk=2),
+                   Expense(1.0, 'food', DATE, DATE, 'tea', pk=10)])
+    assert sorted(repo.search('tea')) == [2, 10]
+    assert 2 not in repo.search('coffee')
+
+
+def test_search_requires_text_fields(tmp_path):
+    memory = MemoryRepository()
+    assert not isinstance(memory, Searchable)
+    with pytest.raises(AttributeError):
+        memory.search('coffee')
+    with SQLiteRepository(Expense, str(tmp_path / 'db.sqlite')) as repo:
+        assert not isinstance(repo, Searchable)
+        assert not isinstance(MeteredRepository(repo, MetricsRegistry()), Searchable)
+        with pytest.raises(AttributeError):
+            repo.search('coffee')
+    assert isinstance(MemoryRepository(text_fields=['comment']), Searchable)
+
+
+def test_index_built_for_existing_rows(tmp_path):
+    db_file = str(tmp_path / 'db.sqlite')
+    with SQLiteRepository(Expense, db_file) as repo:
+        repo.add_many(expenses())
+    with SQLiteRepository(Expense, db_file, text_fields=['comment']) as repo:
+        assert sorted(repo.search('coffee')) == [2, 3, 5]
+        assert repo.search('food') == []
+    with SQLiteRepository(Expense, db_file, text_fields=FIELDS) as repo:
+        assert sorted(repo.search('food coffee')) == [2]
+        repo.drop_table()
+
+
+def test_text_index_remove():
+    index = TextIndex(['comment'])
+    index.insert(1, Expense(1.0, 'food', comment='a b'))
+    index.insert(2, Expense(1.0, 'food', comment=None))
+    index.remove(1)
+    assert index.search('a') == []
+    assert index._postings == {}